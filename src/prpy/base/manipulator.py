@@ -34,10 +34,14 @@ from .. import bind, clone, planning
 
 class Manipulator(openravepy.Robot.Manipulator):
     def __init__(self):
-        pass
+        self.ik_cache = None
+        self.reachability_map = None
 
     def CloneBindings(self, parent):
-        pass
+        # Cached IK solutions and reachability maps do not depend on the
+        # scene, so clones share the parent's.
+        self.ik_cache = getattr(parent, 'ik_cache', None)
+        self.reachability_map = getattr(parent, 'reachability_map', None)
 
     def __dir__(self):
         robot = self.GetRobot()
@@ -84,6 +88,44 @@ class Manipulator(openravepy.Robot.Manipulator):
 
         raise AttributeError('{0:s} is missing method "{1:s}".'.format(repr(self), name))
 
+    def EnableIKCache(self, max_size=1024, position_resolution=1e-4,
+                      angle_resolution=1e-4):
+        """Enables caching of this manipulator's IK solutions.
+        Planners reuse the solutions of poses that are within the specified
+        resolution of a previous query and only re-check collisions against
+        the current scene. See \ref prpy.ik_cache.IKCache for details.
+        @param max_size maximum number of cached poses
+        @param position_resolution discretization of positions, in meters
+        @param angle_resolution discretization of orientations, in radians
+        @return the IK cache
+        """
+        from ..ik_cache import IKCache
+        self.ik_cache = IKCache(max_size=max_size,
+                                position_resolution=position_resolution,
+                                angle_resolution=angle_resolution)
+        return self.ik_cache
+
+    def DisableIKCache(self):
+        """Disables caching of this manipulator's IK solutions."""
+        self.ik_cache = None
+
+    def LoadReachabilityMap(self, path=None):
+        """Loads this manipulator's reachability map.
+        Planners that choose between many goal poses, like TSRPlanner, use
+        the map to try the most reachable poses first. Maps are
+        generated offline by running prpy.reachability as a
+        script. See \ref prpy.reachability.ReachabilityMap for details.
+        @param path directory of the map; defaults to the OpenRAVE database
+        @return the reachability map
+        """
+        from ..reachability import ReachabilityMap
+
+        if path is None:
+            path = ReachabilityMap.GetDefaultPath(self)
+
+        self.reachability_map = ReachabilityMap.Load(path)
+        return self.reachability_map
+
     def GetIndices(self):
         """Gets the DOF indicies associated with this manipulaor.
         @return list of DOF indices
@@ -115,6 +115,43 @@ class MobileBase(object):
         else:
             return path
 
+    def FindBasePoses(self, manipulator=None, goal_poses=None, tsrchains=None,
+                      num_tsr_samples=16, **kw_args):
+        """
+        Find base poses from which a manipulator can reach a set of goals.
+        Candidates are sampled from the inverse of the manipulator's
+        reachability map (see \ref Manipulator.LoadReachabilityMap), scored,
+        and collision checked. The goals are treated as a goal set: a base
+        pose is scored by the most reachable goal.
+        @param manipulator manipulator to use; defaults to the active one
+        @param goal_poses list of end-effector poses
+        @param tsrchains list of TSR chains to sample end-effector poses from
+        @param num_tsr_samples number of poses sampled from each TSR chain
+        @param **kw_args passed to InverseReachability.FindBasePoses
+        @return (N, 4, 4) array of robot poses and (N,) array of scores,
+                sorted by descending score
+        """
+        if manipulator is None:
+            manipulator = self.robot.GetActiveManipulator()
+
+        reachability_map = getattr(manipulator, 'reachability_map', None)
+        if reachability_map is None:
+            raise ValueError(
+                'Manipulator {:s} has no reachability map; call'
+                ' LoadReachabilityMap first.'.format(manipulator.GetName()))
+
+        target_poses = []
+        if goal_poses is not None:
+            target_poses.extend(goal_poses)
+        for tsrchain in tsrchains or []:
+            target_poses.extend(tsrchain.sample_batch(num_tsr_samples))
+
+        if not target_poses:
+            raise ValueError('Either goal_poses or tsrchains must be specified.')
+
+        return reachability_map.GetInverse().FindBasePoses(
+            self.robot, manipulator, numpy.array(target_poses), **kw_args)
+
     def DriveStraightUntilForce(self, direction, velocity=0.1, force_threshold=3.0,
                                 max_distance=None, timeout=None, left_arm=True, right_arm=True):
         """
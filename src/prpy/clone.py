@@ -135,19 +135,7 @@ class Clone(object):
 
     def Destroy(self):
         self.__class__.get_envs().pop()
-
-        # Manually Remove() all objects from the environment. This forces
-        # OpenRAVE to call functions registered to RegisterBodyCallback.
-        # Otherwise, these functions are only called when the environment is
-        # destructed. This is too late for prpy.bind to cleanup circular
-        # references.
-        # TODO: Make this the default behavior in OpenRAVE.
-        for body in self.clone_env.GetBodies():
-            import prpy.bind
-            prpy.bind.InstanceDeduplicator.cleanup_callback(body, flag=0)
-
-        openravepy.Environment.Destroy(self.clone_env)
-        self.clone_env.SetUserData(None)
+        _DestroyEnvironment(self.clone_env)
 
     @classmethod
     def get_env(cls):
@@ -165,6 +153,120 @@ class Clone(object):
         return cls.local.environments
 
 
+class ClonePool(object):
+    """
+    Fixed-size pool of environments that are cloned from one parent.
+
+    The environments are created on demand and kept until Close() is called,
+    so cloning into the same slot again re-uses its environment. This is
+    cheaper than creating and destroying an environment for each job.
+
+    Clone() locks the parent environment, so it must be called from the
+    thread that holds its lock, if any. Map() runs one job per environment,
+    each in its own thread.
+    """
+    def __init__(self, parent_env, size):
+        """
+        @param parent_env environment to clone
+        @param size number of cloned environments
+        """
+        if size < 1:
+            raise ValueError('The pool must contain at least one environment.')
+
+        self.parent_env = parent_env
+        self._envs = [ None ] * size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.Close()
+
+    def __len__(self):
+        return len(self._envs)
+
+    def __getitem__(self, index):
+        return self._envs[index]
+
+    def Clone(self, index):
+        """
+        Clone the parent environment into one slot of the pool.
+
+        @param index index of the slot
+        @return cloned environment
+        """
+        # Clone keeps the environment alive after the with-block because
+        # destroy_on_exit is False.
+        with Clone(self.parent_env, clone_env=self._envs[index],
+                   destroy_on_exit=False, lock=False) as clone_env:
+            pass
+
+        self._envs[index] = clone_env
+        return clone_env
+
+    def Map(self, fn, items):
+        """
+        Call fn(env, item) for each item in its own thread.
+
+        The i-th item is passed the i-th environment, which must already be
+        cloned. The threads are private to this call, so Map() can be called
+        from a task that is running on a shared executor.
+
+        @param fn function to call with an environment and an item
+        @param items list of at most len(self) items
+        @return list of the values returned by fn, in the order of items
+        @raises the first exception that was raised by fn, in item order
+        """
+        if len(items) > len(self._envs):
+            raise ValueError('There are more items than environments.')
+
+        results = [ None ] * len(items)
+        errors = [ None ] * len(items)
+
+        def run(index, item):
+            try:
+                results[index] = fn(self._envs[index], item)
+            except Exception as e:
+                errors[index] = e
+
+        threads = [ threading.Thread(target=run, args=(index, item))
+                    for index, item in enumerate(items) ]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for error in errors:
+            if error is not None:
+                raise error
+
+        return results
+
+    def Close(self):
+        """ Destroy the cloned environments. """
+        for env in self._envs:
+            if env is not None:
+                _DestroyEnvironment(env)
+
+        self._envs = [ None ] * len(self._envs)
+
+
+def _DestroyEnvironment(env):
+    # Manually Remove() all objects from the environment. This forces
+    # OpenRAVE to call functions registered to RegisterBodyCallback.
+    # Otherwise, these functions are only called when the environment is
+    # destructed. This is too late for prpy.bind to cleanup circular
+    # references.
+    # TODO: Make this the default behavior in OpenRAVE.
+    for body in env.GetBodies():
+        import prpy.bind
+        prpy.bind.InstanceDeduplicator.cleanup_callback(body, flag=0)
+
+    openravepy.Environment.Destroy(env)
+    env.SetUserData(None)
+
+
 def Cloned(*instances, **kwargs):
     """
     Retrieve corresponding OpenRAVE object instances(s) in another environment.
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2015, Carnegie Mellon University
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# - Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# - Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# - Neither the name of Carnegie Mellon University nor the names of its
+#   contributors may be used to endorse or promote products derived from this
+#   software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import numpy
+
+
+class DistanceField(object):
+    """
+    Distance from points to the nearest obstacle, stored on a voxel grid.
+
+    The field is computed once (e.g. with FromEnvironment) and then queried
+    for batches of points with nearest-voxel lookups. Points outside of the
+    grid are infinitely far from obstacles.
+    """
+    def __init__(self, distances, lower_bound, resolution):
+        """
+        @param distances (nx, ny, nz) array of distances, in meters
+        @param lower_bound position of the corner of the grid
+        @param resolution size of each voxel, in meters
+        """
+        self.distances = numpy.asarray(distances, dtype=float)
+        self.lower_bound = numpy.array(lower_bound, dtype=float)
+        self.resolution = float(resolution)
+
+    @classmethod
+    def FromEnvironment(cls, env, lower_bound, upper_bound, resolution=0.02,
+                        ignore_bodies=None):
+        """
+        Compute a distance field from the bounding boxes of the links in an
+        environment. This requires scipy.
+        @param env OpenRAVE environment
+        @param lower_bound lower corner of the grid
+        @param upper_bound upper corner of the grid
+        @param resolution size of each voxel, in meters
+        @param ignore_bodies bodies that are not obstacles, e.g. the robot
+        @return DistanceField
+        """
+        from scipy.ndimage import distance_transform_edt
+
+        lower_bound = numpy.array(lower_bound, dtype=float)
+        upper_bound = numpy.array(upper_bound, dtype=float)
+        shape = numpy.ceil((upper_bound - lower_bound) / resolution).astype(int)
+        occupied = numpy.zeros(shape, dtype=bool)
+        ignore_names = set(body.GetName() for body in ignore_bodies or [])
+
+        with env:
+            for body in env.GetBodies():
+                if body.GetName() in ignore_names or not body.IsEnabled():
+                    continue
+
+                for link in body.GetLinks():
+                    if not link.IsEnabled() or not link.GetGeometries():
+                        continue
+
+                    aabb = link.ComputeAABB()
+                    lower = numpy.floor((aabb.pos() - aabb.extents()
+                                         - lower_bound) / resolution)
+                    upper = numpy.ceil((aabb.pos() + aabb.extents()
+                                        - lower_bound) / resolution)
+                    lower = numpy.clip(lower, 0, shape).astype(int)
+                    upper = numpy.clip(upper, 0, shape).astype(int)
+                    occupied[lower[0]:upper[0], lower[1]:upper[1],
+                             lower[2]:upper[2]] = True
+
+        distances = distance_transform_edt(~occupied) * resolution
+        return cls(distances, lower_bound, resolution)
+
+    def GetDistances(self, points):
+        """
+        Look up the distance from a batch of points to the nearest obstacle.
+        @param points (N, 3) array of points
+        @return (N,) array of distances
+        """
+        points = numpy.asarray(points, dtype=float).reshape((-1, 3))
+        cells = numpy.floor(
+            (points - self.lower_bound) / self.resolution).astype(int)
+        is_inside = numpy.all((cells >= 0) & (cells < self.distances.shape),
+                              axis=1)
+
+        distances = numpy.empty(points.shape[0])
+        distances[~is_inside] = numpy.inf
+        distances[is_inside] = self.distances[tuple(cells[is_inside].T)]
+        return distances
@@ -44,3 +44,14 @@ class UnsupportedTypeDeserializationException(SerializationException):
 
         super(UnsupportedTypeDeserializationException, self).__init__(
             'Deserializing type "{:s}" is not supported.'.format(type_name))
+
+class UnsupportedVersionDeserializationException(SerializationException):
+    """
+    Deserialization failed due to an unknown file format version.
+    """
+    def __init__(self, version):
+        self.version = version
+
+        super(UnsupportedVersionDeserializationException, self).__init__(
+            'Deserializing format version {!r} is not supported.'.format(
+                version))
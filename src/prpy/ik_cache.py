@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2015, Carnegie Mellon University
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# - Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# - Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# - Neither the name of Carnegie Mellon University nor the names of its
+#   contributors may be used to endorse or promote products derived from this
+#   software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import collections
+import logging
+import numpy
+import openravepy
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Filter options that depend on the scene rather than on the IK query.
+COLLISION_FILTER_OPTIONS = (openravepy.IkFilterOptions.CheckEnvCollisions
+                            | openravepy.IkFilterOptions.IgnoreSelfCollisions)
+
+
+class IKCache(object):
+    """
+    LRU cache of IK solutions keyed by a discretized end-effector pose.
+
+    Poses are expressed in the frame of the manipulator's base link and
+    rounded to position_resolution (in meters) and angle_resolution (in
+    radians), so nearly identical queries share an entry. Each entry stores
+    all of the solutions returned before collision filtering. Collisions are
+    re-checked against the current scene on every query, so the cache can be
+    shared between cloned environments.
+
+    The cache is cleared when the manipulator's kinematics, tool transform, or
+    IK solver change. It should only be used with IK solvers, like IKFast,
+    whose solutions do not depend on the current configuration.
+
+    This class is thread-safe.
+    """
+    def __init__(self, max_size=1024, position_resolution=1e-4,
+                 angle_resolution=1e-4):
+        """
+        @param max_size maximum number of cached poses
+        @param position_resolution discretization of positions, in meters
+        @param angle_resolution discretization of orientations, in radians
+        """
+        self.max_size = max_size
+        self.position_resolution = position_resolution
+        self.angle_resolution = angle_resolution
+
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_evicted = 0
+
+        self._entries = collections.OrderedDict()
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def Clear(self):
+        """ Remove all cached solutions. """
+        with self._lock:
+            self._entries.clear()
+
+    def GetStats(self):
+        """
+        Get statistics about the cache.
+        @return dictionary of statistics
+        """
+        with self._lock:
+            num_queries = self.num_hits + self.num_misses
+            return {
+                'hits': self.num_hits,
+                'misses': self.num_misses,
+                'hit_rate': (float(self.num_hits) / num_queries
+                             if num_queries > 0 else 0.),
+                'evicted': self.num_evicted,
+                'num_entries': len(self._entries),
+                'max_size': self.max_size,
+            }
+
+    def FindIKSolutions(self, manipulator, pose, filter_options,
+            iktype=openravepy.IkParameterizationType.Transform6D):
+        """
+        Find the IK solutions for a pose, reusing cached solutions.
+
+        This is equivalent to calling manipulator.FindIKSolutions. Options
+        that the cache cannot emulate (e.g. IgnoreEndEffectorCollisions) are
+        passed directly to the IK solver.
+
+        @param manipulator manipulator to solve IK for
+        @param pose 4x4 end-effector pose
+        @param filter_options bitmask of IkFilterOptions
+        @param iktype type of IK parameterization
+        @return (N, dof) array of IK solutions
+        """
+        if filter_options & openravepy.IkFilterOptions.IgnoreEndEffectorCollisions:
+            return manipulator.FindIKSolutions(
+                openravepy.IkParameterization(pose, iktype), filter_options,
+                ikreturn=False, releasegil=True)
+
+        # Self-collisions depend on grabbed bodies and on DOFs outside of the
+        # arm, neither of which is part of the key. Solve without any
+        # collision filtering and leave it all to _FilterCollisions.
+        ik_filter_options = ((filter_options & ~COLLISION_FILTER_OPTIONS)
+                             | openravepy.IkFilterOptions.IgnoreSelfCollisions)
+        key = self._GetKey(manipulator, pose, iktype, ik_filter_options)
+        signature = self._GetSignature(manipulator)
+
+        with self._lock:
+            if signature != self._signature:
+                if self._entries:
+                    logger.debug('Clearing IK cache because the kinematics,'
+                                 ' tool transform, or IK solver changed.')
+                self._entries.clear()
+                self._signature = signature
+
+            ik_solutions = self._entries.pop(key, None)
+            if ik_solutions is not None:
+                self._entries[key] = ik_solutions
+                self.num_hits += 1
+
+        if ik_solutions is None:
+            ik_solutions = manipulator.FindIKSolutions(
+                openravepy.IkParameterization(pose, iktype),
+                ik_filter_options, ikreturn=False, releasegil=True)
+            ik_solutions = numpy.reshape(
+                ik_solutions, (-1, len(manipulator.GetArmIndices())))
+
+            with self._lock:
+                self.num_misses += 1
+
+                if signature == self._signature:
+                    self._entries[key] = ik_solutions
+                    while len(self._entries) > self.max_size:
+                        self._entries.popitem(last=False)
+                        self.num_evicted += 1
+
+        return self._FilterCollisions(manipulator, ik_solutions,
+                                      filter_options)
+
+    def FindIKSolution(self, manipulator, pose, filter_options,
+            iktype=openravepy.IkParameterizationType.Transform6D):
+        """
+        Find the IK solution closest to the current configuration.
+
+        This is equivalent to calling manipulator.FindIKSolution.
+
+        @param manipulator manipulator to solve IK for
+        @param pose 4x4 end-effector pose
+        @param filter_options bitmask of IkFilterOptions
+        @param iktype type of IK parameterization
+        @return IK solution or None if there is no solution
+        """
+        ik_solutions = self.FindIKSolutions(manipulator, pose,
+                                            filter_options, iktype)
+        if ik_solutions.shape[0] == 0:
+            return None
+
+        q_current = manipulator.GetRobot().GetDOFValues(
+            manipulator.GetArmIndices())
+        distances = numpy.sum((ik_solutions - q_current)**2, axis=1)
+        return ik_solutions[numpy.argmin(distances), :]
+
+    def _GetKey(self, manipulator, pose, iktype, filter_options):
+        from openravepy import quatFromRotationMatrix
+
+        base_pose = manipulator.GetBase().GetTransform()
+        relative_pose = numpy.dot(numpy.linalg.inv(base_pose), pose)
+
+        # Quaternions q and -q represent the same rotation. A rotation by
+        # angle theta changes the quaternion components by about theta / 2.
+        quat = quatFromRotationMatrix(relative_pose[0:3, 0:3])
+        if quat[numpy.argmax(numpy.abs(quat))] < 0:
+            quat = -quat
+
+        position_key = numpy.round(
+            relative_pose[0:3, 3] / self.position_resolution)
+        quat_key = numpy.round(quat / (0.5 * self.angle_resolution))
+
+        return (int(iktype), int(filter_options),
+                tuple(position_key.astype(int)), tuple(quat_key.astype(int)))
+
+    @staticmethod
+    def _GetSignature(manipulator):
+        ik_solver = manipulator.GetIkSolver()
+        ik_solver_id = ik_solver.GetXMLId() if ik_solver is not None else None
+        tool_transform = numpy.round(manipulator.GetLocalToolTransform(), 12)
+
+        return (manipulator.GetRobot().GetKinematicsGeometryHash(),
+                manipulator.GetName(), ik_solver_id,
+                tuple(tool_transform.ravel()))
+
+    @staticmethod
+    def _FilterCollisions(manipulator, ik_solutions, filter_options):
+        check_env = filter_options & openravepy.IkFilterOptions.CheckEnvCollisions
+        check_self = not (filter_options
+                          & openravepy.IkFilterOptions.IgnoreSelfCollisions)
+
+        if ik_solutions.shape[0] == 0 or not (check_env or check_self):
+            return ik_solutions
+
+        robot = manipulator.GetRobot()
+        env = robot.GetEnv()
+        arm_indices = manipulator.GetArmIndices()
+        is_valid = numpy.zeros(ik_solutions.shape[0], dtype=bool)
+
+        with robot.CreateRobotStateSaver():
+            for i, ik_solution in enumerate(ik_solutions):
+                robot.SetDOFValues(ik_solution, arm_indices)
+                is_valid[i] = not ((check_env and env.CheckCollision(robot))
+                                   or (check_self and robot.CheckSelfCollision()))
+
+        return ik_solutions[is_valid, :]
+
+
+def FindIKSolutions(manipulator, pose, filter_options,
+        iktype=openravepy.IkParameterizationType.Transform6D):
+    """
+    Find IK solutions using the manipulator's IK cache, if it has one.
+    @param manipulator manipulator to solve IK for
+    @param pose 4x4 end-effector pose
+    @param filter_options bitmask of IkFilterOptions
+    @param iktype type of IK parameterization
+    @return (N, dof) array of IK solutions
+    """
+    ik_cache = getattr(manipulator, 'ik_cache', None)
+    if ik_cache is not None:
+        return ik_cache.FindIKSolutions(manipulator, pose, filter_options,
+                                        iktype)
+
+    return manipulator.FindIKSolutions(
+        openravepy.IkParameterization(pose, iktype), filter_options,
+        ikreturn=False, releasegil=True)
+
+
+def FindIKSolution(manipulator, pose, filter_options,
+        iktype=openravepy.IkParameterizationType.Transform6D):
+    """
+    Find an IK solution using the manipulator's IK cache, if it has one.
+    @param manipulator manipulator to solve IK for
+    @param pose 4x4 end-effector pose
+    @param filter_options bitmask of IkFilterOptions
+    @param iktype type of IK parameterization
+    @return IK solution or None if there is no solution
+    """
+    ik_cache = getattr(manipulator, 'ik_cache', None)
+    if ik_cache is not None:
+        return ik_cache.FindIKSolution(manipulator, pose, filter_options,
+                                       iktype)
+
+    return manipulator.FindIKSolution(
+        openravepy.IkParameterization(pose, iktype), filter_options,
+        ikreturn=False, releasegil=True)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2015, Carnegie Mellon University
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# - Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# - Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# - Neither the name of Carnegie Mellon University nor the names of its
+#   contributors may be used to endorse or promote products derived from this
+#   software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import logging
+import multiprocessing
+import numpy
+import openravepy
+import threading
+import ik_cache
+from clone import ClonePool, Cloned
+
+logger = logging.getLogger(__name__)
+
+
+class ParallelIKSolver(object):
+    """
+    Solve IK for batches of poses in parallel.
+
+    The solver keeps num_workers clones of the manipulator's environment. Each
+    clone has its own copy of the manipulator's IK solver, so FindIKSolutions
+    calls (which release the GIL) run concurrently. Collision filtering is
+    done by each worker in its own clone.
+
+    The clones are synchronized with the parent environment before each
+    query: bodies are re-cloned if the set of bodies, their kinematics, or the
+    grabbed objects changed; otherwise only their poses, DOF values, and
+    enabled states are copied.
+    """
+    def __init__(self, manipulator, num_workers=None, executor=None,
+                 ik_solver_factory=None, tolerance=1e-5):
+        """
+        @param manipulator manipulator to solve IK for
+        @param num_workers number of cloned environments, defaults to the
+                           number of CPUs
+        @param executor executor used to run the workers; defaults to a
+                        pool of num_workers threads that is owned by this
+                        solver. It must not be an executor that FindIKSolutions
+                        is called from, or the workers may never run.
+        @param ik_solver_factory optional function that is called with the
+                                 cloned manipulator to load its IK solver; by
+                                 default, the solver is cloned with the
+                                 manipulator
+        @param tolerance joint-space tolerance used to deduplicate solutions
+        """
+        if num_workers is None:
+            num_workers = multiprocessing.cpu_count()
+        if num_workers < 1:
+            raise ValueError('There must be at least one worker.')
+
+        self.env = manipulator.GetRobot().GetEnv()
+        self.robot_name = manipulator.GetRobot().GetName()
+        self.manipulator_name = manipulator.GetName()
+        self.num_dof = len(manipulator.GetArmIndices())
+        self.num_workers = num_workers
+        self.executor = executor
+        self.ik_solver_factory = ik_solver_factory
+        self.tolerance = tolerance
+
+        self._clones = ClonePool(self.env, num_workers)
+        self._signatures = [ None ] * num_workers
+        self._thread_pool = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.Close()
+
+    def Close(self):
+        """ Destroy the cloned environments and the worker threads. """
+        with self._lock:
+            if self._thread_pool is not None:
+                self._thread_pool.shutdown(wait=True)
+                self._thread_pool = None
+
+            self._clones.Close()
+            self._signatures = [ None ] * self.num_workers
+
+    def Synchronize(self):
+        """
+        Update the cloned environments to match the parent environment.
+
+        This locks the parent environment, so it must be called from the
+        thread that holds its lock, if any.
+        """
+        with self._lock:
+            with self.env:
+                signature = self._GetSignature(self.env)
+
+                for index in xrange(self.num_workers):
+                    worker_env = self._clones[index]
+
+                    if worker_env is None or self._signatures[index] != signature:
+                        self._CloneWorker(index)
+                        self._signatures[index] = signature
+                    else:
+                        self._UpdateWorker(worker_env)
+
+    def FindIKSolutions(self, poses,
+                        filter_options=openravepy.IkFilterOptions.CheckEnvCollisions,
+                        iktype=openravepy.IkParameterizationType.Transform6D,
+                        synchronize=True):
+        """
+        Find the IK solutions for a batch of poses.
+
+        The poses are split into one contiguous batch per worker. The
+        solutions found by all of the workers are merged in pose order and
+        solutions that are within tolerance of an earlier one are removed.
+
+        @param poses list or (N, 4, 4) array of end-effector poses
+        @param filter_options IkFilterOptions passed to FindIKSolutions
+        @param iktype type of IK parameterization to use
+        @param synchronize synchronize the clones with the parent environment
+                           before solving; pass False if Synchronize was
+                           already called from the thread holding the lock
+        @return (M, dof) array of unique IK solutions
+        """
+        if synchronize:
+            self.Synchronize()
+        elif any(self._clones[index] is None
+                 for index in xrange(self.num_workers)):
+            raise ValueError('Synchronize must be called before solving IK'
+                             ' with synchronize=False.')
+
+        poses = list(poses)
+        num_batches = min(self.num_workers, len(poses))
+        boundaries = numpy.linspace(0, len(poses), num_batches + 1).astype(int)
+
+        def solve_batch(worker_env, batch_poses):
+            with worker_env:
+                robot = worker_env.GetRobot(self.robot_name)
+                manipulator = robot.GetManipulator(self.manipulator_name)
+
+                batch_solutions = []
+                for pose in batch_poses:
+                    ik_solutions = ik_cache.FindIKSolutions(
+                        manipulator, pose, filter_options, iktype)
+                    if len(ik_solutions) > 0:
+                        batch_solutions.append(ik_solutions)
+                return batch_solutions
+
+        executor = self.executor or self._GetThreadPool()
+
+        futures = []
+        for index in xrange(num_batches):
+            batch_poses = poses[boundaries[index]:boundaries[index + 1]]
+            futures.append(executor.submit(
+                solve_batch, self._clones[index], batch_poses))
+
+        solutions = []
+        for future in futures:
+            solutions.extend(future.result())
+
+        if not solutions:
+            return numpy.zeros((0, self.num_dof))
+
+        return self._Deduplicate(numpy.vstack(solutions))
+
+    def _GetThreadPool(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        with self._lock:
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(self.num_workers)
+            return self._thread_pool
+
+    def _Deduplicate(self, solutions):
+        if solutions.shape[0] == 0:
+            return solutions
+
+        # Sort the rows and keep the first of each run of equal keys. This
+        # avoids numpy.unique(axis=0), which requires numpy 1.13. lexsort is
+        # stable, so the first row of each run is the first occurrence.
+        keys = numpy.round(solutions / self.tolerance).astype(numpy.int64)
+        order = numpy.lexsort(keys.T[::-1])
+        sorted_keys = keys[order]
+        is_first = numpy.ones(len(order), dtype=bool)
+        is_first[1:] = numpy.any(sorted_keys[1:] != sorted_keys[:-1], axis=1)
+        return solutions[numpy.sort(order[is_first]), :]
+
+    def _CloneWorker(self, index):
+        cloned_env = self._clones.Clone(index)
+
+        with cloned_env:
+            manipulator = Cloned(
+                self.env.GetRobot(self.robot_name), into=cloned_env
+            ).GetManipulator(self.manipulator_name)
+
+            if self.ik_solver_factory is not None:
+                self.ik_solver_factory(manipulator)
+
+            if manipulator.GetIkSolver() is None:
+                raise ValueError(
+                    'Manipulator {:s} has no IK solver in the cloned'
+                    ' environment; pass an ik_solver_factory to load one.'
+                    .format(self.manipulator_name))
+
+        return cloned_env
+
+    @staticmethod
+    def _GetSignature(env):
+        signature = []
+        for body in env.GetBodies():
+            if body.IsRobot():
+                grabbed = tuple(sorted(b.GetName() for b in body.GetGrabbed()))
+            else:
+                grabbed = ()
+
+            signature.append(
+                (body.GetName(), body.GetKinematicsGeometryHash(), grabbed))
+        return sorted(signature)
+
+    def _UpdateWorker(self, worker_env):
+        with worker_env:
+            for body in self.env.GetBodies():
+                cloned_body = worker_env.GetKinBody(body.GetName())
+                cloned_body.SetTransform(body.GetTransform())
+                if body.GetDOF() > 0:
+                    cloned_body.SetDOFValues(body.GetDOFValues())
+                cloned_body.SetLinkEnableStates(body.GetLinkEnableStates())
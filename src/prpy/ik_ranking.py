@@ -76,3 +76,261 @@ class NominalConfiguration(object):
             L_2[L_inf > self.max_deviation] = numpy.inf
 
         return L_2
+
+
+def _GetArmIndices(robot):
+    return robot.GetActiveManipulator().GetArmIndices()
+
+
+def _ForEachSolution(robot, ik_solutions, function):
+    """
+    Evaluate a function of the robot at each IK solution of its active
+    manipulator. The robot's state is restored afterwards.
+    """
+    arm_indices = _GetArmIndices(robot)
+    values = []
+
+    with robot.GetEnv():
+        with robot.CreateRobotStateSaver():
+            for ik_solution in ik_solutions:
+                robot.SetDOFValues(ik_solution, arm_indices)
+                values.append(function())
+
+    return values
+
+
+class RankingPipeline(object):
+    def __init__(self, filters=None, criteria=None, tie_breakers=None,
+                 tie_tolerance=1e-6):
+        """
+        Score IK solutions by combining several rankers.
+
+        Filters are rankers that reject solutions by returning an infinite
+        cost; they are evaluated in order and each one only sees the
+        solutions that passed the previous ones, so cheap filters should
+        come first. The primary cost is the weighted sum of the criteria,
+        which are also evaluated in order on the remaining solutions; an
+        infinite cost from any criterion rejects the solution.
+
+        If tie_breakers are given, solutions whose primary costs are within
+        tie_tolerance are ordered by the tie breakers, in order. In that case
+        the returned scores are the ranks of the solutions, so they can only
+        be compared within a single call.
+
+        @param filters list of rankers that reject solutions
+        @param criteria list of (weight, ranker) pairs
+        @param tie_breakers list of rankers used to break ties
+        @param tie_tolerance tolerance of equal primary costs
+        """
+        self.filters = list(filters or [])
+        self.criteria = list(criteria or [])
+        self.tie_breakers = list(tie_breakers or [])
+        self.tie_tolerance = tie_tolerance
+
+    def __call__(self, robot, ik_solutions):
+        num_solutions = ik_solutions.shape[0]
+        scores = numpy.empty(num_solutions)
+        scores.fill(numpy.inf)
+
+        # Only evaluate each ranker on the solutions that are still valid.
+        valid_indices = numpy.arange(num_solutions)
+        for ranker in self.filters:
+            if valid_indices.shape[0] == 0:
+                return scores
+
+            costs = ranker(robot, ik_solutions[valid_indices, :])
+            valid_indices = valid_indices[~numpy.isposinf(costs)]
+
+        costs = numpy.zeros(valid_indices.shape[0])
+        for weight, ranker in self.criteria:
+            if valid_indices.shape[0] == 0:
+                return scores
+
+            criterion_costs = ranker(robot, ik_solutions[valid_indices, :])
+            is_valid = ~numpy.isposinf(criterion_costs)
+            valid_indices = valid_indices[is_valid]
+            costs = costs[is_valid] + weight * criterion_costs[is_valid]
+
+        if not self.tie_breakers or valid_indices.shape[0] == 0:
+            scores[valid_indices] = costs
+            return scores
+
+        # Group solutions whose sorted costs differ from their neighbor by at
+        # most tie_tolerance. Unlike rounding, this never separates two costs
+        # that are within the tolerance of each other.
+        cost_order = numpy.argsort(costs, kind='mergesort')
+        is_new_group = numpy.diff(costs[cost_order]) > self.tie_tolerance
+        groups = numpy.empty(costs.shape[0], dtype=int)
+        groups[cost_order] = numpy.concatenate(
+            ([ 0 ], numpy.cumsum(is_new_group)))
+
+        # numpy.lexsort sorts by the last key first.
+        keys = [ ranker(robot, ik_solutions[valid_indices, :])
+                 for ranker in reversed(self.tie_breakers) ]
+        keys.append(groups)
+        order = numpy.lexsort(keys)
+
+        scores[valid_indices[order]] = numpy.arange(order.shape[0])
+        return scores
+
+
+class JointLimitFilter(object):
+    def __init__(self, margin=0.):
+        """
+        Reject IK solutions that are within a margin of the joint limits.
+        @param margin minimum distance from the joint limits, in radians
+        """
+        self.margin = margin
+
+    def __call__(self, robot, ik_solutions):
+        with robot.GetEnv():
+            lower_limits, upper_limits = robot.GetDOFLimits(
+                _GetArmIndices(robot))
+
+        is_valid = numpy.all(
+            (ik_solutions >= lower_limits + self.margin)
+            & (ik_solutions <= upper_limits - self.margin), axis=1)
+        return numpy.where(is_valid, 0., numpy.inf)
+
+
+class ConfigurationDistance(object):
+    def __init__(self, q_reference=None, weights=None, max_deviation=None):
+        """
+        Score IK solutions by their distance from a reference configuration.
+        Differences on continuous joints wrap around, so a solution that is
+        2*PI away on a continuous joint has zero distance.
+        @param q_reference reference configuration of the active manipulator;
+                           defaults to its current configuration
+        @param weights optional per-joint weights
+        @param max_deviation reject solutions that deviate by more than this
+                             on any joint
+        """
+        self.q_reference = q_reference
+        self.weights = weights
+        self.max_deviation = max_deviation
+
+    def __call__(self, robot, ik_solutions):
+        arm_indices = _GetArmIndices(robot)
+
+        with robot.GetEnv():
+            q_reference = self.q_reference
+            if q_reference is None:
+                q_reference = robot.GetDOFValues(arm_indices)
+
+            is_circular = numpy.array([
+                robot.GetJointFromDOFIndex(dof_index).IsCircular(
+                    dof_index
+                    - robot.GetJointFromDOFIndex(dof_index).GetDOFIndex())
+                for dof_index in arm_indices ], dtype=bool)
+
+        differences = ik_solutions - q_reference
+        differences[:, is_circular] = numpy.mod(
+            differences[:, is_circular] + numpy.pi, 2. * numpy.pi) - numpy.pi
+
+        if self.weights is not None:
+            distances = numpy.sqrt(numpy.sum(
+                self.weights * differences**2, axis=1))
+        else:
+            distances = numpy.sqrt(numpy.sum(differences**2, axis=1))
+
+        if self.max_deviation is not None:
+            is_deviating = numpy.any(
+                numpy.abs(differences) > self.max_deviation, axis=1)
+            distances[is_deviating] = numpy.inf
+
+        return distances
+
+
+class Manipulability(object):
+    def __init__(self, min_manipulability=None):
+        """
+        Score IK solutions by Yoshikawa's manipulability measure, so that
+        solutions far from singularities have lower cost.
+        @param min_manipulability reject solutions with a lower measure
+        """
+        self.min_manipulability = min_manipulability
+
+    def __call__(self, robot, ik_solutions):
+        if ik_solutions.shape[0] == 0:
+            return numpy.zeros(0)
+
+        manipulator = robot.GetActiveManipulator()
+        jacobians = numpy.array(_ForEachSolution(
+            robot, ik_solutions, lambda: numpy.vstack((
+                manipulator.CalculateJacobian(),
+                manipulator.CalculateAngularVelocityJacobian()))))
+
+        # sqrt(det(J J^T)) for all of the solutions at once.
+        JJt = numpy.sum(jacobians[:, :, numpy.newaxis, :]
+                        * jacobians[:, numpy.newaxis, :, :], axis=3)
+        manipulability = numpy.sqrt(numpy.maximum(
+            numpy.linalg.det(JJt), 0.))
+
+        costs = -manipulability
+        if self.min_manipulability is not None:
+            costs[manipulability < self.min_manipulability] = numpy.inf
+        return costs
+
+
+class Clearance(object):
+    def __init__(self, distance_field, links=None, min_clearance=None,
+                 max_clearance=None):
+        """
+        Score IK solutions by the clearance of the robot's links from
+        obstacles, so that solutions with more clearance have lower cost.
+        Each link is bounded by the sphere around its bounding box and the
+        distance of the sphere to the nearest obstacle is looked up in a
+        precomputed distance field.
+        @param distance_field prpy.distance_field.DistanceField of the scene
+        @param links links to check; defaults to the links that are moved
+                     by the active manipulator
+        @param min_clearance reject solutions with less clearance
+        @param max_clearance clearance beyond which solutions are equally
+                             good; defaults to the largest distance in the
+                             distance field
+        """
+        self.distance_field = distance_field
+        self.links = links
+        self.min_clearance = min_clearance
+        self.max_clearance = max_clearance
+
+    def __call__(self, robot, ik_solutions):
+        if ik_solutions.shape[0] == 0:
+            return numpy.zeros(0)
+
+        links = self.links
+        if links is None:
+            manipulator = robot.GetActiveManipulator()
+            with robot.GetEnv():
+                joints = [ robot.GetJointFromDOFIndex(dof_index)
+                           for dof_index in manipulator.GetArmIndices() ]
+                links = [ link for link in robot.GetLinks()
+                          if link.GetGeometries() and any(
+                              robot.DoesAffect(joint.GetJointIndex(),
+                                               link.GetIndex())
+                              for joint in joints) ]
+
+        def get_spheres():
+            aabbs = [ link.ComputeAABB() for link in links ]
+            return [ (aabb.pos(), numpy.linalg.norm(aabb.extents()))
+                     for aabb in aabbs ]
+
+        spheres = _ForEachSolution(robot, ik_solutions, get_spheres)
+        centers = numpy.array([ [ center for center, _ in solution_spheres ]
+                                for solution_spheres in spheres ])
+        radii = numpy.array([ [ radius for _, radius in solution_spheres ]
+                              for solution_spheres in spheres ])
+
+        distances = self.distance_field.GetDistances(
+            centers.reshape((-1, 3))).reshape(radii.shape) - radii
+        clearance = distances.min(axis=1)
+
+        # Links outside of the distance field have infinite clearance.
+        max_clearance = self.max_clearance
+        if max_clearance is None:
+            max_clearance = self.distance_field.distances.max()
+
+        costs = -numpy.minimum(clearance, max_clearance)
+        if self.min_clearance is not None:
+            costs[clearance < self.min_clearance] = numpy.inf
+        return costs
@@ -49,11 +49,19 @@ import numpy
 #   TODO: rewrite the pose functions to match the OpenRAVE pose format ([qw,qx,qy,qz,tx,ty,tz]).
 
 def pose_normalize(pose):
+    # Float arrays are normalized in place; anything else is copied.
+    pose = numpy.asarray(pose, dtype=float)
+    if pose.ndim > 1:
+        return _pose_normalize_stack(pose)
     nm = numpy.linalg.norm(pose[3:7])
     pose[3:7] /= nm
+    return pose
 
 def R_to_quat(R):
 
+    R = numpy.asarray(R)
+    if R.ndim > 2:
+        return _R_to_quat_stack(R)
     q = numpy.zeros(4)
 
     t = 1 + R[0,0] + R[1,1] + R[2,2]
@@ -96,6 +104,9 @@ def R_to_quat(R):
 
 
 def R_from_quat(quat):
+   quat = numpy.asarray(quat)
+   if quat.ndim > 1:
+       return _R_from_quat_stack(quat)
    R = numpy.zeros((3,3))
    xx = quat[0] * quat[0]
    xy = quat[0] * quat[1]
@@ -119,12 +130,18 @@ def R_from_quat(quat):
 
 
 def pose_to_H(pose):
+   pose = numpy.asarray(pose)
+   if pose.ndim > 1:
+       return _pose_to_H_stack(pose)
    H = numpy.eye(4)
    H[0:3,0:3] = R_from_quat(pose[3:7])
    H[0:3,3] = pose[0:3]
    return H
 
 def pose_from_H(H):
+   H = numpy.asarray(H)
+   if H.ndim > 2:
+       return _pose_from_H_stack(H)
    pose = numpy.zeros(7)
    pose[0:3] = H[0:3,3]
    pose[3:7] = R_to_quat(H[0:3,0:3])
@@ -132,6 +149,9 @@ def pose_from_H(H):
 
 
 def quat_to_ypr(quat):
+   quat = numpy.asarray(quat)
+   if quat.ndim > 1:
+       return _quat_to_ypr_stack(quat)
    ypr = numpy.zeros(3)
    qx = quat[0]
    qy = quat[1]
@@ -154,6 +174,9 @@ def quat_to_ypr(quat):
 
 
 def quat_from_ypr(ypr):
+   ypr = numpy.asarray(ypr)
+   if ypr.ndim > 1:
+       return _quat_from_ypr_stack(ypr)
    quat = numpy.zeros(4)
    cy2 = numpy.cos(0.5*ypr[0])
    sy2 = numpy.sin(0.5*ypr[0])
@@ -169,6 +192,9 @@ def quat_from_ypr(ypr):
 
 
 def pose_from_xyzypr(xyzypr):
+   xyzypr = numpy.asarray(xyzypr)
+   if xyzypr.ndim > 1:
+       return _pose_from_xyzypr_stack(xyzypr)
    pose = numpy.zeros(7)
    cy2 = numpy.cos(0.5*xyzypr[3])
    sy2 = numpy.sin(0.5*xyzypr[3])
@@ -186,6 +212,9 @@ def pose_from_xyzypr(xyzypr):
    return pose
 
 def pose_to_xyzypr(pose):
+   pose = numpy.asarray(pose)
+   if pose.ndim > 1:
+       return _pose_to_xyzypr_stack(pose)
    xyzypr = numpy.zeros(6)
    xyzypr[0] = pose[0]
    xyzypr[1] = pose[1]
@@ -217,6 +246,8 @@ def H_from_op_diff(pos_from, pos_to_diff):
     Taken from libcds kin.c
     2011-08-01 cdellin
     '''
+    if numpy.ndim(pos_from) > 1 or numpy.ndim(pos_to_diff) > 1:
+        return _H_from_op_diff_stack(pos_from, pos_to_diff)
     H = numpy.eye(4)
     # Set d
     H[0,3] = pos_from[0]
@@ -257,6 +288,9 @@ def invert_H(H):
     '''
     Invert transform H
     '''
+    H = numpy.asarray(H)
+    if H.ndim > 2:
+        return _invert_H_stack(H)
     R = H[0:3,0:3]
     d = H[0:3,3]
     Hinv = numpy.eye(4)
@@ -270,6 +304,9 @@ def xyzt_to_H(xyzt):
     Convert [x,y,z,theta] to 4x4 transform H
     theta is rotation about z-axis
     '''
+    xyzt = numpy.asarray(xyzt)
+    if xyzt.ndim > 1:
+        return _xyzt_to_H_stack(xyzt)
     ypr = [xyzt[3],0.0,0.0]
     quat = quat_from_ypr(ypr)
     pose = [xyzt[0],xyzt[1],xyzt[2],quat[0],quat[1],quat[2],quat[3]]
@@ -280,12 +317,18 @@ def xyzypr_to_H(xyzypr):
     '''
     Convert [x,y,z,yaw,pitch,roll] to 4x4 transform H
     '''
+    xyzypr = numpy.asarray(xyzypr)
+    if xyzypr.ndim > 1:
+        return _xyzypr_to_H_stack(xyzypr)
     quat = quat_from_ypr(xyzypr[3:6])
     pose = [xyzypr[0],xyzypr[1],xyzypr[2],quat[0],quat[1],quat[2],quat[3]]
     H = pose_to_H(pose)
     return H
 
 def quat_to_axisangle(quat):
+   quat = numpy.asarray(quat)
+   if quat.ndim > 1:
+       return _quat_to_axisangle_stack(quat)
    a2 = numpy.arccos(quat[3]);
    angle = 2.0*a2;
    sina2inv = 1.0/numpy.sin(a2);
@@ -302,8 +345,271 @@ def transform_comparison(H1, H2):
     Compare two 4x4 transforms H1 and H2. 
     Return the differnce in position and rotation.
     '''
+    if numpy.ndim(H1) > 2 or numpy.ndim(H2) > 2:
+        return _transform_comparison_stack(H1, H2)
     T_difference = numpy.dot( invert_H(H1), H2 )
     quat_difference = R_to_quat(T_difference[0:3,0:3]) #[x,y,z,w]
     rotation_difference = numpy.abs(2.0* numpy.arccos(quat_difference[3])) # 2*acos(qw)
     position_difference = numpy.sqrt( numpy.dot( numpy.array(T_difference[0:3,3]), numpy.array(T_difference[0:3,3]) ) )
     return position_difference, rotation_difference
+
+
+# Vectorized implementations of the functions above. These are used when the
+# arguments are stacks of values with any number of leading dimensions (e.g.
+# an (n,4,4) array of transforms) and return results with the same leading
+# dimensions. Single values use the scalar code above, which is faster for
+# one value at a time.
+
+def _matmul(A, B):
+    '''
+    Multiply stacks of matrices, broadcasting over the leading dimensions.
+    '''
+    if hasattr(numpy, 'matmul'):
+        return numpy.matmul(A, B)
+    else:
+        # numpy.matmul was added in numpy 1.10.
+        return numpy.einsum('...ij,...jk->...ik', A, B)
+
+def _pose_normalize_stack(pose):
+    pose = numpy.asarray(pose, dtype=float)
+    nm = numpy.sqrt(numpy.sum(pose[...,3:7]**2, axis=-1))
+    pose[...,3:7] /= nm[...,numpy.newaxis]
+    return pose
+
+def _R_to_quat_stack(R):
+    R = numpy.asarray(R, dtype=float)
+    shape = R.shape[:-2]
+    R = R.reshape((-1,3,3))
+    q = numpy.zeros((R.shape[0],4))
+
+    t = 1 + R[:,0,0] + R[:,1,1] + R[:,2,2]
+    imax = numpy.where((R[:,0,0] > R[:,1,1]) & (R[:,0,0] > R[:,2,2]), 0,
+                       numpy.where(R[:,1,1] > R[:,2,2], 1, 2))
+
+    is_t = t > 0.000001
+    is_x = ~is_t & (imax == 0)
+    is_y = ~is_t & (imax == 1)
+    is_z = ~is_t & (imax == 2)
+
+    Ri = R[is_t]
+    r = numpy.sqrt(t[is_t])
+    s = 0.5 / r
+    q[is_t,0] = (Ri[:,2,1]-Ri[:,1,2])*s # x
+    q[is_t,1] = (Ri[:,0,2]-Ri[:,2,0])*s # y
+    q[is_t,2] = (Ri[:,1,0]-Ri[:,0,1])*s # z
+    q[is_t,3] = 0.5 * r # w
+
+    # Rxx largest
+    Ri = R[is_x]
+    r = numpy.sqrt(1 + Ri[:,0,0] - Ri[:,1,1] - Ri[:,2,2])
+    s = 0.5 / r
+    q[is_x,0] = 0.5 * r # x
+    q[is_x,1] = (Ri[:,0,1]+Ri[:,1,0])*s # y
+    q[is_x,2] = (Ri[:,0,2]+Ri[:,2,0])*s # z
+    q[is_x,3] = (Ri[:,2,1]-Ri[:,1,2])*s # w
+
+    # Ryy largest
+    Ri = R[is_y]
+    r = numpy.sqrt(1 - Ri[:,0,0] + Ri[:,1,1] - Ri[:,2,2])
+    s = 0.5 / r
+    q[is_y,0] = (Ri[:,1,0]+Ri[:,0,1])*s # x
+    q[is_y,1] = 0.5 * r # y
+    q[is_y,2] = (Ri[:,1,2]+Ri[:,2,1])*s # z
+    q[is_y,3] = (Ri[:,0,2]-Ri[:,2,0])*s # w
+
+    # Rzz largest
+    Ri = R[is_z]
+    r = numpy.sqrt(1 - Ri[:,0,0] - Ri[:,1,1] + Ri[:,2,2])
+    s = 0.5 / r
+    q[is_z,0] = (Ri[:,2,0]+Ri[:,0,2])*s # x
+    q[is_z,1] = (Ri[:,2,1]+Ri[:,1,2])*s # y
+    q[is_z,2] = 0.5 * r # z
+    q[is_z,3] = (Ri[:,1,0]-Ri[:,0,1])*s # w
+
+    return q.reshape(shape + (4,))
+
+def _R_from_quat_stack(quat):
+   quat = numpy.asarray(quat, dtype=float)
+   R = numpy.empty(quat.shape[:-1] + (3,3))
+   xx = quat[...,0] * quat[...,0]
+   xy = quat[...,0] * quat[...,1]
+   xz = quat[...,0] * quat[...,2]
+   xw = quat[...,0] * quat[...,3]
+   yy = quat[...,1] * quat[...,1]
+   yz = quat[...,1] * quat[...,2]
+   yw = quat[...,1] * quat[...,3]
+   zz = quat[...,2] * quat[...,2]
+   zw = quat[...,2] * quat[...,3]
+   R[...,0,0] = 1 - 2 * (yy + zz)
+   R[...,0,1] = 2 * (xy - zw)
+   R[...,0,2] = 2 * (xz + yw)
+   R[...,1,0] = 2 * (xy + zw)
+   R[...,1,1] = 1 - 2 * (xx + zz)
+   R[...,1,2] = 2 * (yz - xw)
+   R[...,2,0] = 2 * (xz - yw)
+   R[...,2,1] = 2 * (yz + xw)
+   R[...,2,2] = 1 - 2 * (xx + yy)
+   return R
+
+def _pose_to_H_stack(pose):
+   pose = numpy.asarray(pose, dtype=float)
+   H = numpy.zeros(pose.shape[:-1] + (4,4))
+   H[...,0:3,0:3] = R_from_quat(pose[...,3:7])
+   H[...,0:3,3] = pose[...,0:3]
+   H[...,3,3] = 1.0
+   return H
+
+def _pose_from_H_stack(H):
+   H = numpy.asarray(H, dtype=float)
+   pose = numpy.zeros(H.shape[:-2] + (7,))
+   pose[...,0:3] = H[...,0:3,3]
+   pose[...,3:7] = R_to_quat(H[...,0:3,0:3])
+   return pose
+
+def _quat_to_ypr_stack(quat):
+   quat = numpy.asarray(quat, dtype=float)
+   shape = quat.shape[:-1]
+   quat = quat.reshape((-1,4))
+   ypr = numpy.zeros((quat.shape[0],3))
+   qx = quat[:,0]
+   qy = quat[:,1]
+   qz = quat[:,2]
+   qw = quat[:,3]
+   sinp2 = qw*qy-qz*qx
+   # Near pitch = +/-pi/2, only yaw -/+ roll is defined; roll is set to zero.
+   is_up = sinp2 > 0.49999
+   is_down = sinp2 < -0.49999
+   ypr[:,0] = numpy.arctan2(2*(qw*qz+qx*qy), 1-2*(qy*qy+qz*qz))
+   ypr[:,1] = numpy.arcsin(numpy.clip(2*sinp2, -1.0, 1.0))
+   ypr[:,2] = numpy.arctan2(2*(qw*qx+qy*qz), 1-2*(qx*qx+qy*qy))
+   ypr[is_up,0] = -2.0*numpy.arctan2(qx[is_up],qw[is_up])
+   ypr[is_up,1] = 0.5*numpy.pi
+   ypr[is_up,2] = 0.0
+   ypr[is_down,0] = 2.0*numpy.arctan2(qx[is_down],qw[is_down])
+   ypr[is_down,1] = -0.5*numpy.pi
+   ypr[is_down,2] = 0.0
+   return ypr.reshape(shape + (3,))
+
+def _quat_from_ypr_stack(ypr):
+   ypr = numpy.asarray(ypr, dtype=float)
+   quat = numpy.zeros(ypr.shape[:-1] + (4,))
+   cy2 = numpy.cos(0.5*ypr[...,0])
+   sy2 = numpy.sin(0.5*ypr[...,0])
+   cp2 = numpy.cos(0.5*ypr[...,1])
+   sp2 = numpy.sin(0.5*ypr[...,1])
+   cr2 = numpy.cos(0.5*ypr[...,2])
+   sr2 = numpy.sin(0.5*ypr[...,2])
+   quat[...,0] = -sy2*sp2*cr2 + cy2*cp2*sr2 # qx
+   quat[...,1] =  cy2*sp2*cr2 + sy2*cp2*sr2 # qy
+   quat[...,2] = -cy2*sp2*sr2 + sy2*cp2*cr2 # qz
+   quat[...,3] =  sy2*sp2*sr2 + cy2*cp2*cr2 # qw
+   return quat
+
+def _pose_from_xyzypr_stack(xyzypr):
+   xyzypr = numpy.asarray(xyzypr, dtype=float)
+   pose = numpy.zeros(xyzypr.shape[:-1] + (7,))
+   pose[...,0:3] = xyzypr[...,0:3]
+   pose[...,3:7] = quat_from_ypr(xyzypr[...,3:6])
+   return pose
+
+def _pose_to_xyzypr_stack(pose):
+   pose = numpy.asarray(pose, dtype=float)
+   xyzypr = numpy.zeros(pose.shape[:-1] + (6,))
+   xyzypr[...,0:3] = pose[...,0:3]
+   xyzypr[...,3:6] = quat_to_ypr(pose[...,3:7])
+   return xyzypr
+
+def _H_from_op_diff_stack(pos_from, pos_to_diff):
+    pos_from = numpy.asarray(pos_from, dtype=float)
+    pos_to_diff = numpy.asarray(pos_to_diff, dtype=float)
+    shape = numpy.broadcast(pos_from[...,0], pos_to_diff[...,0]).shape
+    H = numpy.zeros((int(numpy.prod(shape)),4,4))
+    H[:,3,3] = 1.0
+    # Set d
+    H[:,0:3,3] = (pos_from + numpy.zeros(shape + (3,))).reshape((-1,3))
+    # Define Z axis in direction of arrow */
+    pos_to_diff = (pos_to_diff + numpy.zeros(shape + (3,))).reshape((-1,3))
+    zlen = numpy.sqrt(numpy.sum(pos_to_diff**2, axis=-1))
+    H[:,0:3,2] = pos_to_diff / zlen[:,numpy.newaxis]
+    # Define other axes
+    near_e1 = numpy.abs(H[:,0,2]) > 0.9
+    far_e1 = ~near_e1
+    # Z is too close to e1, but sufficiently far from e2
+    # cross e2 with Z to get X (and normalize)
+    Hi = H[near_e1]
+    vlen = numpy.sqrt(Hi[:,2,2]*Hi[:,2,2] + Hi[:,0,2]*Hi[:,0,2])
+    Hi[:,0,0] = Hi[:,2,2] / vlen
+    Hi[:,1,0] = 0.0
+    Hi[:,2,0] = -Hi[:,0,2] / vlen
+    # Then Y = Z x X
+    Hi[:,0,1] = Hi[:,1,2] * Hi[:,2,0] - Hi[:,2,2] * Hi[:,1,0]
+    Hi[:,1,1] = Hi[:,2,2] * Hi[:,0,0] - Hi[:,0,2] * Hi[:,2,0]
+    Hi[:,2,1] = Hi[:,0,2] * Hi[:,1,0] - Hi[:,1,2] * Hi[:,0,0]
+    H[near_e1] = Hi
+    # Z is sufficiently far from e1;
+    # cross Z with e1 to get Y (and normalize)
+    Hi = H[far_e1]
+    vlen = numpy.sqrt(Hi[:,2,2]*Hi[:,2,2] + Hi[:,1,2]*Hi[:,1,2])
+    Hi[:,0,1] = 0.0
+    Hi[:,1,1] = Hi[:,2,2] / vlen
+    Hi[:,2,1] = -Hi[:,1,2] / vlen
+    # Then X = Y x Z
+    Hi[:,0,0] = Hi[:,1,1] * Hi[:,2,2] - Hi[:,2,1] * Hi[:,1,2]
+    Hi[:,1,0] = Hi[:,2,1] * Hi[:,0,2] - Hi[:,0,1] * Hi[:,2,2]
+    Hi[:,2,0] = Hi[:,0,1] * Hi[:,1,2] - Hi[:,1,1] * Hi[:,0,2]
+    H[far_e1] = Hi
+    return H.reshape(shape + (4,4))
+
+def _invert_H_stack(H):
+    H = numpy.asarray(H, dtype=float)
+    R_inv = numpy.swapaxes(H[...,0:3,0:3], -1, -2)
+    Hinv = numpy.zeros(H.shape)
+    Hinv[...,0:3,0:3] = R_inv
+    Hinv[...,0:3,3] = -numpy.sum(R_inv * H[...,numpy.newaxis,0:3,3], axis=-1)
+    Hinv[...,3,3] = 1.0
+    return Hinv
+
+def _xyzt_to_H_stack(xyzt):
+    xyzt = numpy.asarray(xyzt, dtype=float)
+    xyzypr = numpy.zeros(xyzt.shape[:-1] + (6,))
+    xyzypr[...,0:4] = xyzt[...,0:4]
+    return xyzypr_to_H(xyzypr)
+
+def _xyzypr_to_H_stack(xyzypr):
+    # Equivalent to pose_to_H(pose_from_xyzypr(xyzypr)), but the rotation
+    # matrix is computed directly from the angles.
+    xyzypr = numpy.asarray(xyzypr, dtype=float)
+    cy = numpy.cos(xyzypr[...,3])
+    sy = numpy.sin(xyzypr[...,3])
+    cp = numpy.cos(xyzypr[...,4])
+    sp = numpy.sin(xyzypr[...,4])
+    cr = numpy.cos(xyzypr[...,5])
+    sr = numpy.sin(xyzypr[...,5])
+    H = numpy.zeros(xyzypr.shape[:-1] + (4,4))
+    H[...,0,0] = cy * cp
+    H[...,0,1] = cy * sp * sr - sy * cr
+    H[...,0,2] = cy * sp * cr + sy * sr
+    H[...,1,0] = sy * cp
+    H[...,1,1] = sy * sp * sr + cy * cr
+    H[...,1,2] = sy * sp * cr - cy * sr
+    H[...,2,0] = -sp
+    H[...,2,1] = cp * sr
+    H[...,2,2] = cp * cr
+    H[...,0:3,3] = xyzypr[...,0:3]
+    H[...,3,3] = 1.0
+    return H
+
+def _quat_to_axisangle_stack(quat):
+   quat = numpy.asarray(quat, dtype=float)
+   a2 = numpy.arccos(quat[...,3])
+   angle = 2.0*a2
+   sina2inv = 1.0/numpy.sin(a2)
+   axis = sina2inv[...,numpy.newaxis] * quat[...,0:3]
+   return (axis, angle)
+
+def _transform_comparison_stack(H1, H2):
+    T_difference = _matmul(invert_H(H1), H2)
+    quat_difference = R_to_quat(T_difference[...,0:3,0:3]) #[x,y,z,w]
+    rotation_difference = numpy.abs(2.0* numpy.arccos(quat_difference[...,3])) # 2*acos(qw)
+    position_difference = numpy.sqrt(numpy.sum(T_difference[...,0:3,3]**2, axis=-1))
+    return position_difference, rotation_difference
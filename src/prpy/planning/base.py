@@ -47,6 +47,11 @@ class Tags(object):
     PLAN_TIME = 'planning_time'
     POSTPROCESS_TIME = 'postprocess_time'
     EXECUTION_TIME = 'execution_time'
+    COLLISION_CHECKS = 'collision_checks'
+    COLLISION_CHECKS_SKIPPED = 'collision_checks_skipped'
+    IK_ANALYTIC_CALLS = 'ik_analytic_calls'
+    IK_LOCAL_CALLS = 'ik_local_calls'
+    IK_CACHE_HITS = 'ik_cache_hits'
 
 
 class MetaPlanningError(PlanningError):
@@ -29,9 +29,14 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 import collections
+import errno
+import json
 import logging
 import numpy
 import openravepy
+import os
+import threading
+import time
 from .. import tsr
 from ..util import SetTrajectoryTags
 from base import (BasePlanner, PlanningError, UnsupportedPlanningError,
@@ -44,61 +49,443 @@ DistanceFieldKey = collections.namedtuple('DistanceFieldKey',
     [ 'kinematics_hash', 'enabled_mask', 'dof_values', 'dof_indices' ])
 
 
+class DistanceFieldStore(object):
+    """
+    Size-bounded, on-disk store of CHOMP signed distance fields.
+
+    Distance fields are saved as chomp_<md5>.sdf files in an OpenRAVE
+    database directory. An index file records the size, last use, and
+    computation time of each file. When the total size exceeds max_bytes,
+    the least recently used files are deleted.
+
+    Files are computed into a temporary path and renamed into place, and the
+    index is only modified while holding an exclusive lock, so multiple
+    processes can safely share the same directory. Files from before the index
+    existed are adopted the first time the index is created.
+    """
+    INDEX_FILENAME = 'chomp_index.json'
+    LOCK_FILENAME = 'chomp_index.lock'
+
+    def __init__(self, directory=None, max_bytes=1 << 30):
+        """
+        @param directory database directory; defaults to OpenRAVE's
+        @param max_bytes maximum total size of the files, or None
+        """
+        if directory is None:
+            directory = os.path.dirname(openravepy.RaveFindDatabaseFile(
+                self.INDEX_FILENAME, False))
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(directory, self.INDEX_FILENAME)
+        self.lock_path = os.path.join(directory, self.LOCK_FILENAME)
+
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_evicted = 0
+        self.bytes_saved = 0
+        self.time_saved = 0.
+        self._thread_lock = threading.RLock()
+
+    @staticmethod
+    def get_key(state):
+        import hashlib, pickle
+        return hashlib.md5(pickle.dumps(state)).hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self.directory, 'chomp_{:s}.sdf'.format(key))
+
+    def load(self, state, compute_fn):
+        """
+        Load or compute the distance field for a geometric state.
+
+        compute_fn is called with the path of the distance field file. The
+        file exists if, and only if, this is a cache hit. Otherwise,
+        compute_fn must compute the distance field and save it to that path.
+
+        @param state hashable geometric state, e.g. a DistanceFieldKey
+        @param compute_fn function that loads or computes the distance field
+        @return True if this was a cache hit
+        """
+        key = self.get_key(state)
+        path = self.get_path(key)
+
+        # Mark the entry as used before reading it so that a concurrent
+        # process is unlikely to evict it from under us.
+        with self._lock():
+            index = self._read_index()
+            entry = index.get(key)
+            is_hit = entry is not None and os.path.exists(path)
+
+            if is_hit:
+                entry['last_used'] = time.time()
+                self._write_index(index)
+
+        if is_hit:
+            compute_fn(path)
+
+            with self._thread_lock:
+                self.num_hits += 1
+                self.bytes_saved += entry.get('size', 0)
+                self.time_saved += entry.get('compute_time') or 0.
+            return True
+
+        # Compute the distance field into a unique temporary file and rename
+        # it into place. Renaming is atomic, so other processes never see a
+        # partially written file.
+        temp_path = os.path.join(self.directory, 'tmp_chomp_{:s}_{:d}_{:d}.sdf'
+            .format(key, os.getpid(), threading.current_thread().ident))
+
+        start_time = time.time()
+        try:
+            compute_fn(temp_path)
+            compute_time = time.time() - start_time
+
+            if os.path.exists(temp_path):
+                os.rename(temp_path, path)
+        finally:
+            self._remove(temp_path)
+
+        with self._thread_lock:
+            self.num_misses += 1
+
+        if os.path.exists(path):
+            with self._lock():
+                index = self._read_index()
+                index[key] = {
+                    'path': os.path.basename(path),
+                    'size': os.path.getsize(path),
+                    'last_used': time.time(),
+                    'compute_time': compute_time,
+                }
+                self._evict(index, keep=key)
+                self._write_index(index)
+
+        return False
+
+    def contains(self, state):
+        """
+        Check whether the distance field for a geometric state is saved.
+        @param state hashable geometric state, e.g. a DistanceFieldKey
+        @return True if the distance field is in the store
+        """
+        key = self.get_key(state)
+        with self._lock():
+            index = self._read_index()
+        return key in index and os.path.exists(self.get_path(key))
+
+    def get_stats(self):
+        """
+        Get statistics about this store.
+
+        Hits, misses, and savings are counted since this object was created.
+        The number of entries and their size are read from the shared index.
+
+        @return dictionary of statistics
+        """
+        with self._lock():
+            index = self._read_index()
+
+        with self._thread_lock:
+            num_requests = self.num_hits + self.num_misses
+            return {
+                'hits': self.num_hits,
+                'misses': self.num_misses,
+                'hit_rate': (float(self.num_hits) / num_requests
+                             if num_requests > 0 else 0.),
+                'evicted': self.num_evicted,
+                'bytes_saved': self.bytes_saved,
+                'time_saved': self.time_saved,
+                'num_entries': len(index),
+                'total_bytes': sum(entry.get('size', 0)
+                                   for entry in index.itervalues()),
+                'max_bytes': self.max_bytes,
+            }
+
+    def _evict(self, index, keep=None):
+        # Forget entries whose files were deleted externally.
+        for key in [ key for key, entry in index.iteritems()
+                     if not os.path.exists(self.get_path(key)) ]:
+            del index[key]
+
+        if self.max_bytes is None:
+            return
+
+        total_bytes = sum(entry.get('size', 0) for entry in index.itervalues())
+        lru_keys = sorted(index, key=lambda key: index[key].get('last_used', 0))
+
+        for key in lru_keys:
+            if total_bytes <= self.max_bytes:
+                break
+            elif key == keep:
+                continue
+
+            logger.debug('Evicting distance field "%s" from the store.',
+                         index[key]['path'])
+            total_bytes -= index[key].get('size', 0)
+            self._remove(self.get_path(key))
+            del index[key]
+
+            with self._thread_lock:
+                self.num_evicted += 1
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, 'r') as index_file:
+                return json.load(index_file)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return self._adopt_files()
+        except ValueError:
+            logger.warning('Distance field index "%s" is corrupt; rebuilding'
+                           ' it from the files on disk.', self.index_path)
+            return self._adopt_files()
+
+    def _write_index(self, index):
+        temp_path = '{:s}.{:d}.tmp'.format(self.index_path, os.getpid())
+        with open(temp_path, 'w') as index_file:
+            json.dump(index, index_file)
+        os.rename(temp_path, self.index_path)
+
+    def _adopt_files(self):
+        import glob
+
+        index = dict()
+        for path in glob.glob(os.path.join(self.directory, 'chomp_*.sdf')):
+            key = os.path.basename(path)[len('chomp_'):-len('.sdf')]
+            index[key] = {
+                'path': os.path.basename(path),
+                'size': os.path.getsize(path),
+                'last_used': os.path.getmtime(path),
+                'compute_time': None,
+            }
+        return index
+
+    def _lock(self):
+        return _FileLock(self.lock_path, self._thread_lock)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+
+class _FileLock(object):
+    """
+    Exclusive lock that is shared between threads and processes.
+    """
+    def __init__(self, path, thread_lock):
+        self.path = path
+        self.thread_lock = thread_lock
+        self.lock_file = None
+
+    def __enter__(self):
+        import fcntl
+
+        self.thread_lock.acquire()
+        try:
+            directory = os.path.dirname(self.path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+            self.lock_file = open(self.path, 'a')
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        except:
+            self.thread_lock.release()
+            raise
+
+        return self
+
+    def __exit__(self, *exc_info):
+        import fcntl
+
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
+        finally:
+            self.lock_file = None
+            self.thread_lock.release()
+
+
 class DistanceFieldManager(object):
-    def __init__(self, module):
+    def __init__(self, module, store=None, module_factory=None,
+                 max_parallel=None):
+        """
+        Track which distance fields are loaded in a CHOMP module.
+
+        Distance fields are keyed by the geometry of each body in its own
+        frame. They are only recomputed when a body's geometry, enabled links,
+        or articulated DOF values change. If a body only moves, its existing
+        distance field is registered again at the new transform.
+
+        If module_factory is provided, distance fields that are missing from
+        the store are computed concurrently: each worker computes fields with
+        its own module in a cloned environment and saves them to the store.
+        All fields are then loaded into this module in a single pass.
+
+        @param module CHOMP module
+        @param store DistanceFieldStore used to persist distance fields
+        @param module_factory function that creates a CHOMP module in an
+                              environment; enables parallel computation
+        @param max_parallel maximum number of concurrent workers; defaults to
+                            the number of CPUs
+        """
+        if store is None:
+            store = DistanceFieldStore()
+
         self.module = module
         self.env = self.module.GetEnv()
         self.cache = dict()
+        self.transforms = dict()
+        self.store = store
+        self.module_factory = module_factory
+        self.max_parallel = max_parallel
+        self.last_sync = None
 
     def sync(self, robot):
-        import os.path
+        """
+        Update the distance fields loaded in the module to match the
+        environment.
 
-        num_recomputed = 0
+        Statistics about this call, including the time spent computing each
+        body's distance field and the number of parallel workers, are saved in
+        last_sync.
+
+        @param robot robot whose active links are excluded from the fields
+        @return number of distance fields that were recomputed
+        """
+        start_time = time.time()
+
+        # Find the distance fields that are out of date.
+        stale = []
+        moved = []
 
         for body in self.env.GetBodies():
             with body:
-                # Only compute the SDF for links that are stationary. Other
-                # links will be represented with spheres.
-                if body == robot:
-                    active_dof_indices = robot.GetActiveDOFIndices()
-                    active_links = self.get_affected_links(robot, active_dof_indices)
-
-                    for link in active_links:
-                        link.Enable(False)
+                self.disable_active_links(body, robot)
 
                 body_name = body.GetName()
                 current_state = self.get_geometric_state(body)
+                current_transform = body.GetTransform()
                 logger.debug('Computed state for "%s": %s', body_name, current_state)
 
                 # Check if the distance field is already loaded. Clear the
                 # existing distance field if there is a key mismatch.
                 cached_state = self.cache.get(body.GetName(), None)
                 if cached_state is not None and cached_state != current_state:
-                    logger.debug('Clearing distance field for "{:s}".', body_name)
+                    logger.debug('Clearing distance field for "%s".', body_name)
                     self.module.removefield(body)
+                    del self.cache[body_name]
                     cached_state = None
 
-                # Otherwise, compute a new distance field and save it to disk.
                 if cached_state is None:
-                    cache_path = self.get_cache_path(current_state)
-                    logger.debug('Computing distance field for "%s"; filename: %s.',
-                        body_name, os.path.basename(cache_path)
-                    )
-
-                    self.module.computedistancefield(body, cache_filename=cache_path)
-                    self.cache[body_name] = current_state
-                    num_recomputed += 1
+                    stale.append((body, current_state))
+                # The body moved, but its distance field is unchanged in the
+                # body frame. Register the existing field at the new pose.
+                elif not numpy.array_equal(self.transforms[body_name],
+                                           current_transform):
+                    logger.debug('Moving distance field for "%s".', body_name)
+                    self.module.removefield(body)
+                    moved.append((body, current_state))
                 else:
                     logger.debug('Using existing distance field for "%s".', body_name)
 
-        return num_recomputed
+        # Compute the missing distance fields in parallel. This saves them to
+        # the store so they can be quickly loaded below.
+        missing = [ (body, state) for body, state in stale
+                    if not self.store.contains(state) ]
+        compute_times = dict()
+        num_workers = 1
 
-    @staticmethod
-    def get_cache_path(state):
-        import hashlib, pickle
-        state_hash = hashlib.md5(pickle.dumps(state)).hexdigest()
-        filename = 'chomp_{:s}.sdf'.format(state_hash)
-        return openravepy.RaveFindDatabaseFile(filename, False)
+        if self.module_factory is not None and len(missing) > 1:
+            num_workers = get_num_workers(len(missing), self.max_parallel)
+            if num_workers > 1:
+                compute_times = compute_distance_fields(
+                    robot, missing, self.store, self.module_factory,
+                    num_workers)
+
+        # Load or compute all of the distance fields in one pass.
+        for body, state in stale + moved:
+            with body:
+                self.disable_active_links(body, robot)
+
+                body_start_time = time.time()
+                is_hit = self.load_distance_field(body, state)
+                if not is_hit:
+                    compute_times[body.GetName()] = time.time() - body_start_time
+
+                logger.debug('%s distance field for "%s"; filename: %s.',
+                    'Loaded' if is_hit else 'Computed', body.GetName(),
+                    os.path.basename(self.get_cache_path(state))
+                )
+
+        wall_time = time.time() - start_time
+        self.last_sync = {
+            'compute_times': compute_times,
+            'num_workers': num_workers,
+            'wall_time': wall_time,
+            'parallelism': (sum(compute_times.itervalues()) / wall_time
+                            if compute_times and wall_time > 0. else 1.),
+        }
+
+        if compute_times:
+            logger.info('Computed %d distance fields in %.3f seconds using %d'
+                        ' workers (%.1fx parallelism).', len(compute_times),
+                        wall_time, num_workers, self.last_sync['parallelism'])
+
+        return len(stale)
+
+    @classmethod
+    def disable_active_links(cls, body, robot):
+        """
+        Disable the links of robot that are moved by its active DOFs.
+
+        Only compute the SDF for links that are stationary. Other links will
+        be represented with spheres. This should be called in a with-block
+        that restores body's state.
+
+        @param body KinBody being processed
+        @param robot robot whose active links are disabled
+        """
+        if body == robot:
+            active_dof_indices = robot.GetActiveDOFIndices()
+            active_links = cls.get_affected_links(robot, active_dof_indices)
+
+            for link in active_links:
+                link.Enable(False)
+
+    def load_distance_field(self, body, state):
+        """
+        Register a body's distance field with the CHOMP module.
+
+        The distance field is loaded from the store if possible and registered
+        at the body's current transform.
+
+        @param body KinBody
+        @param state geometric state of the body
+        @return True if the distance field was loaded from disk
+        """
+        def compute_fn(cache_path):
+            self.module.computedistancefield(body, cache_filename=cache_path)
+
+        is_hit = self.store.load(state, compute_fn)
+        self.cache[body.GetName()] = state
+        self.transforms[body.GetName()] = body.GetTransform()
+        return is_hit
+
+    def get_cache_path(self, state):
+        return self.store.get_path(self.store.get_key(state))
+
+    def get_stats(self):
+        """
+        Get statistics about the distance field store.
+        @return dictionary of statistics
+        """
+        return self.store.get_stats()
 
     @staticmethod
     def get_geometric_state(body):
@@ -140,18 +527,256 @@ class DistanceFieldManager(object):
         return all_effected_links
 
 
+def get_num_workers(num_fields, max_parallel=None):
+    """
+    Get the number of workers to compute distance fields with.
+    @param num_fields number of distance fields to compute
+    @param max_parallel maximum number of workers; defaults to the CPU count
+    @return number of workers
+    """
+    if max_parallel is None:
+        import multiprocessing
+        max_parallel = multiprocessing.cpu_count()
+
+    return max(1, min(max_parallel, num_fields))
+
+
+def compute_distance_fields(robot, missing, store, module_factory,
+                            num_workers):
+    """
+    Compute distance fields concurrently in cloned environments.
+
+    Each worker creates its own CHOMP module in a clone of the robot's
+    environment and saves the distance fields it computes to the store.
+    Failures are logged and left for the caller to recompute. The workers
+    run on private threads, so this may be called from a planner that is
+    running on an executor.
+
+    @param robot robot whose active links are excluded from the fields
+    @param missing list of (body, state) tuples to compute
+    @param store DistanceFieldStore to save the distance fields to
+    @param module_factory function that creates a CHOMP module in an
+                          environment
+    @param num_workers number of concurrent workers
+    @return dictionary from body name to computation time
+    """
+    from ..clone import ClonePool, Cloned
+
+    def compute_worker(cloned_env, assignments):
+        compute_times = dict()
+
+        with cloned_env:
+            cloned_module = module_factory(cloned_env)
+            cloned_robot = Cloned(robot, into=cloned_env)
+
+            for body, state in assignments:
+                body_name = body.GetName()
+                cloned_body = cloned_env.GetKinBody(body_name)
+                if cloned_body is None:
+                    logger.warning('Body "%s" was removed before its distance'
+                                   ' field was computed.', body_name)
+                    continue
+
+                def compute_fn(cache_path):
+                    cloned_module.computedistancefield(
+                        cloned_body, cache_filename=cache_path,
+                        releasegil=True)
+
+                with cloned_body:
+                    DistanceFieldManager.disable_active_links(
+                        cloned_body, cloned_robot)
+
+                    body_start_time = time.time()
+                    try:
+                        store.load(state, compute_fn)
+                    except Exception as e:
+                        logger.warning('Failed computing distance field'
+                                       ' for "%s": %s', body_name, e)
+                        continue
+
+                    compute_times[body_name] = time.time() - body_start_time
+
+        return compute_times
+
+    with ClonePool(robot.GetEnv(), num_workers) as clones:
+        assignments = [ missing[index::num_workers]
+                        for index in xrange(num_workers) ]
+        for index in xrange(num_workers):
+            clones.Clone(index)
+
+        compute_times = dict()
+        for worker_times in clones.Map(compute_worker, assignments):
+            compute_times.update(worker_times)
+
+    return compute_times
+
+
+class DistanceFieldPrefetcher(object):
+    """
+    Background service that precomputes CHOMP distance fields.
+
+    The prefetcher polls the robot's environment for bodies whose geometric
+    state does not yet have a distance field in the store, e.g. after a
+    perception update adds or changes an object, and computes them in cloned
+    environments. DistanceFieldManager.sync then only has to load the
+    distance fields from disk. Moving a body does not change its state, so
+    moves never trigger computation.
+
+    For example, to keep CHOMP's distance fields warm:
+
+        store = DistanceFieldStore()
+        planner = CHOMPPlanner(distance_field_store=store)
+
+        with DistanceFieldPrefetcher(robot, store=store):
+            ...
+    """
+    def __init__(self, robot, store=None, module_factory=None, period=0.5,
+                 max_parallel=None):
+        """
+        @param robot robot whose active links are excluded from the fields
+        @param store DistanceFieldStore to fill; defaults to OpenRAVE's
+                     database directory
+        @param module_factory function that creates a CHOMP module in an
+                              environment; defaults to orcdchomp
+        @param period polling period in seconds
+        @param max_parallel maximum number of concurrent workers
+        """
+        if store is None:
+            store = DistanceFieldStore()
+        if module_factory is None:
+            module_factory = CHOMPPlanner.CreateModule
+
+        self.robot = robot
+        self.env = robot.GetEnv()
+        self.store = store
+        self.module_factory = module_factory
+        self.period = period
+        self.max_parallel = max_parallel
+        self.num_computed = 0
+
+        self._known_keys = set()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """
+        Start polling the environment in a background thread.
+        """
+        if self._thread is not None:
+            raise ValueError('Prefetcher is already running.')
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='DistanceFieldPrefetcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop polling and wait for the current computation to finish.
+        """
+        if self._thread is None:
+            return
+
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def prefetch(self):
+        """
+        Compute the distance fields that are missing from the store.
+        @return number of distance fields that were computed
+        """
+        missing = []
+
+        with self.env:
+            for body in self.env.GetBodies():
+                with body:
+                    DistanceFieldManager.disable_active_links(body, self.robot)
+                    state = DistanceFieldManager.get_geometric_state(body)
+
+                key = self.store.get_key(state)
+                if key in self._known_keys:
+                    continue
+                elif self.store.contains(state):
+                    self._known_keys.add(key)
+                else:
+                    missing.append((body, state))
+
+        if not missing:
+            return 0
+
+        num_workers = get_num_workers(len(missing), self.max_parallel)
+
+        compute_times = compute_distance_fields(
+            self.robot, missing, self.store, self.module_factory,
+            num_workers)
+
+        for body, state in missing:
+            if body.GetName() in compute_times:
+                self._known_keys.add(self.store.get_key(state))
+
+        logger.debug('Prefetched %d distance fields: %s', len(compute_times),
+                     ', '.join(sorted(compute_times)))
+        self.num_computed += len(compute_times)
+        return len(compute_times)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.prefetch()
+            except Exception:
+                logger.exception('Failed prefetching distance fields.')
+
+            self._stop_event.wait(self.period)
+
+
 class CHOMPPlanner(BasePlanner):
-    def __init__(self):
+    def __init__(self, distance_field_store=None, trajectory_library=None):
+        """
+        @param distance_field_store DistanceFieldStore used to persist
+                                    distance fields; defaults to OpenRAVE's
+                                    database directory
+        @param trajectory_library TrajectoryLibrary used to seed
+                                  PlanToConfiguration with previous paths
+        """
         super(CHOMPPlanner, self).__init__()
+        self.distance_field_store = distance_field_store
+        self.trajectory_library = trajectory_library
         self.setupEnv(self.env)
 
     def setupEnv(self, env):
+        self.env = env
+        self.module = self.CreateModule(self.env)
+
+        # Create a DistanceFieldManager to track which distance fields are
+        # currently loaded.
+        self.distance_fields = DistanceFieldManager(
+            self.module, store=self.distance_field_store,
+            module_factory=self.CreateModule)
+
+    @staticmethod
+    def CreateModule(env):
+        """
+        Create bindings to a new orcdchomp module in an environment.
+        @param env OpenRAVE environment
+        @return CHOMP module bindings
+        """
         from types import MethodType
 
-        self.env = env
         try:
             from orcdchomp import orcdchomp
-            module = openravepy.RaveCreateModule(self.env, 'orcdchomp')
+            module = openravepy.RaveCreateModule(env, 'orcdchomp')
         except ImportError:
             raise UnsupportedPlanningError('Unable to import orcdchomp.')
         except openravepy.openrave_exception as e:
@@ -165,25 +790,22 @@ class CHOMPPlanner(BasePlanner):
         class CHOMPBindings(object):
             pass
 
-        self.module = CHOMPBindings()
-        self.module.module = module
-        self.module.viewspheres =\
+        bindings = CHOMPBindings()
+        bindings.module = module
+        bindings.viewspheres =\
             MethodType(orcdchomp.viewspheres, module)
-        self.module.computedistancefield =\
+        bindings.computedistancefield =\
             MethodType(orcdchomp.computedistancefield, module)
-        self.module.addfield_fromobsarray =\
+        bindings.addfield_fromobsarray =\
             MethodType(orcdchomp.addfield_fromobsarray, module)
-        self.module.removefield = MethodType(orcdchomp.removefield, module)
-        self.module.create = MethodType(orcdchomp.create, module)
-        self.module.iterate = MethodType(orcdchomp.iterate, module)
-        self.module.gettraj = MethodType(orcdchomp.gettraj, module)
-        self.module.destroy = MethodType(orcdchomp.destroy, module)
-        self.module.runchomp = MethodType(orcdchomp.runchomp, module)
-        self.module.GetEnv = self.module.module.GetEnv
-
-        # Create a DistanceFieldManager to track which distance fields are
-        # currently loaded.
-        self.distance_fields = DistanceFieldManager(self.module)
+        bindings.removefield = MethodType(orcdchomp.removefield, module)
+        bindings.create = MethodType(orcdchomp.create, module)
+        bindings.iterate = MethodType(orcdchomp.iterate, module)
+        bindings.gettraj = MethodType(orcdchomp.gettraj, module)
+        bindings.destroy = MethodType(orcdchomp.destroy, module)
+        bindings.runchomp = MethodType(orcdchomp.runchomp, module)
+        bindings.GetEnv = bindings.module.GetEnv
+        return bindings
 
     def __str__(self):
         return 'CHOMP'
@@ -196,7 +818,11 @@ class CHOMPPlanner(BasePlanner):
     def OptimizeTrajectory(self, robot, traj, lambda_=100.0, n_iter=50,
                            **kw_args):
         self.distance_fields.sync(robot)
+        return self._OptimizeTrajectory(self.module, robot, traj,
+                                        lambda_=lambda_, n_iter=n_iter)
 
+    @staticmethod
+    def _OptimizeTrajectory(module, robot, traj, lambda_, n_iter):
         cspec = traj.GetConfigurationSpecification()
         cspec.AddDeltaTimeGroup()
         openravepy.planningutils.ConvertTrajectorySpecification(traj, cspec)
@@ -207,9 +833,9 @@ class CHOMPPlanner(BasePlanner):
             traj.Insert(i, waypoint, True)
         
         try:
-            run = self.module.create(robot=robot, starttraj=traj, lambda_=lambda_)
-            self.module.iterate(n_iter=n_iter, run=run)
-            self.module.destroy(run=run)
+            run = module.create(robot=robot, starttraj=traj, lambda_=lambda_)
+            module.iterate(n_iter=n_iter, run=run)
+            module.destroy(run=run)
         except Exception as e:
             raise PlanningError(str(e))
 
@@ -218,26 +844,148 @@ class CHOMPPlanner(BasePlanner):
 
     @PlanningMethod
     def PlanToConfiguration(self, robot, goal, lambda_=100.0, n_iter=15,
-                            **kw_args):
+                            num_seeds=3, parallel=False, **kw_args):
         """
         Plan to a single configuration with single-goal CHOMP.
+
+        If the planner has a trajectory library, the num_seeds paths with the
+        closest start and goal configurations are adapted to this query and
+        optimized with OptimizeTrajectory; the shortest collision-free result
+        is returned. CHOMP falls back on a straight-line seed if there are no
+        such paths or none of them succeed. Every successful path is added to
+        the library.
+
         @param robot
         @param goal goal configuration
         @param lambda_ step size
         @param n_iter number of iterations
+        @param num_seeds number of paths to retrieve from the library
+        @param parallel optimize the seeds in parallel cloned environments
         """
         self.distance_fields.sync(robot)
 
-        try:
-            traj = self.module.runchomp(robot=robot, adofgoal=goal,
-                                        lambda_=lambda_, n_iter=n_iter,
-                                        releasegil=True, **kw_args)
-        except Exception as e:
-            raise PlanningError(str(e))
+        dof_indices = robot.GetActiveDOFIndices()
+        start = robot.GetActiveDOFValues()
+        traj = None
+
+        if self.trajectory_library is not None and num_seeds > 0:
+            seeds = self.trajectory_library.query(dof_indices, start, goal,
+                                                  k=num_seeds)
+            if seeds:
+                traj = self._PlanFromSeeds(
+                    robot, start, goal, [ seed for _, seed in seeds ],
+                    lambda_=lambda_, n_iter=n_iter, parallel=parallel)
+
+        if traj is None:
+            try:
+                traj = self.module.runchomp(robot=robot, adofgoal=goal,
+                                            lambda_=lambda_, n_iter=n_iter,
+                                            releasegil=True, **kw_args)
+            except Exception as e:
+                raise PlanningError(str(e))
+
+            SetTrajectoryTags(traj, {Tags.SMOOTH: True}, append=True)
 
+        if self.trajectory_library is not None:
+            self.trajectory_library.add(dof_indices,
+                                        self._GetWaypoints(robot, traj))
+
+        return traj
+
+    def _PlanFromSeeds(self, robot, start, goal, seeds, lambda_, n_iter,
+                       parallel=False):
+        """
+        Adapt and optimize seed paths, returning the shortest valid result.
+
+        In parallel, each seed is optimized on a private thread in its own
+        cloned environment. The caller's executor is not used because this
+        usually runs as a task on it.
+
+        @return trajectory or None if no seed succeeded
+        """
+        from ..util import AdaptTrajectory
+
+        dof_indices = robot.GetActiveDOFIndices()
+
+        def optimize_seed(module, robot, seed):
+            env = robot.GetEnv()
+            seed_traj = self._CreateTrajectory(robot, seed)
+
+            try:
+                adapted_traj = AdaptTrajectory(seed_traj, start, goal, robot)
+                adapted_traj = self._CreateTrajectory(
+                    robot, self._GetWaypoints(robot, adapted_traj))
+                optimized_traj = self._OptimizeTrajectory(
+                    module, robot, adapted_traj, lambda_=lambda_,
+                    n_iter=n_iter)
+            except (PlanningError, openravepy.openrave_exception) as e:
+                logger.debug('Optimizing seed failed: %s', e)
+                return None
+
+            waypoints = self._GetWaypoints(robot, optimized_traj)
+
+            with robot.CreateRobotStateSaver(
+                    openravepy.Robot.SaveParameters.LinkTransformation):
+                for q in waypoints:
+                    robot.SetActiveDOFValues(q)
+                    if env.CheckCollision(robot) or robot.CheckSelfCollision():
+                        logger.debug('Optimized seed is in collision.')
+                        return None
+
+            length = numpy.sum(numpy.sqrt(numpy.sum(
+                numpy.diff(waypoints, axis=0)**2, axis=1)))
+            return length, waypoints
+
+        if parallel and len(seeds) > 1:
+            from ..clone import ClonePool, Cloned
+
+            def optimize_seed_cloned(cloned_env, seed):
+                with cloned_env:
+                    cloned_robot = Cloned(robot, into=cloned_env)
+                    cloned_robot.SetActiveDOFs(dof_indices)
+                    cloned_module = self.CreateModule(cloned_env)
+                    DistanceFieldManager(
+                        cloned_module, store=self.distance_fields.store,
+                        module_factory=self.CreateModule
+                    ).sync(cloned_robot)
+                    return optimize_seed(cloned_module, cloned_robot, seed)
+
+            with ClonePool(self.env, len(seeds)) as clones:
+                for index in xrange(len(seeds)):
+                    clones.Clone(index)
+
+                results = clones.Map(optimize_seed_cloned, seeds)
+        else:
+            results = [ optimize_seed(self.module, robot, seed)
+                        for seed in seeds ]
+
+        results = [ result for result in results if result is not None ]
+        logger.debug('Optimized %d of %d seeds from the trajectory library.',
+                     len(results), len(seeds))
+        if not results:
+            return None
+
+        _, waypoints = min(results, key=lambda result: result[0])
+        traj = self._CreateTrajectory(robot, waypoints)
         SetTrajectoryTags(traj, {Tags.SMOOTH: True}, append=True)
         return traj
 
+    @staticmethod
+    def _CreateTrajectory(robot, waypoints):
+        traj = openravepy.RaveCreateTrajectory(robot.GetEnv(), '')
+        traj.Init(robot.GetActiveConfigurationSpecification('linear'))
+        for i, q in enumerate(waypoints):
+            traj.Insert(i, q)
+        return traj
+
+    @staticmethod
+    def _GetWaypoints(robot, traj):
+        cspec = traj.GetConfigurationSpecification()
+        dof_indices = robot.GetActiveDOFIndices()
+        return numpy.array([
+            cspec.ExtractJointValues(traj.GetWaypoint(i), robot, dof_indices)
+            for i in xrange(traj.GetNumWaypoints()) ])
+
     @PlanningMethod
     def PlanToEndEffectorPose(self, robot, goal_pose, lambda_=100.0,
                               n_iter=100, goal_tolerance=0.01, **kw_args):
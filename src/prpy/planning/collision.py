@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2015, Carnegie Mellon University
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# - Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# - Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# - Neither the name of Carnegie Mellon University nor the names of its
+#   contributors may be used to endorse or promote products derived from this
+#   software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import logging
+import numpy
+import openravepy
+from .exceptions import CollisionPlanningError, SelfCollisionPlanningError
+
+logger = logging.getLogger(__name__)
+
+
+class DistanceCollisionChecker(object):
+    """
+    Collision checker that skips checks that are provably unnecessary.
+
+    Each full check also queries the distance from the robot to the
+    environment (and to itself) using CollisionOptions.Distance. Until the
+    robot's links could have moved that far, subsequent checks are skipped.
+    Link motion is bounded conservatively from the active DOF displacement
+    and, for each revolute DOF, the largest distance from its joint axis to
+    any geometry (including grabbed bodies) that it moves.
+
+    If use_distance is False, or the environment's collision checker does not
+    support distance queries, every check is performed. This class must be
+    used as a context manager to configure the collision checker.
+    """
+    # Distances at or above this value are reported by some collision
+    # checkers when no distance was computed.
+    MAX_DISTANCE = 1e10
+
+    def __init__(self, robot, use_distance=True):
+        self.robot = robot
+        self.env = robot.GetEnv()
+        self.use_distance = use_distance
+        self.num_checks = 0
+        self.num_skipped = 0
+
+        self._options = None
+        self._anchors = dict()
+
+    def __enter__(self):
+        checker = self.env.GetCollisionChecker()
+        self._options = checker.GetCollisionOptions()
+
+        if self.use_distance:
+            distance_options = (self._options
+                                | openravepy.CollisionOptions.Distance)
+            if not checker.SetCollisionOptions(distance_options):
+                logger.debug('Collision checker "%s" does not support distance'
+                             ' queries; checking every step.',
+                             checker.GetXMLId())
+                checker.SetCollisionOptions(self._options)
+                self.use_distance = False
+
+        return self
+
+    def __exit__(self, *exc_info):
+        checker = self.env.GetCollisionChecker()
+        checker.SetCollisionOptions(self._options)
+
+    def CheckCollision(self, report=None):
+        """
+        Check the robot's current configuration for collision.
+
+        @param report optional CollisionReport to populate
+        @raises CollisionPlanningError if in collision with the environment
+        @raises SelfCollisionPlanningError if in self-collision
+        """
+        if report is None:
+            report = openravepy.CollisionReport()
+
+        q = self.robot.GetActiveDOFValues()
+        skip_env = self._CanSkip('env', q)
+        skip_self = self._CanSkip('self', q)
+
+        if skip_env and skip_self:
+            self.num_skipped += 1
+            return
+
+        self.num_checks += 1
+        radii = []
+
+        if not skip_env:
+            if self.env.CheckCollision(self.robot, report):
+                raise CollisionPlanningError.FromReport(report)
+            self._UpdateAnchor('env', q, report.minDistance, radii)
+
+        if not skip_self:
+            if self.robot.CheckSelfCollision(report):
+                raise SelfCollisionPlanningError.FromReport(report)
+            # Two links may approach each other, so each can only use half of
+            # the distance between them.
+            self._UpdateAnchor('self', q, 0.5 * report.minDistance, radii)
+
+    def GetTags(self):
+        """
+        Get trajectory tags that describe the collision checks performed.
+        @return dictionary of tags
+        """
+        from .base import Tags
+
+        return {
+            Tags.COLLISION_CHECKS: self.num_checks,
+            Tags.COLLISION_CHECKS_SKIPPED: self.num_skipped,
+        }
+
+    def _CanSkip(self, name, q):
+        anchor = self._anchors.get(name)
+        if anchor is None:
+            return False
+
+        q_anchor, budget, (radii, is_revolute) = anchor
+        # Every link point is at most radius + 2 * budget from a revolute
+        # joint's axis while the displacement is under budget: both the point
+        # and the axis may have moved by up to budget.
+        lever_arms = numpy.where(is_revolute, radii + 2. * budget, 1.)
+        displacement = numpy.dot(numpy.abs(q - q_anchor), lever_arms)
+        return displacement < budget
+
+    def _UpdateAnchor(self, name, q, distance, radii):
+        if (not self.use_distance or not numpy.isfinite(distance)
+                or distance <= 0. or distance >= self.MAX_DISTANCE):
+            self._anchors.pop(name, None)
+            return
+
+        # The radii are only computed once per check, and only if needed.
+        if not radii:
+            radii.append(self._ComputeRadii())
+
+        self._anchors[name] = (numpy.array(q), distance, radii[0])
+
+    def _ComputeRadii(self):
+        robot = self.robot
+        dof_indices = robot.GetActiveDOFIndices()
+        radii = numpy.zeros(len(dof_indices))
+        is_revolute = numpy.zeros(len(dof_indices), dtype=bool)
+
+        grabbed_bodies = dict()
+        for grabbed_info in robot.GetGrabbedInfo():
+            grabbed_body = self.env.GetKinBody(grabbed_info._grabbedname)
+            if grabbed_body is not None:
+                grabbed_bodies.setdefault(grabbed_info._robotlinkname,
+                                          []).append(grabbed_body)
+
+        for i, dof_index in enumerate(dof_indices):
+            joint = robot.GetJointFromDOFIndex(dof_index)
+            if not joint.IsRevolute(dof_index - joint.GetDOFIndex()):
+                continue
+
+            is_revolute[i] = True
+            anchor = joint.GetAnchor()
+
+            for link in robot.GetLinks():
+                if not robot.DoesAffect(joint.GetJointIndex(),
+                                        link.GetIndex()):
+                    continue
+
+                aabbs = [link.ComputeAABB()]
+                aabbs.extend(body.ComputeAABB() for body in
+                             grabbed_bodies.get(link.GetName(), []))
+
+                for aabb in aabbs:
+                    radius = (numpy.linalg.norm(aabb.pos() - anchor)
+                              + numpy.linalg.norm(aabb.extents()))
+                    radii[i] = max(radii[i], radius)
+
+        return radii, is_revolute
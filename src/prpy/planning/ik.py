@@ -30,28 +30,46 @@
 import logging
 import numpy
 import openravepy
-from .. import ik_ranking
+from .. import ik_cache, ik_ranking
 from base import (BasePlanner,
+                  MetaPlanningError,
                   PlanningError,
                   PlanningMethod)
+from parallel import ParallelGoalPlanner
 
 logger = logging.getLogger(__name__)
 
 
 class IKPlanner(BasePlanner):
-    def __init__(self, delegate_planner=None):
+    def __init__(self, delegate_planner=None, num_planning_workers=None,
+                 delegate_planner_factory=None):
+        """
+        @param delegate_planner planner used to plan to the IK solutions,
+                                defaults to robot.planner
+        @param num_planning_workers number of IK solutions to plan to in
+                                    parallel; solutions are tried one at a
+                                    time if None
+        @param delegate_planner_factory optional function that creates a
+                                        delegate planner for each parallel
+                                        worker
+        """
         super(IKPlanner, self).__init__()
         self.delegate_planner = delegate_planner
 
+        if num_planning_workers is not None:
+            self._goal_planner = ParallelGoalPlanner(
+                num_workers=num_planning_workers,
+                delegate_planner_factory=delegate_planner_factory)
+        else:
+            self._goal_planner = None
+
     def __str__(self):
         return 'IKPlanner'
 
     @PlanningMethod
     def PlanToIK(self, robot, goal_pose, ranker=ik_ranking.JointLimitAvoidance,
                  num_attempts=1, **kw_args):
-        from openravepy import (IkFilterOptions,
-                                IkParameterization,
-                                IkParameterizationType)
+        from openravepy import IkFilterOptions, IkParameterizationType
 
         # FIXME: Currently meta-planners duplicate IK ranking in each planning
         # thread. It should be possible to fix this by IK ranking once, then
@@ -60,12 +78,9 @@ class IKPlanner(BasePlanner):
         # Find an unordered list of IK solutions.
         with robot.GetEnv():
             manipulator = robot.GetActiveManipulator()
-            ik_param = IkParameterization(
-                goal_pose, IkParameterizationType.Transform6D)
-            ik_solutions = manipulator.FindIKSolutions(
-                ik_param, IkFilterOptions.CheckEnvCollisions,
-                ikreturn=False, releasegil=True
-            )
+            ik_solutions = ik_cache.FindIKSolutions(
+                manipulator, goal_pose, IkFilterOptions.CheckEnvCollisions,
+                IkParameterizationType.Transform6D)
 
         if ik_solutions.shape[0] == 0:
             raise PlanningError('There is no IK solution at the goal pose.')
@@ -89,6 +104,27 @@ class IKPlanner(BasePlanner):
             robot.SetActiveDOFs(manipulator.GetArmIndices())
 
             num_attempts = min(ranked_ik_solutions.shape[0], num_attempts)
+
+            # Plan to the top solutions in parallel and return the trajectory
+            # to the best-ranked solution that succeeds.
+            if self._goal_planner is not None:
+                arm_indices = manipulator.GetArmIndices()
+
+                def plan_fn(planner, cloned_robot, ik_sol):
+                    cloned_robot.SetActiveDOFs(arm_indices)
+                    return planner.PlanToConfiguration(cloned_robot, ik_sol,
+                                                       defer=False)
+
+                try:
+                    return self._goal_planner.Plan(
+                        robot, list(ranked_ik_solutions[0:num_attempts, :]),
+                        plan_fn, delegate_planner=planner)
+                except MetaPlanningError as e:
+                    raise MetaPlanningError(
+                        'Planning to the top {:d} of {:d} IK solutions failed.'
+                        .format(num_attempts, ranked_ik_solutions.shape[0]),
+                        e.errors)
+
             for i, ik_sol in enumerate(ranked_ik_solutions[0:num_attempts, :]):
                 try:
                     traj = planner.PlanToConfiguration(robot, ik_sol)
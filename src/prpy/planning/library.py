@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2015, Carnegie Mellon University
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# - Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# - Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# - Neither the name of Carnegie Mellon University nor the names of its
+#   contributors may be used to endorse or promote products derived from this
+#   software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import collections
+import logging
+import numpy
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class TrajectoryLibrary(object):
+    """
+    Library of previously planned paths indexed by their endpoints.
+
+    Paths are stored as (N, dof) arrays of waypoints, grouped by the DOF
+    indices they were planned for. Queries return the paths whose
+    concatenated (start, goal) configurations are closest to the query in
+    Euclidean distance. The nearest-neighbor index is a KD-tree that is
+    rebuilt lazily after the library changes.
+
+    This class is thread-safe.
+    """
+    def __init__(self, max_size=None):
+        """
+        @param max_size maximum number of paths stored for each set of DOF
+                        indices; the oldest paths are discarded first
+        """
+        self.max_size = max_size
+        self._paths = collections.defaultdict(list)
+        self._trees = dict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(paths) for paths in self._paths.itervalues())
+
+    def add(self, dof_indices, waypoints):
+        """
+        Add a path to the library.
+        @param dof_indices DOF indices of the waypoints
+        @param waypoints (N, dof) array of waypoints, N >= 2
+        """
+        dof_indices = tuple(dof_indices)
+        waypoints = numpy.array(waypoints, dtype=float)
+
+        if waypoints.ndim != 2 or waypoints.shape[1] != len(dof_indices):
+            raise ValueError('Waypoints must be an (N, {:d}) array.'
+                             .format(len(dof_indices)))
+        elif waypoints.shape[0] < 2:
+            raise ValueError('A path must contain at least two waypoints.')
+
+        with self._lock:
+            paths = self._paths[dof_indices]
+            paths.append(waypoints)
+
+            if self.max_size is not None and len(paths) > self.max_size:
+                del paths[:len(paths) - self.max_size]
+
+            self._trees.pop(dof_indices, None)
+
+    def query(self, dof_indices, start, goal, k=1):
+        """
+        Find the paths with the closest endpoints.
+        @param dof_indices DOF indices of the query
+        @param start start configuration
+        @param goal goal configuration
+        @param k maximum number of paths to return
+        @return list of (distance, waypoints) tuples, closest first
+        """
+        dof_indices = tuple(dof_indices)
+        query = numpy.concatenate((start, goal))
+
+        with self._lock:
+            paths = list(self._paths.get(dof_indices, []))
+            if not paths or k <= 0:
+                return []
+
+            tree = self._trees.get(dof_indices)
+            if tree is None:
+                from scipy.spatial import cKDTree
+
+                endpoints = numpy.array([
+                    numpy.concatenate((path[0], path[-1])) for path in paths ])
+                tree = cKDTree(endpoints)
+                self._trees[dof_indices] = tree
+
+        k = min(k, len(paths))
+        distances, indices = tree.query(query, k=k)
+        distances = numpy.atleast_1d(distances)
+        indices = numpy.atleast_1d(indices)
+
+        return [ (distance, paths[index].copy())
+                 for distance, index in zip(distances, indices) ]
+
+    def save(self, path):
+        """
+        Save the library to a .npz file.
+        @param path output filename
+        """
+        arrays = dict()
+
+        with self._lock:
+            for group_index, (dof_indices, paths) in enumerate(
+                    self._paths.iteritems()):
+                arrays['group{:d}_dof_indices'.format(group_index)] = \
+                    numpy.array(dof_indices, dtype=int)
+
+                for path_index, waypoints in enumerate(paths):
+                    arrays['group{:d}_path{:d}'.format(
+                        group_index, path_index)] = waypoints
+
+        numpy.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path, max_size=None):
+        """
+        Load a library saved by save.
+        @param path input filename
+        @param max_size maximum number of paths for each set of DOF indices
+        @return TrajectoryLibrary
+        """
+        library = cls(max_size=max_size)
+        data = numpy.load(path)
+
+        group_index = 0
+        while 'group{:d}_dof_indices'.format(group_index) in data.files:
+            dof_indices = data['group{:d}_dof_indices'.format(group_index)]
+
+            path_index = 0
+            while 'group{:d}_path{:d}'.format(group_index, path_index) in data.files:
+                library.add(dof_indices, data['group{:d}_path{:d}'.format(
+                    group_index, path_index)])
+                path_index += 1
+
+            group_index += 1
+
+        return library
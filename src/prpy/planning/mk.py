@@ -28,7 +28,7 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
-import logging, numpy, openravepy, time
+import logging, math, numpy, openravepy, time
 from ..util import SetTrajectoryTags
 from base import (BasePlanner, PlanningError, UnsupportedPlanningError,
                   PlanningMethod, Tags)
@@ -43,20 +43,150 @@ def JointLimitAvoidance(robot, limit_tolerance=0.2, gain=100):
     q = robot.GetActiveDOFValues()
     q_min, q_max = robot.GetDOFLimits(robot.GetActiveDOFIndices())
 
-    num_dofs = robot.GetActiveDOF()
-    q_dot = numpy.zeros(num_dofs)
-    for i in xrange(num_dofs):
-        max_limit_dist = q_max[i] - q[i]
-        min_limit_dist = q_min[i] - q[i]
+    max_limit_dist = q_max - q
+    min_limit_dist = q_min - q
 
-        if max_limit_dist < limit_tolerance:
-            q_dot[i] = -gain * (max_limit_dist - limit_tolerance) ** 2
-        elif min_limit_dist > -limit_tolerance:
-            q_dot[i] =  gain * (min_limit_dist + limit_tolerance) ** 2
-        else:
-            q_dot[i] = 0
+    return numpy.where(
+        max_limit_dist < limit_tolerance,
+        -gain * (max_limit_dist - limit_tolerance) ** 2,
+        numpy.where(
+            min_limit_dist > -limit_tolerance,
+            gain * (min_limit_dist + limit_tolerance) ** 2,
+            0.
+        )
+    )
 
-    return q_dot
+class JacobianFactorization(object):
+    """
+    Damped pseudoinverse and null-space projector of the MK Jacobian.
+
+    The Jacobian stacks the end-effector's position Jacobian and its
+    quaternion Jacobian. It is factored with an SVD. Instead of evaluating
+    the Jacobian through OpenRAVE after every step, Update corrects it with a
+    Broyden rank-one update from the observed end-effector motion and applies
+    the same update to the existing SVD (Brand, 2006). The exact Jacobian is
+    re-evaluated and refactored every refresh_interval steps, which also
+    discards the round-off that accumulates in the updated factors.
+
+    The quaternion in x is kept in one hemisphere so that it changes
+    continuously. quat_sign is -1 when it is the negative of the quaternion
+    returned by OpenRAVE at the current configuration.
+    """
+    def __init__(self, manip, damping=1e-6, refresh_interval=10,
+                 rank_tolerance=1e-10):
+        self.manip = manip
+        self.robot = manip.GetRobot()
+        self.damping = damping
+        self.refresh_interval = refresh_interval
+        self.rank_tolerance = rank_tolerance
+
+        self.num_evaluations = 0
+        self.num_updates = 0
+
+        self.x = None
+        self.quat_sign = 1.
+        self.Refresh()
+
+    def Refresh(self):
+        """
+        Evaluate and factor the exact Jacobian at the current configuration.
+        """
+        jacobian_spatial = self.manip.CalculateJacobian()
+        jacobian_angular = self.manip.CalculateRotationJacobian() #this function seems very buggy/wrong
+        self.q = self._GetConfiguration()
+        self.x, self.quat_sign = self._GetPoseVector()
+
+        # The rotation Jacobian is the derivative of OpenRAVE's quaternion, so
+        # it must be flipped with the quaternion.
+        self.jacobian = numpy.vstack((jacobian_spatial,
+                                      self.quat_sign * jacobian_angular))
+        self.num_evaluations += 1
+        self._steps_since_refresh = 0
+        self._Factor()
+
+    def Update(self):
+        """
+        Update the factorization after the arm has moved.
+        """
+        self._steps_since_refresh += 1
+        if self._steps_since_refresh >= self.refresh_interval:
+            self.Refresh()
+            return
+
+        q = self._GetConfiguration()
+        x, self.quat_sign = self._GetPoseVector()
+        dq = q - self.q
+        dq_norm2 = numpy.dot(dq, dq)
+
+        if dq_norm2 > 0.:
+            residual = (x - self.x) - numpy.dot(self.jacobian, dq)
+            self.jacobian += numpy.outer(residual, dq) / dq_norm2
+            self.num_updates += 1
+            self._UpdateFactorization(residual / dq_norm2, dq)
+
+        self.q = q
+        self.x = x
+
+    def _Factor(self):
+        U, s, Vt = numpy.linalg.svd(self.jacobian, full_matrices=False)
+        self._SetFactorization(U, s, Vt)
+
+    def _UpdateFactorization(self, a, b):
+        """
+        Update the SVD U diag(s) Vt of the Jacobian to that of the Jacobian
+        plus the rank-one matrix outer(a, b). Only the SVD of a small core
+        matrix is computed.
+        """
+        U, s, Vt = self.U, self.s, self.Vt
+        k = s.shape[0]
+
+        # Components of a and b that are orthogonal to the current factors.
+        m = numpy.dot(U.T, a)
+        p = a - numpy.dot(U, m)
+        p_norm = numpy.linalg.norm(p)
+        P = p / p_norm if p_norm > 0. else p
+
+        n = numpy.dot(Vt, b)
+        q = b - numpy.dot(Vt.T, n)
+        q_norm = numpy.linalg.norm(q)
+        Q = q / q_norm if q_norm > 0. else q
+
+        K = numpy.zeros((k + 1, k + 1))
+        K[:k, :k] = numpy.diag(s)
+        K += numpy.outer(numpy.append(m, p_norm), numpy.append(n, q_norm))
+        Uk, sk, Vkt = numpy.linalg.svd(K)
+
+        # The updated Jacobian has the same shape, so it has at most k
+        # non-zero singular values.
+        U = numpy.dot(numpy.column_stack((U, P)), Uk[:, :k])
+        Vt = numpy.dot(Vkt[:k, :], numpy.vstack((Vt, Q)))
+        self._SetFactorization(U, sk[:k], Vt)
+
+    def _SetFactorization(self, U, s, Vt):
+        self.U, self.s, self.Vt = U, s, Vt
+        self.pinv = numpy.dot(Vt.T * (s / (s**2 + self.damping**2)), U.T)
+
+        rank = numpy.sum(s > self.rank_tolerance * s[0])
+        Vr = Vt[:rank, :]
+        self.nullspace_projector = numpy.eye(Vt.shape[1]) - numpy.dot(Vr.T, Vr)
+
+    def _GetConfiguration(self):
+        return self.robot.GetDOFValues(self.manip.GetArmIndices())
+
+    def _GetPoseVector(self):
+        """
+        @return pose vector and the sign that was applied to the quaternion
+        """
+        pose = self.manip.GetEndEffectorTransform()
+        quat = openravepy.quatFromRotationMatrix(pose)
+
+        # Keep the quaternion in the same hemisphere as the last one so that
+        # finite differences are meaningful.
+        quat_sign = 1.
+        if self.x is not None and numpy.dot(quat, self.x[3:7]) < 0.:
+            quat_sign = -1.
+
+        return numpy.hstack((pose[0:3, 3], quat_sign * quat)), quat_sign
 
 class MKPlanner(BasePlanner):
     def __init__(self):
@@ -69,7 +199,8 @@ class MKPlanner(BasePlanner):
         ### NOTE: The sign_flipper is a hack
         ### Sometimes, it seems changing the direction of the error term caused it to succeed
         ### sign_flipper is monitered by the planner. If the orientation error starts increasing, it flips the sign of the error term
-    def GetStraightVelocity(self, manip, velocity, initial_hand_pose, nullspace_fn, step_size, sign_flipper = 1):
+    def GetStraightVelocity(self, manip, velocity, initial_hand_pose, nullspace_fn, step_size, sign_flipper = 1,
+                            jacobian=None):
         robot = manip.GetRobot()
         current_hand_pose = manip.GetEndEffectorTransform()
         initial_position = initial_hand_pose[0:3, 3]
@@ -87,27 +218,80 @@ class MKPlanner(BasePlanner):
         choices_ori = [ current_ori - initial_ori, current_ori + initial_ori ]
         error_ori = sign_flipper*min(choices_ori, key=lambda q: numpy.linalg.norm(q))
 
-        # Jacobian pseudo-inverse.
-        jacobian_spatial = manip.CalculateJacobian()
-        jacobian_angular = manip.CalculateRotationJacobian() #this function seems very buggy/wrong
-        jacobian = numpy.vstack((jacobian_spatial, jacobian_angular))
-        jacobian_pinv = numpy.linalg.pinv(jacobian)
-
-        # Null-space projector
-        nullspace_projector = numpy.eye(jacobian.shape[1]) - numpy.dot(jacobian_pinv, jacobian)
+        # Jacobian pseudo-inverse and null-space projector. Re-use the cached
+        # factorization if one is provided. Express the orientation error in
+        # the same quaternion hemisphere as its Jacobian.
+        if jacobian is None:
+            jacobian = JacobianFactorization(manip)
+        error_ori = jacobian.quat_sign * error_ori
         nullspace_goal = nullspace_fn(robot)
         pose_error = numpy.hstack((error_pos, error_ori))
 
-        return numpy.dot(jacobian_pinv, pose_error) + numpy.dot(nullspace_projector, nullspace_goal)
+        return (numpy.dot(jacobian.pinv, pose_error)
+              + numpy.dot(jacobian.nullspace_projector, nullspace_goal))
+
+    @staticmethod
+    def _CheckStep(robot, manip, checker, report, q_prev, q_dot, initial_pose,
+                   direction, resolutions, limits_lower, limits_upper,
+                   position_tolerance, angular_tolerance):
+        """
+        Move the robot along a step and check it against the constraints.
+        @return position and orientation deviation at the end of the step
+        @raises PlanningError if the step violates a constraint
+        """
+        active_dof_indices = manip.GetArmIndices()
+        q = q_prev + q_dot
+
+        # Check for collisions at DOF resolution along the step.
+        # There is only one environment collision check per
+        # configuration.
+        num_substeps = max(1, int(math.ceil(max(abs(q_dot) / resolutions))))
+        for i in xrange(1, num_substeps + 1):
+            robot.SetDOFValues(q_prev + (float(i) / num_substeps) * q_dot,
+                               active_dof_indices)
+            checker.CheckCollision(report)
+
+        # Check for joint limits.
+        if not (limits_lower < q).all() or not (q < limits_upper).all():
+            raise PlanningError('Encountered joint limit during Jacobian move.')
+
+        # Check our distance from the constraint.
+        current_pose = manip.GetEndEffectorTransform()
+        a = initial_pose[0:3, 3]
+        p = current_pose[0:3, 3]
+        orthogonal_proj = (a - p) - numpy.dot(a - p, direction) * direction
+        position_deviation = numpy.linalg.norm(orthogonal_proj)
+        if position_deviation > position_tolerance:
+            raise PlanningError('Deviated from a straight line constraint.')
+
+        # Check our orientation against the constraint.
+        offset_rotation = numpy.dot(current_pose[0:3, 0:3].T,
+                                    initial_pose[0:3, 0:3])
+        offset_angle = openravepy.axisAngleFromRotationMatrix(offset_rotation)
+        offset_angle_norm = numpy.linalg.norm(offset_angle)
+        if offset_angle_norm > angular_tolerance:
+            raise PlanningError('Deviated from orientation constraint.')
+
+        return position_deviation, offset_angle_norm
 
     @PlanningMethod
     def PlanToEndEffectorOffset(self, robot, direction, distance, max_distance=None,
                                 nullspace=JointLimitAvoidance, timelimit=5.0, step_size=0.001,
-                                position_tolerance=0.01, angular_tolerance=0.15, **kw_args):
+                                position_tolerance=0.01, angular_tolerance=0.15,
+                                use_distance=False, max_step_size=None, **kw_args):
         """
         Plan to a desired end-effector offset with move-hand-straight
         constraint. movement less than distance will return failure. The motion
         will not move further than max_distance.
+
+        If max_step_size is larger than step_size, the step size grows up to
+        max_step_size while the joint-space path is straight and shrinks back
+        towards step_size where it curves or the hand approaches the position
+        or orientation tolerance. A larger step that violates a constraint is
+        retried with half the step size, so the tolerances are only enforced
+        at step_size. The robot is collision checked at DOF resolution along
+        every step.
+
         @param robot
         @param direction unit vector in the direction of motion
         @param distance minimum distance in meters
@@ -116,8 +300,13 @@ class MKPlanner(BasePlanner):
         @param stepsize step size in meters for the Jacobian pseudoinverse controller
         @param position_tolerance constraint tolerance in meters
         @param angular_tolerance constraint tolerance in radians
+        @param use_distance skip collision checks using distance queries
+        @param max_step_size maximum adaptive step size in meters
         @return traj
         """
+        if max_step_size is None:
+            max_step_size = step_size
+
         if distance < 0:
             raise ValueError('Distance must be non-negative.')
         elif numpy.linalg.norm(direction) == 0:
@@ -126,18 +315,13 @@ class MKPlanner(BasePlanner):
             raise ValueError('Max distance is less than minimum distance.')
         elif step_size <= 0:
             raise ValueError('Step size must be positive.')
+        elif max_step_size < step_size:
+            raise ValueError('Max step size is less than step size.')
         elif position_tolerance < 0:
             raise ValueError('Position tolerance must be non-negative.')
         elif angular_tolerance < 0:
             raise ValueError('Angular tolerance must be non-negative.')
 
-        # save all active bodies so we only check collision with those
-        active_bodies = []
-        for body in self.env.GetBodies():
-            if body.IsEnabled():
-                active_bodies.append(body)
-        
-
         # Normalize the direction vector.
         direction  = numpy.array(direction, dtype='float')
         direction /= numpy.linalg.norm(direction)
@@ -146,21 +330,31 @@ class MKPlanner(BasePlanner):
         if max_distance is None:
             max_distance = distance
 
-        with robot:
+        from .collision import DistanceCollisionChecker
+
+        with robot, DistanceCollisionChecker(
+                robot, use_distance=use_distance) as checker:
             manip = robot.GetActiveManipulator()
             traj = openravepy.RaveCreateTrajectory(self.env, '')
             traj.Init(manip.GetArmConfigurationSpecification())
 
             active_dof_indices = manip.GetArmIndices()
+            robot.SetActiveDOFs(active_dof_indices)
             limits_lower, limits_upper = robot.GetDOFLimits(active_dof_indices)
+            resolutions = robot.GetActiveDOFResolutions()
             initial_pose = manip.GetEndEffectorTransform()
             q = robot.GetDOFValues(active_dof_indices)
             traj.Insert(0, q)
 
+            jacobian = JacobianFactorization(manip)
+            report = openravepy.CollisionReport()
+
             start_time = time.time()
             current_distance = 0.0
+            current_step_size = step_size
             sign_flipper = 1
             last_rot_error = 9999999999.0
+            last_q_dot = None
             try:
                 while current_distance < max_distance:
                     # Check for a timeout.
@@ -169,38 +363,34 @@ class MKPlanner(BasePlanner):
                         raise PlanningError('Reached time limit.')
 
                     # Compute joint velocities using the Jacobian pseudoinverse.
-                    q_dot = self.GetStraightVelocity(manip, direction, initial_pose, nullspace, step_size, sign_flipper=sign_flipper)
-                    q += q_dot
-                    robot.SetDOFValues(q, active_dof_indices)
-
-                    # Check for collisions.
-                    #if self.env.CheckCollision(robot):
-                    for body in active_bodies:
-                        if self.env.CheckCollision(robot, body):
-                            raise PlanningError('Encountered collision.')
-                    if robot.CheckSelfCollision():
-                        raise PlanningError('Encountered self-collision.')
-                    # Check for joint limits.
-                    elif not (limits_lower < q).all() or not (q < limits_upper).all():
-                        raise PlanningError('Encountered joint limit during Jacobian move.')
-
-                    # Check our distance from the constraint.
-                    current_pose = manip.GetEndEffectorTransform()
-                    a = initial_pose[0:3, 3]
-                    p = current_pose[0:3, 3]
-                    orthogonal_proj = (a - p) - numpy.dot(a - p, direction) * direction
-                    if numpy.linalg.norm(orthogonal_proj) > position_tolerance:
-                        raise PlanningError('Deviated from a straight line constraint.')
-
-                    # Check our orientation against the constraint.
-                    offset_pose = numpy.dot(numpy.linalg.inv(current_pose), initial_pose)
-                    offset_angle = openravepy.axisAngleFromRotationMatrix(offset_pose)
-                    offset_angle_norm = numpy.linalg.norm(offset_angle)
+                    q_dot = self.GetStraightVelocity(manip, direction, initial_pose, nullspace, current_step_size,
+                                                     sign_flipper=sign_flipper, jacobian=jacobian)
+                    q_prev = q
+                    q = q + q_dot
+
+                    try:
+                        position_deviation, offset_angle_norm = self._CheckStep(
+                            robot, manip, checker, report, q_prev, q_dot,
+                            initial_pose, direction, resolutions,
+                            limits_lower, limits_upper,
+                            position_tolerance, angular_tolerance)
+                    except PlanningError as e:
+                        # A smaller step may stay within the constraints, so
+                        # retry from the last waypoint before giving up.
+                        if current_step_size <= step_size:
+                            raise
+
+                        logger.debug('Retrying step of size %f: %s',
+                                     current_step_size, e.message)
+                        q = q_prev
+                        robot.SetDOFValues(q, active_dof_indices)
+                        current_step_size = max(0.5 * current_step_size, step_size)
+                        last_q_dot = None
+                        continue
+
                     if offset_angle_norm > last_rot_error + 0.0005:
                         sign_flipper *= -1
                     last_rot_error = offset_angle_norm
-                    if offset_angle_norm > angular_tolerance:
-                        raise PlanningError('Deviated from orientation constraint.')
 
                     traj.Insert(traj.GetNumWaypoints(), q)
 
@@ -209,6 +399,25 @@ class MKPlanner(BasePlanner):
                     hand_pose = manip.GetEndEffectorTransform()
                     displacement = hand_pose[0:3, 3] - initial_pose[0:3, 3]
                     current_distance = numpy.dot(displacement, direction)
+
+                    # Grow the step while the joint-space path is straight and
+                    # far from the constraint boundaries. Otherwise, shrink it.
+                    if max_step_size > step_size:
+                        curving = False
+                        if last_q_dot is not None:
+                            norms = numpy.linalg.norm(q_dot) * numpy.linalg.norm(last_q_dot)
+                            curving = (norms > 0. and
+                                numpy.dot(q_dot, last_q_dot) < 0.99 * norms)
+
+                        if (curving
+                                or position_deviation > 0.5 * position_tolerance
+                                or offset_angle_norm > 0.5 * angular_tolerance):
+                            current_step_size = max(0.5 * current_step_size, step_size)
+                        else:
+                            current_step_size = min(1.5 * current_step_size, max_step_size)
+                    last_q_dot = q_dot
+
+                    jacobian.Update()
             except PlanningError as e:
                 # Throw an error if we haven't reached the minimum distance.
                 if current_distance < distance:
@@ -218,6 +427,10 @@ class MKPlanner(BasePlanner):
                     logger.warning('Terminated early at distance %f < %f: %s',
                                    current_distance, max_distance, e.message)
 
-        SetTrajectoryTags(output_traj, {Tags.CONSTRAINED: True}, append=True)
-        return traj
+            logger.debug('Evaluated the Jacobian %d times and updated it %d'
+                         ' times.', jacobian.num_evaluations,
+                         jacobian.num_updates)
 
+        SetTrajectoryTags(traj, {Tags.CONSTRAINED: True}, append=True)
+        SetTrajectoryTags(traj, checker.GetTags(), append=True)
+        return traj
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2015, Carnegie Mellon University
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# - Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# - Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# - Neither the name of Carnegie Mellon University nor the names of its
+#   contributors may be used to endorse or promote products derived from this
+#   software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+import logging
+import Queue
+import threading
+import openravepy
+from ..clone import ClonePool, Cloned
+from ..util import CopyTrajectory
+from base import MetaPlanningError, PlanningError
+
+logger = logging.getLogger(__name__)
+
+
+class _Worker(object):
+    def __init__(self, index, planner):
+        self.index = index
+        self.env = None
+        self.planner = planner
+        self.busy = False
+
+
+class ParallelGoalPlanner(object):
+    """
+    Plan to a ranked list of goals in parallel.
+
+    Each attempt runs in its own thread on a clone of the planning
+    environment. The result has the same semantics as the Ranked
+    meta-planner: the trajectory to the best-ranked goal is returned as soon
+    as every higher-ranked attempt has failed. Attempts that have not started
+    yet are then cancelled. Attempts that are already running can not be
+    interrupted; they finish in the background and their results are
+    discarded.
+
+    The cloned environments are kept between calls and re-cloned from the
+    planning environment before each attempt.
+
+    Calls to the same delegate planner are serialized by the lock on its
+    environment, so delegate_planner_factory should be used to give each
+    worker its own delegate planner.
+    """
+    def __init__(self, num_workers=4, delegate_planner_factory=None):
+        """
+        @param num_workers maximum number of concurrent attempts
+        @param delegate_planner_factory optional function that creates the
+                                        delegate planner used by one worker
+        """
+        if num_workers < 1:
+            raise ValueError('There must be at least one worker.')
+
+        self.num_workers = num_workers
+        self.delegate_planner_factory = delegate_planner_factory
+
+        self._workers = []
+        self._clones = None
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.Close()
+
+    def Close(self):
+        """
+        Destroy the cloned environments. This waits for attempts that are
+        still running in the background.
+        """
+        with self._condition:
+            while any(worker.busy for worker in self._workers):
+                self._condition.wait()
+
+            if self._clones is not None:
+                self._clones.Close()
+
+            self._workers = []
+            self._clones = None
+
+    def Plan(self, robot, goals, plan_fn, delegate_planner=None):
+        """
+        Plan to each goal in parallel and return the best-ranked success.
+
+        This must be called from the thread that holds the lock on robot's
+        environment, e.g. from inside of a PlanningMethod, because that
+        environment is cloned for each attempt.
+
+        @param robot robot to plan for, with the desired active DOFs
+        @param goals list of goals, in descending order of preference
+        @param plan_fn function plan_fn(planner, robot, goal) that plans to
+                       a goal and returns a trajectory or raises PlanningError
+        @param delegate_planner planner that is passed to plan_fn when no
+                                delegate_planner_factory is set
+        @return trajectory in robot's environment
+        @raises MetaPlanningError if all of the attempts fail
+        """
+        if self.delegate_planner_factory is None:
+            if delegate_planner is None:
+                raise ValueError('Either delegate_planner or'
+                                 ' delegate_planner_factory must be set.')
+            if self.num_workers > 1:
+                logger.warning(
+                    'All of the parallel planning attempts share one delegate'
+                    ' planner; set delegate_planner_factory to run them'
+                    ' concurrently.')
+
+        num_goals = len(goals)
+        results = [ None ] * num_goals
+        completed = Queue.Queue()
+        next_index = 0
+        num_running = 0
+
+        def run(index, worker):
+            try:
+                with worker.env:
+                    cloned_robot = Cloned(robot, into=worker.env)
+                    results[index] = plan_fn(
+                        worker.planner or delegate_planner,
+                        cloned_robot, goals[index])
+            except PlanningError as e:
+                logger.warning('Planning to goal %d of %d failed: %s',
+                               index + 1, num_goals, e)
+                results[index] = e
+            except Exception as e:
+                logger.error('Planning to goal %d of %d raised: %s',
+                             index + 1, num_goals, e)
+                results[index] = e
+            finally:
+                self._ReleaseWorker(worker)
+                completed.put(index)
+
+        while True:
+            # Start as many of the remaining attempts as there are idle
+            # workers. The environment is cloned in this thread because it
+            # holds the environment lock.
+            while next_index < num_goals:
+                worker = self._AcquireWorker(block=(num_running == 0))
+                if worker is None:
+                    break
+
+                try:
+                    self._SynchronizeWorker(robot.GetEnv(), worker)
+                except Exception:
+                    self._ReleaseWorker(worker)
+                    raise
+
+                thread = threading.Thread(target=run,
+                                          args=(next_index, worker))
+                thread.daemon = True
+                thread.start()
+                next_index += 1
+                num_running += 1
+
+            if num_running == 0:
+                break
+
+            completed.get()
+            num_running -= 1
+
+            # Return the first result in rank order if all of the higher-ranked
+            # attempts failed.
+            for index, result in enumerate(results):
+                if result is None:
+                    break
+                elif isinstance(result, openravepy.Trajectory):
+                    logger.info('Planned to goal %d of %d; cancelled %d'
+                                ' attempts that had not started.',
+                                index + 1, num_goals, num_goals - next_index)
+                    return CopyTrajectory(result, env=robot.GetEnv())
+                elif not isinstance(result, PlanningError):
+                    raise result
+
+        raise MetaPlanningError(
+            'Planning to all {:d} goals failed.'.format(num_goals),
+            dict(enumerate(results)))
+
+    def _AcquireWorker(self, block):
+        """
+        Reserve an idle worker, creating one if there are fewer than
+        num_workers. Workers may still be busy with attempts from an earlier
+        call that were cancelled.
+        @param block wait for a worker to become idle
+        @return worker, or None if block is False and no worker is idle
+        """
+        with self._condition:
+            while True:
+                for worker in self._workers:
+                    if not worker.busy:
+                        worker.busy = True
+                        return worker
+
+                if len(self._workers) < self.num_workers:
+                    planner = None
+                    if self.delegate_planner_factory is not None:
+                        planner = self.delegate_planner_factory()
+
+                    worker = _Worker(len(self._workers), planner)
+                    worker.busy = True
+                    self._workers.append(worker)
+                    return worker
+
+                if not block:
+                    return None
+
+                self._condition.wait()
+
+    def _ReleaseWorker(self, worker):
+        with self._condition:
+            worker.busy = False
+            self._condition.notify_all()
+
+    def _SynchronizeWorker(self, env, worker):
+        # The pool is created for the first planning environment. Workers
+        # are only re-cloned from it, so a different environment needs a
+        # new pool.
+        with self._condition:
+            if self._clones is None:
+                self._clones = ClonePool(env, self.num_workers)
+            elif self._clones.parent_env != env:
+                raise ValueError('ParallelGoalPlanner must be closed before'
+                                 ' planning in a different environment.')
+
+        worker.env = self._clones.Clone(worker.index)
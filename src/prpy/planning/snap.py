@@ -29,6 +29,7 @@
 # POSSIBILITY OF SUCH DAMAGE.
 import numpy
 import openravepy
+from .. import ik_cache
 from ..util import SetTrajectoryTags
 from base import BasePlanner, PlanningError, PlanningMethod, Tags
 
@@ -87,11 +88,8 @@ class SnapPlanner(BasePlanner):
         # close to the configuration of the arm, so we don't need to do any
         # custom IK ranking.
         manipulator = robot.GetActiveManipulator()
-        ik_param = openravepy.IkParameterization(goal_pose, ikp.Transform6D)
-        ik_solution = manipulator.FindIKSolution(
-            ik_param, ikfo.CheckEnvCollisions,
-            ikreturn=False, releasegil=True
-        )
+        ik_solution = ik_cache.FindIKSolution(
+            manipulator, goal_pose, ikfo.CheckEnvCollisions, ikp.Transform6D)
 
         if ik_solution is None:
             raise PlanningError('There is no IK solution at the goal pose.')
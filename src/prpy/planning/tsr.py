@@ -28,20 +28,48 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 import logging
+import Queue
+import threading
 import time
 import itertools
 import numpy
 import openravepy
-from base import (BasePlanner, PlanningMethod, PlanningError,
-                  UnsupportedPlanningError)
+from base import (BasePlanner, MetaPlanningError, PlanningMethod,
+                  PlanningError, UnsupportedPlanningError)
+from parallel import ParallelGoalPlanner
 
 logger = logging.getLogger(__name__)
 
 
 class TSRPlanner(BasePlanner):
-    def __init__(self, delegate_planner=None):
+    def __init__(self, delegate_planner=None, num_ik_workers=None,
+                 ik_batch_size=4, num_planning_workers=None,
+                 delegate_planner_factory=None):
+        """
+        @param delegate_planner planner used to plan to the IK solutions,
+                                defaults to robot.planner
+        @param num_ik_workers number of cloned environments used to solve IK
+                              in parallel; IK is solved serially if None
+        @param ik_batch_size number of poses solved by each IK worker at once
+        @param num_planning_workers number of IK solution sets to plan to in
+                                    parallel; sets are tried one at a time if
+                                    None
+        @param delegate_planner_factory optional function that creates a
+                                        delegate planner for each parallel
+                                        planning worker
+        """
         super(TSRPlanner, self).__init__()
         self.delegate_planner = delegate_planner
+        self.num_ik_workers = num_ik_workers
+        self.ik_batch_size = ik_batch_size
+        self._ik_solvers = dict()
+
+        if num_planning_workers is not None:
+            self._goal_planner = ParallelGoalPlanner(
+                num_workers=num_planning_workers,
+                delegate_planner_factory=delegate_planner_factory)
+        else:
+            self._goal_planner = None
 
     def __str__(self):
         if self.delegate_planner is not None:
@@ -64,7 +92,8 @@ class TSRPlanner(BasePlanner):
     @PlanningMethod
     def PlanToTSR(self, robot, tsrchains, tsr_timeout=2.0,
                   num_attempts=3, chunk_size=1, ranker=None,
-                  max_deviation=2*numpy.pi, **kw_args):
+                  max_deviation=2*numpy.pi, tsr_sampler=None,
+                  streaming=False, **kw_args):
         """
         Plan to a desired TSR set using a-priori goal sampling.  This planner
         samples a fixed number of goals from the specified TSRs up-front, then
@@ -83,6 +112,14 @@ class TSRPlanner(BasePlanner):
         @param ranker an IK ranking function to use over the IK solutions
         @param max_deviation the maximum per-joint deviation from current pose
                              that can be considered a valid sample.
+        @param tsr_sampler sampler used to draw goal poses, e.g. a
+                           prpy.tsr.HaltonSampler to spread out the samples;
+                           defaults to independent uniform samples
+        @param streaming start planning as soon as the first IK solutions are
+                         found instead of sampling for all of tsr_timeout;
+                         IK solutions are generated in a background thread
+                         and re-ranked before each planning attempt; this
+                         can not be combined with num_planning_workers
         @return traj a trajectory that satisfies the specified TSR chains
         """
         # Delegate to robot.planner by default.
@@ -105,26 +142,24 @@ class TSRPlanner(BasePlanner):
                     'Cannot handle start or trajectory-wide TSR constraints.')
         tsrchains = [t for t in tsrchains if t.sample_goal]
 
-        # Create an iterator that cycles through each TSR chain.
-        tsr_cycler = itertools.cycle(tsrchains)
-
         # Create an iterator that cycles TSR chains until the timelimit.
         tsr_timelimit = time.time() + tsr_timeout
         tsr_sampler = itertools.takewhile(
-            lambda v: time.time() < tsr_timelimit, tsr_cycler)
+            lambda v: time.time() < tsr_timelimit,
+            self._SampleTSRChains(tsrchains, sampler=tsr_sampler))
+
+        if streaming:
+            if self._goal_planner is not None:
+                raise ValueError('Streaming can not be combined with parallel'
+                                 ' planning.')
+
+            return self._PlanToTSRStreaming(
+                robot, manipulator, tsr_sampler, ranker, delegate_planner,
+                num_attempts, chunk_size, **kw_args)
 
         # Sample a list of TSR poses and collate valid IK solutions.
-        from openravepy import (IkFilterOptions,
-                                IkParameterization,
-                                IkParameterizationType)
         ik_solutions = []
-        for tsrchain in tsr_sampler:
-            ik_param = IkParameterization(
-                tsrchain.sample(), IkParameterizationType.Transform6D)
-            ik_solution = manipulator.FindIKSolutions(
-                ik_param, IkFilterOptions.CheckEnvCollisions,
-                ikreturn=False, releasegil=True
-            )
+        for ik_solution in self._GenerateIKSolutions(manipulator, tsr_sampler):
             if ik_solution.shape[0] > 0:
                 ik_solutions.append(ik_solution)
 
@@ -157,15 +192,33 @@ class TSRPlanner(BasePlanner):
         with robot.CreateRobotStateSaver(p.ActiveDOF):
             robot.SetActiveDOFs(manipulator.GetArmIndices())
 
+            # Plan to the top solution sets in parallel and return the
+            # trajectory to the best-ranked set that succeeds.
+            if self._goal_planner is not None:
+                arm_indices = manipulator.GetArmIndices()
+                planner_args = dict(kw_args, defer=False)
+
+                def plan_fn(planner, cloned_robot, ik_set):
+                    cloned_robot.SetActiveDOFs(arm_indices)
+                    return self._PlanToIKSet(
+                        cloned_robot, planner, ik_set, **planner_args)
+
+                try:
+                    return self._goal_planner.Plan(
+                        robot, ranked_ik_solution_sets[:num_attempts],
+                        plan_fn, delegate_planner=delegate_planner)
+                except MetaPlanningError as e:
+                    raise MetaPlanningError(
+                        'Planning to the top {:d} of {:d} IK solution sets'
+                        ' failed.'.format(num_attempts,
+                                          len(ranked_ik_solution_sets)),
+                        e.errors)
+
             # Try planning to each solution set in descending cost order.
             for i, ik_set in ik_set_list:
                 try:
-                    if ik_set.shape[0] > 1:
-                        traj = delegate_planner.PlanToConfigurations(
-                            robot, ik_set, **kw_args)
-                    else:
-                        traj = delegate_planner.PlanToConfiguration(
-                            robot, ik_set[0], **kw_args)
+                    traj = self._PlanToIKSet(
+                        robot, delegate_planner, ik_set, **kw_args)
 
                     logger.info('Planned to IK solution set %d of %d.',
                                 i + 1, num_attempts)
@@ -179,3 +232,283 @@ class TSRPlanner(BasePlanner):
         raise PlanningError(
             'Planning to the top {:d} of {:d} IK solution sets failed.'
             .format(num_attempts, len(ranked_ik_solution_sets)))
+
+    def _PlanToTSRStreaming(self, robot, manipulator, tsr_poses, ranker,
+                            delegate_planner, num_attempts, chunk_size,
+                            **kw_args):
+        """
+        Plan to IK solutions while they are being generated.
+
+        A producer thread computes IK solutions for tsr_poses in a clone of
+        the planning environment (or with the parallel IK solver, if
+        num_ik_workers is set) and pushes them onto a queue. This thread
+        ranks the solutions as they arrive and plans to the best chunk of
+        untried solutions as soon as one is available. Production stops as
+        soon as a plan succeeds.
+        """
+        from ..clone import ClonePool, Cloned
+
+        solution_queue = Queue.Queue()
+        stop_event = threading.Event()
+        producer_errors = []
+
+        def publish(ik_solutions):
+            for ik_solution in ik_solutions:
+                if stop_event.is_set():
+                    break
+                if ik_solution.shape[0] > 0:
+                    solution_queue.put(ik_solution)
+
+        def produce():
+            try:
+                if clones is None:
+                    publish(self._GenerateIKSolutions(
+                        manipulator, tsr_poses, synchronize=False))
+                else:
+                    with clones[0]:
+                        cloned_manipulator = Cloned(
+                            manipulator, into=clones[0])
+                        publish(self._GenerateIKSolutions(
+                            cloned_manipulator, tsr_poses))
+            except Exception as e:
+                logger.warning('Generating IK solutions failed: %s', e)
+                producer_errors.append(e)
+            finally:
+                # Signal the end of production.
+                solution_queue.put(None)
+
+        num_dof = len(manipulator.GetArmIndices())
+        candidates = numpy.zeros((0, num_dof))
+        num_solutions = 0
+        num_tried = 0
+        is_producing = True
+
+        # The parallel IK solver has its own clones, but they must be
+        # synchronized here because this thread holds the environment lock.
+        if self.num_ik_workers is None:
+            clones = ClonePool(self.env, 1)
+            clones.Clone(0)
+        else:
+            clones = None
+            self._GetIKSolver(manipulator).Synchronize()
+
+        producer = threading.Thread(target=produce)
+        producer.daemon = True
+        try:
+            producer.start()
+
+            p = openravepy.KinBody.SaveParameters
+            with robot.CreateRobotStateSaver(p.ActiveDOF):
+                robot.SetActiveDOFs(manipulator.GetArmIndices())
+
+                while num_tried < num_attempts:
+                    # Wait for a full chunk of solutions, then collect any
+                    # others that arrived in the meantime.
+                    new_solutions = []
+                    while is_producing:
+                        if candidates.shape[0] + num_solutions < chunk_size:
+                            ik_solution = solution_queue.get()
+                        else:
+                            try:
+                                ik_solution = solution_queue.get_nowait()
+                            except Queue.Empty:
+                                break
+
+                        if ik_solution is None:
+                            is_producing = False
+                        else:
+                            new_solutions.append(ik_solution)
+                            num_solutions += ik_solution.shape[0]
+
+                    if new_solutions:
+                        candidates = numpy.vstack([ candidates ] + new_solutions)
+                        num_solutions = 0
+
+                    # Re-rank all of the untried solutions together, since
+                    # some rankers (e.g. RankingPipeline with tie breakers)
+                    # only produce scores that are comparable within one
+                    # call. Infinite cost solutions are assumed to be
+                    # infeasible.
+                    scores = ranker(robot, candidates)
+                    valid_idxs = ~numpy.isposinf(scores)
+                    candidates = candidates[valid_idxs, :]
+                    scores = scores[valid_idxs]
+
+                    if candidates.shape[0] == 0:
+                        if is_producing:
+                            continue
+                        break
+
+                    # Plan to the best untried chunk.
+                    ranked_indices = numpy.argsort(scores)
+                    chunk_indices = ranked_indices[:chunk_size]
+                    ik_set = candidates[chunk_indices, :]
+                    candidates = candidates[ranked_indices[chunk_size:], :]
+                    num_tried += 1
+
+                    try:
+                        traj = self._PlanToIKSet(
+                            robot, delegate_planner, ik_set, **kw_args)
+
+                        logger.info('Planned to IK solution set %d of %d.',
+                                    num_tried, num_attempts)
+                        return traj
+                    except PlanningError as e:
+                        logger.warning(
+                            'Planning to IK solution set %d of %d failed: %s',
+                            num_tried, num_attempts, e)
+        finally:
+            stop_event.set()
+            if producer.is_alive():
+                producer.join()
+            if clones is not None:
+                clones.Close()
+
+        if num_tried == 0:
+            if producer_errors:
+                raise PlanningError('Generating IK solutions failed: {!s}'
+                                    .format(producer_errors[0]))
+            raise PlanningError('No collision-free IK solutions at goal TSRs.')
+
+        raise PlanningError(
+            'Planning to the top {:d} IK solution sets failed.'
+            .format(num_tried))
+
+    def _GenerateIKSolutions(self, manipulator, tsr_poses, synchronize=True):
+        """
+        Generate the collision-free IK solutions for a sequence of poses.
+
+        If num_ik_workers is set, the poses are solved in batches by a
+        ParallelIKSolver and each batch of solutions is deduplicated.
+
+        @param manipulator manipulator to solve IK for
+        @param tsr_poses iterable of 4x4 end-effector poses
+        @param synchronize synchronize the parallel IK solver before each batch
+        @return generator of (N, dof) arrays of IK solutions
+        """
+        reachability_map = getattr(manipulator, 'reachability_map', None)
+        if reachability_map is not None:
+            tsr_poses = self._OrderByReachability(
+                manipulator, reachability_map, tsr_poses)
+
+        if self.num_ik_workers is None:
+            for tsr_pose in tsr_poses:
+                yield self._FindIKSolutions(manipulator, tsr_pose)
+            return
+
+        ik_solver = self._GetIKSolver(manipulator)
+        batch_size = ik_solver.num_workers * self.ik_batch_size
+        tsr_poses = iter(tsr_poses)
+
+        while True:
+            batch_poses = list(itertools.islice(tsr_poses, batch_size))
+            if not batch_poses:
+                break
+
+            yield ik_solver.FindIKSolutions(batch_poses,
+                                            synchronize=synchronize)
+
+    @staticmethod
+    def _OrderByReachability(manipulator, reachability_map, tsr_poses,
+                             batch_size=64):
+        """
+        Order poses by the manipulator's reachability map.
+
+        Poses are scored batch_size at a time. Each batch is reordered so the
+        poses with the highest reachability scores are solved first. The map
+        is built from random samples, so poses with a score of zero may still
+        be reachable; they are kept, in sample order, at the end of the batch.
+
+        @param manipulator manipulator to solve IK for
+        @param reachability_map prpy.reachability.ReachabilityMap
+        @param tsr_poses iterable of 4x4 end-effector poses
+        @param batch_size number of poses to score at once
+        @return generator of 4x4 poses
+        """
+        tsr_poses = iter(tsr_poses)
+
+        while True:
+            batch_poses = numpy.array(
+                list(itertools.islice(tsr_poses, batch_size)))
+            if batch_poses.shape[0] == 0:
+                break
+
+            scores = reachability_map.GetScores(
+                batch_poses, manipulator.GetBase().GetTransform())
+            # mergesort is stable, so ties stay in sample order.
+            ranked_indices = numpy.argsort(-scores, kind='mergesort')
+
+            logger.debug('%d of %d TSR samples are outside of the'
+                         ' reachability map.',
+                         numpy.sum(scores <= 0.), batch_poses.shape[0])
+
+            for index in ranked_indices:
+                yield batch_poses[index]
+
+    def _GetIKSolver(self, manipulator):
+        from ..ik_parallel import ParallelIKSolver
+
+        key = (manipulator.GetRobot().GetName(), manipulator.GetName())
+        ik_solver = self._ik_solvers.get(key)
+
+        if ik_solver is None:
+            ik_solver = ParallelIKSolver(manipulator,
+                                         num_workers=self.num_ik_workers)
+            self._ik_solvers[key] = ik_solver
+
+        return ik_solver
+
+    @staticmethod
+    def _FindIKSolutions(manipulator, tsr_pose):
+        """
+        Compute the collision-free IK solutions for a pose.
+        @param manipulator manipulator to solve IK for
+        @param tsr_pose 4x4 end-effector pose
+        @return (N, dof) array of IK solutions
+        """
+        from openravepy import IkFilterOptions, IkParameterizationType
+        from ..ik_cache import FindIKSolutions
+
+        return FindIKSolutions(manipulator, tsr_pose,
+                               IkFilterOptions.CheckEnvCollisions,
+                               IkParameterizationType.Transform6D)
+
+    @staticmethod
+    def _PlanToIKSet(robot, delegate_planner, ik_set, **kw_args):
+        """
+        Plan to a set of IK solutions with the delegate planner.
+        @param robot robot to plan for, with the arm DOFs active
+        @param delegate_planner planner to call
+        @param ik_set (N, dof) array of goal configurations
+        @return trajectory to one of the configurations
+        """
+        if ik_set.shape[0] > 1:
+            return delegate_planner.PlanToConfigurations(
+                robot, ik_set, **kw_args)
+        else:
+            return delegate_planner.PlanToConfiguration(
+                robot, ik_set[0], **kw_args)
+
+    @staticmethod
+    def _SampleTSRChains(tsrchains, batch_size=16, sampler=None):
+        """
+        Generate an infinite sequence of poses sampled from TSR chains.
+
+        Chains are sampled in round-robin order. Poses are drawn from each
+        chain batch_size at a time using TSRChain.sample_batch.
+
+        @param tsrchains list of TSR chains
+        @param batch_size number of poses to sample from each chain at once
+        @param sampler optional sampler passed to TSRChain.sample_batch
+        @return generator of 4x4 poses
+        """
+        if not tsrchains:
+            return
+
+        while True:
+            batches = [ tsrchain.sample_batch(batch_size, sampler=sampler)
+                        for tsrchain in tsrchains ]
+
+            for i in xrange(batch_size):
+                for batch in batches:
+                    yield batch[i]
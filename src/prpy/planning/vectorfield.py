@@ -94,7 +94,7 @@ class VectorFieldPlanner(BasePlanner):
             return Status.CONTINUE
 
         traj = self.FollowVectorField(robot, vf_geodesic, CloseEnough,
-                                      timelimit)
+                                      timelimit, **kw_args)
 
         # Flag this trajectory as unconstrained. This overwrites the
         # constrained flag set by FollowVectorField.
@@ -187,10 +187,27 @@ class VectorFieldPlanner(BasePlanner):
 
     @PlanningMethod
     def FollowVectorField(self, robot, fn_vectorfield, fn_terminate,
-                          timelimit=5.0, dt_multiplier=1.01, **kw_args):
+                          timelimit=5.0, dt_multiplier=1.01, adaptive=False,
+                          integration_tolerance=0.5, max_dt_multiplier=100.,
+                          use_distance=False, **kw_args):
         """
         Follow a joint space vectorfield to termination.
 
+        By default, the vector field is integrated with forward Euler steps of
+        a fixed duration. If adaptive is True, an embedded Heun-Euler (RK2(1))
+        integrator is used instead: the step duration grows while the
+        difference between the two estimates stays below
+        integration_tolerance and shrinks when it does not. Steps that cross a
+        boundary reported by fn_terminate (a change in status or a constraint
+        violation) are also shrunk back towards the fixed step, so
+        fn_terminate must not have side effects in this mode. In both modes,
+        the robot is collision checked at DOF resolution along every step.
+
+        If use_distance is True and the collision checker supports distance
+        queries, collision checks are skipped while the robot's links provably
+        cannot have reached the nearest obstacle. The number of performed and
+        skipped checks is stored in the trajectory tags.
+
         @param robot
         @param fn_vectorfield a vectorfield of joint velocities
         @param fn_terminate custom termination condition
@@ -199,19 +216,31 @@ class VectorFieldPlanner(BasePlanner):
                the vector field will be followed. Defaults to 1.0.
                Any larger value means the vectorfield will be re-evaluated
                floor(dt_multiplier) steps
+        @param adaptive use an adaptive step integrator
+        @param integration_tolerance maximum local integration error, in
+               multiples of DOF resolution, accepted in adaptive mode
+        @param max_dt_multiplier largest step, as a multiple of the fixed
+               step, taken in adaptive mode
+        @param use_distance skip collision checks using distance queries
         @param kw_args keyword arguments to be passed to fn_vectorfield
         @return traj
         """
-        from .exceptions import (
-            CollisionPlanningError,
-            SelfCollisionPlanningError,
-            TimeoutPlanningError
-        )
+        from .collision import DistanceCollisionChecker
+        from .exceptions import TimeoutPlanningError
+
+        if integration_tolerance <= 0:
+            raise ValueError('Integration tolerance must be positive.')
+        elif max_dt_multiplier < 1:
+            raise ValueError('Maximum dt multiplier must be at least one.')
 
         start_time = time.time()
 
+        # Store the cached trajectory in a list so follow_step can set it.
+        cached_traj = [None]
+
         try:
-            with robot:
+            with robot, DistanceCollisionChecker(
+                    robot, use_distance=use_distance) as checker:
                 manip = robot.GetActiveManipulator()
                 robot.SetActiveDOFs(manip.GetArmIndices())
                 # Populate joint positions and joint velocities
@@ -222,41 +251,32 @@ class VectorFieldPlanner(BasePlanner):
                 qtraj = openravepy.RaveCreateTrajectory(self.env,
                                                         'GenericTrajectory')
                 qtraj.Init(cspec)
-                cached_traj = None
 
+                resolutions = robot.GetActiveDOFResolutions()
                 vlimits = robot.GetDOFVelocityLimits(robot.GetActiveDOFIndices())
-                dt_step = min(robot.GetActiveDOFResolutions() /
-                              vlimits)
+                dt_step = min(resolutions / vlimits)
                 dt_step *= dt_multiplier
+                dt_max = dt_step * max_dt_multiplier
                 status = fn_terminate()
                 report = openravepy.CollisionReport()
 
-                while status != Status.TERMINATE:
-                    # Check for a timeout.
-                    current_time = time.time()
-                    if (timelimit is not None and
-                            current_time - start_time > timelimit):
-                        raise TimeoutPlanningError(timelimit)
-
-                    dqout = fn_vectorfield()
-                    numsteps = int(math.floor(max(
-                        abs(dqout*dt_step/robot.GetActiveDOFResolutions())
-                        )))
-                    if numsteps == 0:
-                        raise PlanningError('Step size too small,'
-                                            ' unable to progress')
-                    dt = dt_step/numsteps
+                def follow_step(dqout, dt, numsteps):
+                    """
+                    Take numsteps steps of duration dt along dqout, checking
+                    collision and termination before each step.
+                    """
+                    status = Status.CONTINUE
 
                     for step in xrange(numsteps):
                         # Check for collisions.
-                        if self.env.CheckCollision(robot, report):
-                            raise CollisionPlanningError.FromReport(report)
-                        if robot.CheckSelfCollision(report):
-                            raise SelfCollisionPlanningError.FromReport(report)
+                        checker.CheckCollision(report)
 
                         status = fn_terminate()
                         if status == Status.CACHE_AND_CONTINUE:
-                            cached_traj = util.CopyTrajectory(qtraj)
+                            cached_traj[:] = [util.CopyTrajectory(qtraj)]
+                            util.SetTrajectoryTags(
+                                cached_traj[0], checker.GetTags(),
+                                append=True)
                         if status == Status.TERMINATE:
                             break
 
@@ -271,14 +291,87 @@ class VectorFieldPlanner(BasePlanner):
                         qnew = q_curr + dt*dqout
                         robot.SetActiveDOFValues(qnew)
 
+                    return status
+
+                def heun_step(dt):
+                    """
+                    Evaluate one Heun-Euler step of duration dt from the
+                    current configuration without moving the robot.
+
+                    @return dqout average joint velocity over the step
+                    @return error integration error in units of resolution
+                    @return crossing whether fn_terminate changes its status
+                            (or raises) at the end of the step
+                    """
+                    q_curr = robot.GetActiveDOFValues()
+                    try:
+                        k1 = fn_vectorfield()
+                        robot.SetActiveDOFValues(q_curr + dt*k1)
+                        k2 = fn_vectorfield()
+                        dqout = 0.5*(k1 + k2)
+                        error = max(abs(0.5*dt*(k2 - k1)) / resolutions)
+
+                        robot.SetActiveDOFValues(q_curr + dt*dqout)
+                        try:
+                            crossing = fn_terminate() != status
+                        except PlanningError:
+                            crossing = True
+                    finally:
+                        robot.SetActiveDOFValues(q_curr)
+
+                    return dqout, error, crossing
+
+                dt_adaptive = dt_step
+
+                while status != Status.TERMINATE:
+                    # Check for a timeout.
+                    current_time = time.time()
+                    if (timelimit is not None and
+                            current_time - start_time > timelimit):
+                        raise TimeoutPlanningError(timelimit)
+
+                    if adaptive:
+                        dqout, error, crossing = heun_step(dt_adaptive)
+                        scale = 0.9 * math.sqrt(
+                            integration_tolerance / max(error, 1e-9))
+
+                        # Reject the step and try again with a shorter one.
+                        # Steps no longer than the fixed step are always
+                        # accepted since they are checked at resolution.
+                        if ((error > integration_tolerance or crossing)
+                                and dt_adaptive > dt_step):
+                            if crossing:
+                                scale = min(scale, 0.5)
+                            dt_adaptive = max(dt_adaptive*max(scale, 0.2),
+                                              dt_step)
+                            continue
+
+                        dt = dt_adaptive
+                        if not crossing:
+                            dt_adaptive = min(max(dt_adaptive*min(scale, 2.),
+                                                  dt_step), dt_max)
+                    else:
+                        dqout = fn_vectorfield()
+                        dt = dt_step
+
+                    numsteps = int(math.floor(max(
+                        abs(dqout*dt/resolutions)
+                        )))
+                    if numsteps == 0:
+                        raise PlanningError('Step size too small,'
+                                            ' unable to progress')
+
+                    status = follow_step(dqout, dt/numsteps, numsteps)
+
         except PlanningError as e:
-            if cached_traj is not None:
+            if cached_traj[0] is not None:
                 logger.warning('Terminated early: %s', e.message)
-                return cached_traj
+                return cached_traj[0]
             else:
                 raise
 
         # TODO: Flag this trajectory as timed.
         util.SetTrajectoryTags(qtraj, {Tags.CONSTRAINED: 'true'}, append=True)
+        util.SetTrajectoryTags(qtraj, checker.GetTags(), append=True)
 
         return qtraj
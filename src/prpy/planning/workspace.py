@@ -33,12 +33,152 @@ import logging
 import numpy
 import openravepy
 import time
-from ..util import SetTrajectoryTags
+from .. import ik_cache
+from ..util import GeodesicTwist, SetTrajectoryTags
 from base import BasePlanner, PlanningError, PlanningMethod, Tags
 
 logger = logging.getLogger(__name__)
 
 
+class WorkspacePathIKSolver(object):
+    """
+    IK solver for end-effector poses sampled along a workspace path.
+
+    If warm_start is True, each query first tries a few damped
+    Jacobian-pseudoinverse iterations seeded from the given configuration and
+    only calls the manipulator's analytic solver (FindIKSolution) if they do
+    not converge to a collision-free solution. Solutions are cached by path
+    time, so repeated queries for the same time (e.g. while bisecting) reuse
+    them. The solver expects the robot's active DOFs to be the arm indices of
+    its active manipulator.
+    """
+    def __init__(self, robot, traj, warm_start=True, max_iterations=10,
+                 damping=1e-3, position_tolerance=1e-5,
+                 angular_tolerance=1e-4):
+        self.robot = robot
+        self.env = robot.GetEnv()
+        self.manip = robot.GetActiveManipulator()
+        self.traj = traj
+        self.warm_start = warm_start
+        self.max_iterations = max_iterations
+        self.damping = damping
+        self.position_tolerance = position_tolerance
+        self.angular_tolerance = angular_tolerance
+
+        self.resolutions = robot.GetActiveDOFResolutions()
+        self.lower_limits, self.upper_limits = robot.GetActiveDOFLimits()
+
+        self.num_analytic = 0
+        self.num_local = 0
+        self.num_cache_hits = 0
+
+        # Map from path time to a list of solutions and whether the analytic
+        # solver failed at that time.
+        self._solutions = dict()
+        self._analytic_failed = set()
+
+    def GetPose(self, t):
+        return openravepy.matrixFromPose(self.traj.Sample(t)[0:7])
+
+    def Solve(self, t, q_seed):
+        """
+        Find a collision-free IK solution at path time t near q_seed.
+
+        @param t time along the workspace path
+        @param q_seed seed configuration, typically the current one
+        @return IK solution or None if none was found
+        """
+        key = round(t, 12)
+        solutions = self._solutions.setdefault(key, [])
+
+        # Reuse a cached solution if it is within resolution of the seed.
+        if solutions:
+            q_cached = min(solutions,
+                           key=lambda q: max(abs(q - q_seed)))
+            if all(abs(q_cached - q_seed) <= self.resolutions):
+                self.num_cache_hits += 1
+                return q_cached
+
+        pose = self.GetPose(t)
+
+        if self.warm_start:
+            q_local = self.SolveLocal(pose, q_seed)
+            if q_local is not None:
+                solutions.append(q_local)
+                return q_local
+
+        if key in self._analytic_failed:
+            self.num_cache_hits += 1
+            return None
+
+        self.num_analytic += 1
+        with self.robot:
+            self.robot.SetActiveDOFValues(q_seed)
+            q_analytic = ik_cache.FindIKSolution(
+                self.manip, pose,
+                openravepy.IkFilterOptions.CheckEnvCollisions)
+
+        if q_analytic is None:
+            self._analytic_failed.add(key)
+        else:
+            solutions.append(q_analytic)
+
+        return q_analytic
+
+    def SolveLocal(self, pose, q_seed):
+        """
+        Solve IK with damped Jacobian-pseudoinverse iterations from q_seed.
+
+        @param pose desired end-effector pose
+        @param q_seed seed configuration
+        @return collision-free IK solution or None if none was found
+        """
+        self.num_local += 1
+
+        with self.robot:
+            q = numpy.array(q_seed, dtype=float)
+
+            for _ in xrange(self.max_iterations):
+                self.robot.SetActiveDOFValues(q)
+                twist = GeodesicTwist(self.manip.GetEndEffectorTransform(),
+                                      pose)
+
+                if (numpy.linalg.norm(twist[0:3]) < self.position_tolerance
+                        and numpy.linalg.norm(twist[3:6])
+                            < self.angular_tolerance):
+                    break
+
+                jacobian = numpy.vstack((
+                    self.manip.CalculateJacobian(),
+                    self.manip.CalculateAngularVelocityJacobian()))
+                JJt = numpy.dot(jacobian, jacobian.T)
+                dq = numpy.dot(jacobian.T, numpy.linalg.solve(
+                    JJt + self.damping**2 * numpy.eye(JJt.shape[0]), twist))
+                q = q + dq
+            else:
+                return None
+
+            if (numpy.any(q < self.lower_limits)
+                    or numpy.any(q > self.upper_limits)):
+                return None
+            elif (self.env.CheckCollision(self.robot)
+                    or self.robot.CheckSelfCollision()):
+                return None
+
+            return q
+
+    def GetTags(self):
+        """
+        Get trajectory tags that describe the IK queries performed.
+        @return dictionary of tags
+        """
+        return {
+            Tags.IK_ANALYTIC_CALLS: self.num_analytic,
+            Tags.IK_LOCAL_CALLS: self.num_local,
+            Tags.IK_CACHE_HITS: self.num_cache_hits,
+        }
+
+
 class GreedyIKPlanner(BasePlanner):
     def __init__(self):
         super(GreedyIKPlanner, self).__init__()
@@ -80,7 +220,7 @@ class GreedyIKPlanner(BasePlanner):
                 maxaccelerations=0.1*numpy.ones(7)
             )
 
-        return self.PlanWorkspacePath(robot, traj, timelimit)
+        return self.PlanWorkspacePath(robot, traj, timelimit, **kw_args)
 
     @PlanningMethod
     def PlanToEndEffectorOffset(self, robot, direction, distance,
@@ -137,22 +277,40 @@ class GreedyIKPlanner(BasePlanner):
             )
 
         return self.PlanWorkspacePath(robot, traj,
-                                      timelimit, min_waypoint_index=1)
+                                      timelimit, min_waypoint_index=1,
+                                      **kw_args)
 
     @PlanningMethod
     def PlanWorkspacePath(self, robot, traj, timelimit=5.0,
-                          min_waypoint_index=None, **kw_args):
+                          min_waypoint_index=None, warm_start=False,
+                          num_segments=1, **kw_args):
         """
         Plan a configuration space path given a workspace path.
         All timing information is ignored.
+
+        If warm_start is True, IK is first solved locally with the Jacobian
+        pseudoinverse, seeded from the current configuration, and the analytic
+        IK solver is only called if that fails. The number of analytic and
+        local IK calls is stored in the trajectory tags.
+
+        If num_segments is greater than one, the workspace path is split into
+        that many segments of equal duration. The boundaries are seeded with
+        IK solutions on consistent branches and the segments are solved in
+        parallel in cloned environments. If any segment fails, or the segments
+        do not join within DOF resolution, the whole path is re-planned
+        sequentially.
+
         @param robot
         @param traj workspace trajectory
                     represented as OpenRAVE AffineTrajectory
         @param min_waypoint_index minimum waypoint index to reach
         @param timelimit timeout in seconds
+        @param warm_start try local IK before analytic IK
+        @param num_segments number of segments to solve in parallel
         @return qtraj configuration space path
         """
-        from .exceptions import TimeoutPlanningError
+        if num_segments < 1:
+            raise ValueError('Number of segments must be positive.')
 
         with robot:
             manip = robot.GetActiveManipulator()
@@ -163,51 +321,36 @@ class GreedyIKPlanner(BasePlanner):
             qtraj.Init(manip.GetArmConfigurationSpecification())
             qtraj.Insert(0, robot.GetActiveDOFValues())
 
-            # Initial search for workspace path timing: one huge step.
-            t = 0.
-            dt = traj.GetDuration()
+            start_time = time.time()
 
-            # Smallest CSpace step at which to give up
-            min_step = min(robot.GetActiveDOFResolutions())/100.
-            ik_options = openravepy.IkFilterOptions.CheckEnvCollisions
+            if num_segments > 1:
+                result = self._PlanWorkspacePathSegments(
+                    robot, traj, num_segments, start_time, timelimit,
+                    warm_start)
 
-            start_time = time.time()
-            epsilon = 1e-6
+                if result is not None:
+                    waypoints, ik_tags = result
+                    for q in waypoints:
+                        qtraj.Insert(qtraj.GetNumWaypoints(), q)
+
+                    SetTrajectoryTags(qtraj, {Tags.CONSTRAINED: True},
+                                      append=True)
+                    SetTrajectoryTags(qtraj, ik_tags, append=True)
+                    return qtraj
+
+                logger.info('Solving %d segments in parallel failed; falling'
+                            ' back on solving the path sequentially.',
+                            num_segments)
+
+            ik_solver = WorkspacePathIKSolver(robot, traj,
+                                              warm_start=warm_start)
+            t = 0.
 
             try:
-                while t < traj.GetDuration() + epsilon:
-                    # Check for a timeout.
-                    current_time = time.time()
-                    if (timelimit is not None and
-                            current_time - start_time > timelimit):
-                        raise TimeoutPlanningError(timelimit)
-
-                    # Hypothesize new configuration as closest IK to current
-                    qcurr = robot.GetActiveDOFValues()  # Configuration at t.
-                    qnew = manip.FindIKSolution(
-                        openravepy.matrixFromPose(traj.Sample(t+dt)[0:7]),
-                        ik_options,
-                        ikreturn=False,
-                        releasegil=True
-                    )
-
-                    # Check if the step was within joint DOF resolution.
-                    infeasible_step = True
-                    if qnew is not None:
-                        # Found an IK
-                        step = abs(qnew - qcurr)
-                        if (max(step) < min_step) and qtraj:
-                            raise PlanningError('Not making progress.')
-                        infeasible_step = any(step > robot.GetActiveDOFResolutions())
-                    if infeasible_step:
-                        # Backtrack and try half the step
-                        dt = dt/2.0
-                    else:
-                        # Move forward to new trajectory time.
-                        robot.SetActiveDOFValues(qnew)
-                        qtraj.Insert(qtraj.GetNumWaypoints(), qnew)
-                        t = min(t + dt, traj.GetDuration())
-                        dt = dt*2.0
+                for t, qnew in self._FollowWorkspacePath(
+                        robot, ik_solver, 0., traj.GetDuration(),
+                        start_time, timelimit):
+                    qtraj.Insert(qtraj.GetNumWaypoints(), qnew)
 
             except PlanningError as e:
                 # Compute the min acceptable time from the min waypoint index.
@@ -228,4 +371,155 @@ class GreedyIKPlanner(BasePlanner):
 
         # Return as much of the trajectory as we have solved.
         SetTrajectoryTags(qtraj, {Tags.CONSTRAINED: True}, append=True)
+        SetTrajectoryTags(qtraj, ik_solver.GetTags(), append=True)
         return qtraj
+
+    @staticmethod
+    def _FollowWorkspacePath(robot, ik_solver, t_start, t_end, start_time,
+                             timelimit):
+        """
+        Greedily follow a workspace path from the robot's current
+        configuration, which must correspond to t_start, to t_end.
+
+        This is a generator that moves the robot and yields (t, q) for each
+        configuration it accepts along the way.
+        """
+        from .exceptions import TimeoutPlanningError
+
+        # Initial search for workspace path timing: one huge step.
+        t = t_start
+        dt = t_end - t_start
+
+        # Smallest CSpace step at which to give up
+        resolutions = robot.GetActiveDOFResolutions()
+        min_step = min(resolutions)/100.
+
+        while t < t_end:
+            # Check for a timeout.
+            current_time = time.time()
+            if (timelimit is not None and
+                    current_time - start_time > timelimit):
+                raise TimeoutPlanningError(timelimit)
+
+            # Hypothesize new configuration as closest IK to current
+            qcurr = robot.GetActiveDOFValues()  # Configuration at t.
+            t_next = min(t + dt, t_end)
+            qnew = ik_solver.Solve(t_next, qcurr)
+
+            # Check if the step was within joint DOF resolution.
+            infeasible_step = True
+            if qnew is not None:
+                # Found an IK
+                step = abs(qnew - qcurr)
+                if max(step) < min_step:
+                    raise PlanningError('Not making progress.')
+                infeasible_step = any(step > resolutions)
+            if infeasible_step:
+                # Backtrack and try half the step
+                dt = dt/2.0
+            else:
+                # Move forward to new trajectory time.
+                robot.SetActiveDOFValues(qnew)
+                t = t_next
+                dt = dt*2.0
+                yield t, qnew
+
+    def _PlanWorkspacePathSegments(self, robot, traj, num_segments,
+                                   start_time, timelimit, warm_start):
+        """
+        Solve a workspace path as num_segments segments in parallel.
+
+        The segments are solved in private threads, not on an executor,
+        because this is usually called from a PlanningMethod that is itself
+        running on the default executor.
+
+        @return (waypoints, tags) or None if the segments could not be solved
+                or stitched together
+        """
+        from .exceptions import TimeoutPlanningError
+        from ..clone import ClonePool, Cloned
+        from ..util import CopyTrajectory
+
+        manip = robot.GetActiveManipulator()
+        resolutions = robot.GetActiveDOFResolutions()
+        boundary_times = numpy.linspace(0., traj.GetDuration(),
+                                        num_segments + 1)
+
+        # Seed each boundary with the IK solution that is closest to the
+        # previous boundary so that all segments stay on one IK branch.
+        boundary_configs = [robot.GetActiveDOFValues()]
+        for t in boundary_times[1:-1]:
+            if (timelimit is not None and
+                    time.time() - start_time > timelimit):
+                raise TimeoutPlanningError(timelimit)
+
+            ik_solutions = ik_cache.FindIKSolutions(
+                manip, openravepy.matrixFromPose(traj.Sample(t)[0:7]),
+                openravepy.IkFilterOptions.CheckEnvCollisions)
+            if len(ik_solutions) == 0:
+                logger.debug('No IK solution at segment boundary t = %f.', t)
+                return None
+
+            distances = numpy.sum((ik_solutions - boundary_configs[-1])**2,
+                                  axis=1)
+            boundary_configs.append(ik_solutions[numpy.argmin(distances)])
+
+        def solve_segment(cloned_env, segment):
+            cloned_traj, index = segment
+
+            with cloned_env:
+                cloned_robot = Cloned(robot, into=cloned_env)
+                cloned_robot.SetActiveDOFValues(boundary_configs[index])
+                ik_solver = WorkspacePathIKSolver(cloned_robot, cloned_traj,
+                                                  warm_start=warm_start)
+                try:
+                    waypoints = [q for _, q in self._FollowWorkspacePath(
+                        cloned_robot, ik_solver,
+                        boundary_times[index], boundary_times[index + 1],
+                        start_time, timelimit)]
+                except PlanningError as e:
+                    logger.debug('Solving segment %d of %d failed: %s',
+                                 index + 1, num_segments, e)
+                    return None
+
+                return waypoints, ik_solver.GetTags()
+
+        with ClonePool(self.env, num_segments) as clones:
+            segments = []
+            for index in xrange(num_segments):
+                cloned_env = clones.Clone(index)
+                cloned_traj = CopyTrajectory(traj, env=cloned_env)
+                segments.append((cloned_traj, index))
+
+            results = clones.Map(solve_segment, segments)
+
+        if any(result is None for result in results):
+            return None
+
+        # Stitch the segments together, replacing the end of each segment with
+        # the next boundary configuration. The step that is checked is the one
+        # that ends up in the path: from the second-to-last waypoint (or the
+        # start of the segment) to the boundary configuration.
+        all_waypoints = []
+        all_tags = dict()
+        for index, (waypoints, tags) in enumerate(results):
+            if index + 1 < num_segments:
+                boundary_config = boundary_configs[index + 1]
+                if len(waypoints) >= 2:
+                    previous_config = waypoints[-2]
+                else:
+                    previous_config = boundary_configs[index]
+
+                if (not waypoints or
+                        any(abs(boundary_config - previous_config) > resolutions)):
+                    logger.debug('Segment %d of %d does not end at the next'
+                                 ' boundary configuration.',
+                                 index + 1, num_segments)
+                    return None
+                waypoints = waypoints[:-1] + [boundary_config]
+
+            all_waypoints.extend(waypoints)
+            for key, value in tags.iteritems():
+                all_tags[key] = all_tags.get(key, 0) + value
+
+        return all_waypoints, all_tags
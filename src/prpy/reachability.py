@@ -0,0 +1,603 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2015, Carnegie Mellon University
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# - Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# - Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# - Neither the name of Carnegie Mellon University nor the names of its
+#   contributors may be used to endorse or promote products derived from this
+#   software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import json
+import logging
+import numpy
+import os
+import time
+from kin import invert_H
+
+logger = logging.getLogger(__name__)
+
+
+def _H_to_zyz(H):
+    """
+    Convert an (N, 4, 4) array of poses to ZYZ Euler angles.
+    @return (N, 3) array of (azimuth, polar, roll) angles
+    """
+    R = H[:, 0:3, 0:3]
+    azimuth = numpy.arctan2(R[:, 1, 2], R[:, 0, 2])
+    polar = numpy.arccos(numpy.clip(R[:, 2, 2], -1., 1.))
+    roll = numpy.arctan2(R[:, 2, 1], -R[:, 2, 0])
+    return numpy.column_stack((azimuth, polar, roll))
+
+
+class ReachabilityMap(object):
+    """
+    Map of the end-effector poses that a manipulator can reach.
+
+    The map is a grid over SE(3) in the frame of the manipulator's base link.
+    Positions are discretized into cubic voxels of size position_resolution.
+    Orientations are discretized by the ZYZ Euler angles of the end-effector:
+    the direction of its z-axis (azimuth and polar angle, with bins of equal
+    area) and the roll about that axis. Each cell stores a score from 0 to 255
+    that is proportional to the number of configurations that reach it; zero
+    means that the cell is unreachable.
+
+    Maps are generated offline by sampling random configurations (see
+    Generate or run this module as a script) and saved as an uncompressed
+    .npy file that is memory-mapped when loaded.
+    """
+    VERSION = 1
+    METADATA_FILENAME = 'metadata.json'
+    SCORES_FILENAME = 'scores.npy'
+
+    def __init__(self, scores, lower_bound, position_resolution,
+                 metadata=None):
+        """
+        @param scores (nx, ny, nz, n_azimuth, n_polar, n_roll) uint8 array
+        @param lower_bound position of the corner of the grid
+        @param position_resolution size of each voxel, in meters
+        @param metadata optional dictionary of information about the map
+        """
+        if scores.ndim != 6:
+            raise ValueError('Scores must be a six-dimensional array.')
+
+        self.scores = scores
+        self.lower_bound = numpy.array(lower_bound, dtype=float)
+        self.position_resolution = float(position_resolution)
+        self.metadata = metadata or dict()
+        self._inverse = None
+
+    @property
+    def position_shape(self):
+        return self.scores.shape[0:3]
+
+    @property
+    def orientation_shape(self):
+        return self.scores.shape[3:6]
+
+    @classmethod
+    def GetDefaultPath(cls, manipulator):
+        """
+        Get the default path of a manipulator's map in the OpenRAVE database.
+        @param manipulator manipulator
+        @return directory of the map
+        """
+        import openravepy
+
+        return openravepy.RaveFindDatabaseFile(os.path.join(
+            'reachability', manipulator.GetKinematicsStructureHash()), False)
+
+    @classmethod
+    def Load(cls, path):
+        """
+        Load a map saved by Save. The scores are memory-mapped, so loading
+        is fast regardless of the size of the map.
+        @param path directory of the map
+        @return ReachabilityMap
+        """
+        with open(os.path.join(path, cls.METADATA_FILENAME), 'r') as f:
+            metadata = json.load(f)
+
+        if metadata.get('version') != cls.VERSION:
+            raise ValueError(
+                'Reachability map "{:s}" has version {!s}; expected {:d}.'
+                .format(path, metadata.get('version'), cls.VERSION))
+
+        scores = numpy.load(os.path.join(path, cls.SCORES_FILENAME),
+                            mmap_mode='r')
+        return cls(scores, metadata['lower_bound'],
+                   metadata['position_resolution'], metadata=metadata)
+
+    def Save(self, path):
+        """
+        Save the map to a directory.
+        @param path output directory
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        metadata = dict(self.metadata)
+        metadata.update({
+            'version': self.VERSION,
+            'lower_bound': self.lower_bound.tolist(),
+            'position_resolution': self.position_resolution,
+            'shape': list(self.scores.shape),
+        })
+
+        numpy.save(os.path.join(path, self.SCORES_FILENAME),
+                   numpy.asarray(self.scores, dtype=numpy.uint8))
+        with open(os.path.join(path, self.METADATA_FILENAME), 'w') as f:
+            json.dump(metadata, f, indent=2, sort_keys=True)
+
+    def GetCells(self, poses, base_pose=None):
+        """
+        Find the grid cells that contain a batch of poses.
+        @param poses (N, 4, 4) array of end-effector poses
+        @param base_pose pose of the manipulator's base link; the poses are
+                         relative to it if None
+        @return (N, 6) array of cell indices and (N,) boolean array that is
+                False for poses outside of the grid
+        """
+        poses = numpy.asarray(poses, dtype=float).reshape((-1, 4, 4))
+        if base_pose is not None:
+            poses = numpy.dot(invert_H(base_pose), poses).transpose(1, 0, 2)
+
+        position_cells = numpy.floor(
+            (poses[:, 0:3, 3] - self.lower_bound) / self.position_resolution
+        ).astype(int)
+        is_inside = numpy.all((position_cells >= 0)
+                              & (position_cells < self.position_shape), axis=1)
+
+        # Polar bins are uniform in the cosine of the angle so that all of
+        # the directions cover the same area of the sphere.
+        n_azimuth, n_polar, n_roll = self.orientation_shape
+        angles = _H_to_zyz(poses)
+        azimuth_cells = numpy.floor(
+            (angles[:, 0] + numpy.pi) / (2. * numpy.pi) * n_azimuth
+        ).astype(int) % n_azimuth
+        polar_cells = numpy.minimum(numpy.floor(
+            (1. - numpy.cos(angles[:, 1])) / 2. * n_polar
+        ).astype(int), n_polar - 1)
+        roll_cells = numpy.floor(
+            (angles[:, 2] + numpy.pi) / (2. * numpy.pi) * n_roll
+        ).astype(int) % n_roll
+
+        cells = numpy.column_stack((position_cells, azimuth_cells,
+                                    polar_cells, roll_cells))
+        cells[~is_inside, :] = 0
+        return cells, is_inside
+
+    def GetCellPoses(self, cells):
+        """
+        Get the poses at the centers of grid cells.
+        @param cells (N, 6) array of cell indices
+        @return (N, 4, 4) array of poses relative to the manipulator's base
+        """
+        cells = numpy.asarray(cells).reshape((-1, 6))
+        n_azimuth, n_polar, n_roll = self.orientation_shape
+
+        angles = numpy.column_stack((
+            (cells[:, 3] + 0.5) / n_azimuth * 2. * numpy.pi - numpy.pi,
+            numpy.arccos(1. - 2. * (cells[:, 4] + 0.5) / n_polar),
+            (cells[:, 5] + 0.5) / n_roll * 2. * numpy.pi - numpy.pi))
+
+        poses = numpy.tile(numpy.eye(4), (cells.shape[0], 1, 1))
+        poses[:, 0:3, 0:3] = self._zyz_to_rotation(angles)
+        poses[:, 0:3, 3] = (self.lower_bound
+                            + (cells[:, 0:3] + 0.5) * self.position_resolution)
+        return poses
+
+    def GetScores(self, poses, base_pose=None):
+        """
+        Look up the reachability scores of a batch of poses.
+        @param poses (N, 4, 4) array of end-effector poses
+        @param base_pose pose of the manipulator's base link; the poses are
+                         relative to it if None
+        @return (N,) array of scores in [0, 1]; zero is unreachable
+        """
+        cells, is_inside = self.GetCells(poses, base_pose)
+        scores = self.scores[tuple(cells.T)].astype(float) / 255.
+        scores[~is_inside] = 0.
+        return scores
+
+    def GetInverse(self):
+        """
+        Get the inverse reachability of this map. It is computed once and
+        shared by all callers.
+        @return InverseReachability
+        """
+        if self._inverse is None:
+            self._inverse = InverseReachability(self)
+        return self._inverse
+
+    def IsReachable(self, poses, base_pose=None, min_score=0.):
+        """
+        Test whether a batch of poses is reachable.
+        @param poses (N, 4, 4) array of end-effector poses
+        @param base_pose pose of the manipulator's base link; the poses are
+                         relative to it if None
+        @param min_score poses must have a score greater than this
+        @return (N,) boolean array
+        """
+        return self.GetScores(poses, base_pose) > min_score
+
+    @classmethod
+    def Generate(cls, manipulator, num_samples=1000000,
+                 position_resolution=0.05, orientation_shape=(12, 6, 6),
+                 check_collision=False, dilate=True, seed=None):
+        """
+        Generate a map by sampling random configurations.
+
+        Configurations are sampled uniformly within the joint limits and the
+        end-effector pose of each one is recorded. Cells that are adjacent in
+        position to a reached cell are marked as reachable when dilate is
+        True; this reduces the number of reachable poses that are rejected
+        because no sample landed in their cell.
+
+        @param manipulator manipulator to generate the map for
+        @param num_samples number of configurations to sample
+        @param position_resolution size of each voxel, in meters
+        @param orientation_shape number of (azimuth, polar, roll) bins
+        @param check_collision ignore configurations in self-collision
+        @param dilate mark the neighbors of reached cells as reachable
+        @param seed optional seed for the random configurations
+        @return ReachabilityMap
+        """
+        robot = manipulator.GetRobot()
+        arm_indices = manipulator.GetArmIndices()
+        random_state = numpy.random.RandomState(seed)
+        start_time = time.time()
+
+        positions = numpy.empty((num_samples, 3), dtype=numpy.float32)
+        angles = numpy.empty((num_samples, 3), dtype=numpy.float32)
+        is_valid = numpy.ones(num_samples, dtype=bool)
+
+        with robot.GetEnv():
+            with robot.CreateRobotStateSaver():
+                lower_limits, upper_limits = robot.GetDOFLimits(arm_indices)
+                base_inv = invert_H(manipulator.GetBase().GetTransform())
+
+                for i in xrange(num_samples):
+                    q = lower_limits + random_state.random_sample(
+                        len(arm_indices)) * (upper_limits - lower_limits)
+                    robot.SetDOFValues(q, arm_indices)
+
+                    if check_collision and robot.CheckSelfCollision():
+                        is_valid[i] = False
+                        continue
+
+                    pose = numpy.dot(base_inv,
+                                     manipulator.GetEndEffectorTransform())
+                    positions[i, :] = pose[0:3, 3]
+                    angles[i, :] = _H_to_zyz(pose[numpy.newaxis, :, :])[0]
+
+        positions = positions[is_valid, :]
+        angles = angles[is_valid, :]
+        if positions.shape[0] == 0:
+            raise ValueError('All of the sampled configurations are invalid.')
+
+        # Pad the grid with a layer of empty voxels on each side to leave room
+        # for dilation.
+        lower_bound = (numpy.floor(positions.min(axis=0) / position_resolution)
+                       - 1) * position_resolution
+        upper_bound = (numpy.floor(positions.max(axis=0) / position_resolution)
+                       + 2) * position_resolution
+        position_shape = numpy.round(
+            (upper_bound - lower_bound) / position_resolution).astype(int)
+
+        reachability_map = cls(
+            numpy.zeros(tuple(position_shape) + tuple(orientation_shape),
+                        dtype=numpy.uint8),
+            lower_bound, position_resolution)
+
+        # Count the samples in each cell.
+        poses = numpy.tile(numpy.eye(4), (positions.shape[0], 1, 1))
+        poses[:, 0:3, 3] = positions
+        poses[:, 0:3, 0:3] = cls._zyz_to_rotation(angles)
+        cells, is_inside = reachability_map.GetCells(poses)
+        flat_cells = numpy.ravel_multi_index(
+            tuple(cells[is_inside].T), reachability_map.scores.shape)
+        counts = numpy.bincount(flat_cells)
+        flat_cells = numpy.flatnonzero(counts)
+        counts = counts[flat_cells]
+
+        scores = reachability_map.scores
+        scores.flat[flat_cells] = numpy.ceil(
+            255. * counts / counts.max()).astype(numpy.uint8)
+
+        if dilate:
+            dilated = scores.copy()
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for dz in (-1, 0, 1):
+                        # The padding keeps roll from wrapping any scores
+                        # around the edges of the grid.
+                        shifted = numpy.roll(numpy.roll(numpy.roll(
+                            scores, dx, axis=0), dy, axis=1), dz, axis=2)
+                        numpy.maximum(dilated, numpy.minimum(shifted, 1),
+                                      out=dilated)
+            scores = dilated
+
+        reachability_map.scores = scores
+        reachability_map.metadata = {
+            'robot': robot.GetName(),
+            'manipulator': manipulator.GetName(),
+            'kinematics_hash': manipulator.GetKinematicsStructureHash(),
+            'num_samples': num_samples,
+            'check_collision': check_collision,
+            'dilate': dilate,
+            'generation_time': time.time() - start_time,
+        }
+
+        logger.info('Generated a %s reachability map for "%s" from %d samples'
+                    ' in %.1f seconds; %.1f%% of the cells are reachable.',
+                    'x'.join(str(n) for n in scores.shape),
+                    manipulator.GetName(), num_samples,
+                    time.time() - start_time,
+                    100. * numpy.count_nonzero(scores) / scores.size)
+        return reachability_map
+
+    @staticmethod
+    def _zyz_to_rotation(angles):
+        ca, sa = numpy.cos(angles[:, 0]), numpy.sin(angles[:, 0])
+        cb, sb = numpy.cos(angles[:, 1]), numpy.sin(angles[:, 1])
+        cc, sc = numpy.cos(angles[:, 2]), numpy.sin(angles[:, 2])
+
+        R = numpy.empty((angles.shape[0], 3, 3))
+        R[:, 0, 0] = ca * cb * cc - sa * sc
+        R[:, 0, 1] = -ca * cb * sc - sa * cc
+        R[:, 0, 2] = ca * sb
+        R[:, 1, 0] = sa * cb * cc + ca * sc
+        R[:, 1, 1] = -sa * cb * sc + ca * cc
+        R[:, 1, 2] = sa * sb
+        R[:, 2, 0] = -sb * cc
+        R[:, 2, 1] = sb * sc
+        R[:, 2, 2] = cb
+        return R
+
+
+class InverseReachability(object):
+    """
+    Distribution of the base poses from which a manipulator can reach a pose.
+
+    Candidate poses of the manipulator's base link are drawn by sampling
+    reachable cells of a ReachabilityMap in proportion to their scores and
+    inverting them relative to the target end-effector pose. For a mobile
+    robot the candidates are projected onto the floor, keeping the robot's
+    height and tilt, and then re-scored exactly with the reachability map.
+    All of these operations are vectorized over the candidates.
+    """
+    def __init__(self, reachability_map):
+        """
+        @param reachability_map ReachabilityMap of the manipulator
+        """
+        self.reachability_map = reachability_map
+
+        flat_scores = numpy.ravel(reachability_map.scores)
+        self.flat_cells = numpy.flatnonzero(flat_scores)
+        if self.flat_cells.shape[0] == 0:
+            raise ValueError('The reachability map has no reachable cells.')
+
+        self.cumulative_scores = numpy.cumsum(
+            flat_scores[self.flat_cells].astype(float))
+
+    def SampleBasePoses(self, target_poses, num_samples, random_state=None):
+        """
+        Sample poses of the manipulator's base link that reach the targets.
+        @param target_poses (M, 4, 4) array of end-effector poses
+        @param num_samples number of samples for each target pose
+        @param random_state optional numpy.random.RandomState
+        @return (M * num_samples, 4, 4) array of base link poses
+        """
+        if random_state is None:
+            random_state = numpy.random
+        target_poses = numpy.asarray(target_poses, dtype=float).reshape(
+            (-1, 4, 4))
+
+        # Sample cells in proportion to their scores.
+        num_total = target_poses.shape[0] * num_samples
+        draws = random_state.random_sample(num_total) \
+            * self.cumulative_scores[-1]
+        indices = numpy.minimum(
+            numpy.searchsorted(self.cumulative_scores, draws, side='right'),
+            self.flat_cells.shape[0] - 1)
+        cells = numpy.column_stack(numpy.unravel_index(
+            self.flat_cells[indices], self.reachability_map.scores.shape))
+
+        # T_world_base = T_world_ee * inv(T_base_ee)
+        cell_poses = self.reachability_map.GetCellPoses(cells)
+        cell_poses_inv = numpy.tile(numpy.eye(4), (num_total, 1, 1))
+        cell_poses_inv[:, 0:3, 0:3] = cell_poses[:, 0:3, 0:3].transpose(
+            0, 2, 1)
+        cell_poses_inv[:, 0:3, 3] = -numpy.sum(
+            cell_poses[:, 0:3, 0:3] * cell_poses[:, 0:3, 3, numpy.newaxis],
+            axis=1)
+
+        targets = numpy.repeat(target_poses, num_samples, axis=0)
+        return numpy.sum(targets[:, :, :, numpy.newaxis]
+                         * cell_poses_inv[:, numpy.newaxis, :, :], axis=2)
+
+    def FindBasePoses(self, robot, manipulator, target_poses,
+                      num_samples=1000, num_results=10, check_collision=True,
+                      seed=None):
+        """
+        Find ranked poses of a mobile robot that reach the target poses.
+
+        Candidate robot poses are sampled for each target, projected onto the
+        plane of the robot's current pose, and scored by the best
+        reachability score of any target from that pose. Candidates are then
+        collision checked in descending order of score until num_results
+        collision-free poses are found.
+
+        @param robot mobile robot
+        @param manipulator manipulator of the robot
+        @param target_poses (M, 4, 4) array of end-effector poses; they are
+                            treated as a goal set
+        @param num_samples number of candidates sampled for each target
+        @param num_results maximum number of poses to return
+        @param check_collision reject poses where the robot, in its current
+                               configuration, is in collision
+        @param seed optional seed for sampling the candidates
+        @return (N, 4, 4) array of robot poses and (N,) array of scores,
+                sorted by descending score
+        """
+        target_poses = numpy.asarray(target_poses, dtype=float).reshape(
+            (-1, 4, 4))
+        random_state = numpy.random.RandomState(seed)
+
+        with robot.GetEnv():
+            robot_pose = robot.GetTransform()
+            robot_to_base = numpy.dot(invert_H(robot_pose),
+                                      manipulator.GetBase().GetTransform())
+
+        # Project the candidates onto the plane of the robot's current pose
+        # by keeping only their position in that plane and their yaw.
+        base_poses = self.SampleBasePoses(target_poses, num_samples,
+                                          random_state)
+        candidate_poses = numpy.dot(
+            base_poses, invert_H(robot_to_base))
+        relative_poses = numpy.dot(
+            invert_H(robot_pose), candidate_poses).transpose(1, 0, 2)
+        yaws = numpy.arctan2(relative_poses[:, 1, 0], relative_poses[:, 0, 0])
+
+        planar_poses = numpy.tile(numpy.eye(4), (yaws.shape[0], 1, 1))
+        planar_poses[:, 0, 0] = numpy.cos(yaws)
+        planar_poses[:, 0, 1] = -numpy.sin(yaws)
+        planar_poses[:, 1, 0] = numpy.sin(yaws)
+        planar_poses[:, 1, 1] = numpy.cos(yaws)
+        planar_poses[:, 0:2, 3] = relative_poses[:, 0:2, 3]
+        candidate_poses = numpy.dot(robot_pose, planar_poses).transpose(
+            1, 0, 2)
+
+        scores = self.ScoreBasePoses(candidate_poses, robot_to_base,
+                                     target_poses)
+        ranked_indices = numpy.argsort(-scores)
+        ranked_indices = ranked_indices[scores[ranked_indices] > 0.]
+
+        results = []
+        with robot.GetEnv():
+            with robot.CreateRobotStateSaver():
+                for index in ranked_indices:
+                    if len(results) >= num_results:
+                        break
+
+                    if check_collision:
+                        robot.SetTransform(candidate_poses[index])
+                        if (robot.GetEnv().CheckCollision(robot)
+                                or robot.CheckSelfCollision()):
+                            continue
+
+                    results.append(index)
+
+        return candidate_poses[results], scores[results]
+
+    def ScoreBasePoses(self, robot_poses, robot_to_base, target_poses):
+        """
+        Score robot poses by how well they reach a set of targets.
+        @param robot_poses (K, 4, 4) array of robot poses
+        @param robot_to_base pose of the manipulator's base link relative to
+                             the robot
+        @param target_poses (M, 4, 4) array of end-effector poses
+        @return (K,) array of the best score of any target
+        """
+        robot_poses = numpy.asarray(robot_poses, dtype=float).reshape(
+            (-1, 4, 4))
+        target_poses = numpy.asarray(target_poses, dtype=float).reshape(
+            (-1, 4, 4))
+
+        # inv(T_world_base) for each candidate.
+        base_poses = numpy.dot(robot_poses, robot_to_base)
+        base_poses_inv = numpy.tile(numpy.eye(4), (base_poses.shape[0], 1, 1))
+        base_poses_inv[:, 0:3, 0:3] = base_poses[:, 0:3, 0:3].transpose(
+            0, 2, 1)
+        base_poses_inv[:, 0:3, 3] = -numpy.sum(
+            base_poses[:, 0:3, 0:3] * base_poses[:, 0:3, 3, numpy.newaxis],
+            axis=1)
+
+        # (K, M) relative poses of every target from every candidate.
+        relative_poses = numpy.dot(base_poses_inv, target_poses).transpose(
+            0, 2, 1, 3)
+        scores = self.reachability_map.GetScores(relative_poses)
+        return scores.reshape((robot_poses.shape[0], target_poses.shape[0])
+                              ).max(axis=1)
+
+
+def main():
+    import argparse
+    import openravepy
+
+    parser = argparse.ArgumentParser(
+        description='Generate a reachability map for a manipulator.')
+    parser.add_argument('robot', help='robot or environment file to load')
+    parser.add_argument('--robot-name', default=None,
+                        help='name of the robot; defaults to the first robot')
+    parser.add_argument('--manipulator', default=None,
+                        help='name of the manipulator; defaults to the active'
+                             ' manipulator')
+    parser.add_argument('--num-samples', type=int, default=1000000)
+    parser.add_argument('--position-resolution', type=float, default=0.05)
+    parser.add_argument('--orientation-shape', type=int, nargs=3,
+                        default=[12, 6, 6],
+                        metavar=('AZIMUTH', 'POLAR', 'ROLL'))
+    parser.add_argument('--check-collision', action='store_true',
+                        help='ignore configurations in self-collision')
+    parser.add_argument('--no-dilate', action='store_true',
+                        help='do not mark neighboring cells as reachable')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', default=None,
+                        help='output directory; defaults to the OpenRAVE'
+                             ' database')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    env = openravepy.Environment()
+    try:
+        if not env.Load(args.robot):
+            parser.error('Failed to load "{:s}".'.format(args.robot))
+
+        if args.robot_name is not None:
+            robot = env.GetRobot(args.robot_name)
+        else:
+            robot = env.GetRobots()[0]
+
+        if args.manipulator is not None:
+            manipulator = robot.GetManipulator(args.manipulator)
+        else:
+            manipulator = robot.GetActiveManipulator()
+
+        reachability_map = ReachabilityMap.Generate(
+            manipulator, num_samples=args.num_samples,
+            position_resolution=args.position_resolution,
+            orientation_shape=tuple(args.orientation_shape),
+            check_collision=args.check_collision,
+            dilate=not args.no_dilate, seed=args.seed)
+
+        output = args.output or ReachabilityMap.GetDefaultPath(manipulator)
+        reachability_map.Save(output)
+        logger.info('Saved the reachability map to "%s".', output)
+    finally:
+        env.Destroy()
+
+
+if __name__ == '__main__':
+    main()
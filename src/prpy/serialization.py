@@ -1,9 +1,18 @@
+import collections
 import numpy
 import openravepy
 import logging
+import os
+import threading
 from .exceptions import UnsupportedTypeSerializationException
 
 TYPE_KEY = '__type__'
+BUFFER_KEY = '__buffer__'
+BINARY_MAGIC = 'PRPYENV\x00'
+BINARY_PREFIX_FORMAT = '<IIQ'
+BINARY_VERSION = 1
+BINARY_ALIGNMENT = 16
+BINARY_MIN_ARRAY_SIZE = 8
 
 serialization_logger = logging.getLogger('prpy.serialization')
 deserialization_logger = logging.getLogger('prpy.deserialization')
@@ -80,17 +89,20 @@ def serialize(obj):
     else:
         raise UnsupportedTypeSerializationException(obj)
 
-def serialize_environment(env):
+def serialize_environment(env, binary=False):
     return {
-        'bodies': [ serialize_kinbody(body) for body in env.GetBodies() ],
+        'bodies': [ serialize_kinbody(body, binary)
+                    for body in env.GetBodies() ],
     }
 
-def serialize_environment_file(env, path, writer=None):
+def serialize_environment_file(env, path, writer=None, binary=None):
     if writer is None:
         import json
         writer = json.dump
+    if binary is None:
+        binary = writer is dump_binary
 
-    data = serialize_environment(env)
+    data = serialize_environment(env, binary)
 
     if path is not None:
         with open(path, 'wb') as output_file:
@@ -99,7 +111,10 @@ def serialize_environment_file(env, path, writer=None):
 
     return data
 
-def serialize_kinbody(body):
+# The binary argument of the serialize_* functions below leaves float arrays
+# as numpy arrays, which dump_binary writes directly, instead of converting
+# them to lists for JSON.
+def serialize_kinbody(body, binary=False):
     all_joints = []
     all_joints.extend(body.GetJoints())
     all_joints.extend(body.GetPassiveJoints())
@@ -108,92 +123,214 @@ def serialize_kinbody(body):
         'is_robot': body.IsRobot(),
         'name': body.GetName(),
         'uri': body.GetXMLFilename(),
-        'links': map(serialize_link, body.GetLinks()),
-        'joints': map(serialize_joint, all_joints),
+        'links': [ serialize_link(link, binary) for link in body.GetLinks() ],
+        'joints': [ serialize_joint(joint, binary) for joint in all_joints ],
     }
-    data['kinbody_state'] = serialize_kinbody_state(body)
+    data['kinbody_state'] = serialize_kinbody_state(body, binary)
 
     if body.IsRobot():
-        data.update(serialize_robot(body))
+        data.update(serialize_robot(body, binary))
 
     return data
 
-def serialize_robot(robot):
+def serialize_robot(robot, binary=False):
     return {
-        'manipulators': map(serialize_manipulator, robot.GetManipulators()),
-        'robot_state': serialize_robot_state(robot),
+        'manipulators': [ serialize_manipulator(manipulator, binary)
+                          for manipulator in robot.GetManipulators() ],
+        'robot_state': serialize_robot_state(robot, binary),
     }
 
-def serialize_kinbody_state(body):
+def serialize_kinbody_state(body, binary=False):
     data = {
-        name: get_fn(body)
+        name: get_fn(body, binary)
         for name, (get_fn, _) in KINBODY_STATE_MAP.iteritems()
     }
 
     link_transforms, dof_branches = body.GetLinkTransformations(True)
     data.update({
-        'link_transforms': map(serialize_transform, link_transforms),
+        'link_transforms': [ serialize_transform(t, binary)
+                             for t in link_transforms ],
         'dof_branches': dof_branches.tolist(),
-        'dof_values': body.GetDOFValues().tolist(),
+        'dof_values': serialize_array(body.GetDOFValues(), binary),
     })
 
     return data
 
-def serialize_robot_state(body):
+def serialize_robot_state(body, binary=False):
     data = {
-        name: get_fn(body)
+        name: get_fn(body, binary)
         for name, (get_fn, _) in ROBOT_STATE_MAP.iteritems()
     }
-    data['grabbed_bodies'] = map(serialize_grabbed_info, body.GetGrabbedInfo())
+    data['grabbed_bodies'] = [ serialize_grabbed_info(grabbed_info, binary)
+                               for grabbed_info in body.GetGrabbedInfo() ]
     return data
 
-def serialize_link(link):
-    data = { 'info': serialize_link_info(link.GetInfo()) }
+def serialize_link(link, binary=False):
+    data = { 'info': serialize_link_info(link.GetInfo(), binary) }
 
     # Bodies loaded from ".kinbody.xml" do not have GeometryInfo's listed in
     # their LinkInfo class. We manually read them from GetGeometries().
     # TODO: This may not correctly preserve non-active geometry groups.
     data['info']['_vgeometryinfos'] = [
-        serialize_geometry_info(geometry.GetInfo()) \
+        serialize_geometry_info(geometry.GetInfo(), binary) \
         for geometry in link.GetGeometries()
     ]
     return data
 
-def serialize_joint(joint):
-    return { 'info': serialize_joint_info(joint.GetInfo()) }
+def serialize_joint(joint, binary=False):
+    return { 'info': serialize_joint_info(joint.GetInfo(), binary) }
 
-def serialize_manipulator(manipulator):
-    return { 'info': serialize_manipulator_info(manipulator.GetInfo()) }
+def serialize_manipulator(manipulator, binary=False):
+    return { 'info': serialize_manipulator_info(manipulator.GetInfo(), binary) }
 
-def serialize_with_map(obj, attribute_map):
+def serialize_with_map(obj, attribute_map, binary=False):
     return {
-        key: serialize_fn(getattr(obj, key))
+        key: serialize_fn(getattr(obj, key), binary)
         for key, (serialize_fn, _) in attribute_map.iteritems()
     }
 
-def serialize_link_info(link_info):
-    return serialize_with_map(link_info, LINK_INFO_MAP)
+def serialize_link_info(link_info, binary=False):
+    return serialize_with_map(link_info, LINK_INFO_MAP, binary)
     
-def serialize_joint_info(joint_info):
-    return serialize_with_map(joint_info, JOINT_INFO_MAP)
+def serialize_joint_info(joint_info, binary=False):
+    return serialize_with_map(joint_info, JOINT_INFO_MAP, binary)
 
-def serialize_manipulator_info(manip_info):
-    return serialize_with_map(manip_info, MANIPULATOR_INFO_MAP)
+def serialize_manipulator_info(manip_info, binary=False):
+    return serialize_with_map(manip_info, MANIPULATOR_INFO_MAP, binary)
 
-def serialize_geometry_info(geom_info):
-    return serialize_with_map(geom_info, GEOMETRY_INFO_MAP)
+def serialize_geometry_info(geom_info, binary=False):
+    return serialize_with_map(geom_info, GEOMETRY_INFO_MAP, binary)
 
-def serialize_grabbed_info(grabbed_info):
-    return serialize_with_map(grabbed_info, GRABBED_INFO_MAP)
+def serialize_grabbed_info(grabbed_info, binary=False):
+    return serialize_with_map(grabbed_info, GRABBED_INFO_MAP, binary)
 
-def serialize_transform(t):
+def serialize_transform(t, binary=False):
     from openravepy import quatFromRotationMatrix
 
     return {
-        'position': list(map(float,t[0:3, 3])),
-        'orientation': list(map(float,quatFromRotationMatrix(t[0:3, 0:3]))),
+        'position': serialize_array(t[0:3, 3], binary),
+        'orientation': serialize_array(quatFromRotationMatrix(t[0:3, 0:3]),
+                                       binary),
     }
 
+def serialize_array(array, binary=False):
+    array = numpy.asarray(array)
+
+    # Only float arrays are left as arrays. Integer and boolean values are
+    # lists in both formats.
+    if binary and array.dtype.kind == 'f':
+        return numpy.array(array, dtype=float)
+    return array.tolist()
+
+class EnvironmentDeltaSerializer(object):
+    """
+    Serialize the changes to an environment since the last call.
+
+    The first call to Serialize returns a full snapshot of the environment.
+    Each later call only contains the bodies that were added or removed and
+    the kinbody_state and robot_state fields that changed. A body is
+    re-serialized in full if its kinematics or geometry change, as detected
+    by GetKinematicsGeometryHash. Bodies are identified by name.
+
+    The result is applied to a target environment, which must have been
+    created from the earlier results of the same serializer, with
+    deserialize_environment_delta.
+    """
+    def __init__(self):
+        self.Reset()
+
+    def Reset(self):
+        """
+        Return a full snapshot from the next call to Serialize.
+        """
+        self._hashes = None
+        self._states = dict()
+
+    def Serialize(self, env):
+        """
+        Serialize the changes to env since the last call.
+        @param env environment to serialize
+        @return dictionary describing the changes
+        """
+        full = self._hashes is None
+        hashes = dict()
+        states = dict()
+        added = []
+        changed = dict()
+
+        for body in env.GetBodies():
+            name = body.GetName()
+            hashes[name] = body.GetKinematicsGeometryHash()
+
+            if full or self._hashes.get(name) != hashes[name]:
+                body_data = serialize_kinbody(body)
+                added.append(body_data)
+            else:
+                body_data = { 'kinbody_state': serialize_kinbody_state(body) }
+                if body.IsRobot():
+                    body_data['robot_state'] = serialize_robot_state(body)
+
+                body_diff = _diff_body_state(self._states[name], body_data)
+                if body_diff:
+                    changed[name] = body_diff
+
+            states[name] = {
+                key: body_data[key]
+                for key in [ 'kinbody_state', 'robot_state' ]
+                if key in body_data
+            }
+
+        if full:
+            removed = []
+        else:
+            removed = [ name for name in self._hashes if name not in hashes ]
+
+            # Re-adding a body removes it from the target environment, which
+            # releases it. Robots that grab it must re-grab it.
+            added_names = set(body_data['name'] for body_data in added)
+            for name, state in states.iteritems():
+                if name in added_names or 'robot_state' not in state:
+                    continue
+
+                grabbed_bodies = state['robot_state']['grabbed_bodies']
+                if any(grabbed_info['_grabbedname'] in added_names
+                       for grabbed_info in grabbed_bodies):
+                    robot_diff = changed.setdefault(name, dict()).setdefault(
+                        'robot_state', dict())
+                    robot_diff['grabbed_bodies'] = grabbed_bodies
+
+        self._hashes = hashes
+        self._states = states
+
+        return {
+            'full': full,
+            'added': added,
+            'removed': removed,
+            'changed': changed,
+            'hashes': { body_data['name']: hashes[body_data['name']]
+                        for body_data in added },
+        }
+
+def _diff_body_state(old_data, new_data):
+    diff = dict()
+
+    for key, new_state in new_data.iteritems():
+        old_state = old_data.get(key, {})
+        state_diff = {
+            name: value for name, value in new_state.iteritems()
+            if old_state.get(name) != value
+        }
+
+        # Link transforms can only be set together with the DOF branches.
+        if 'link_transforms' in state_diff or 'dof_branches' in state_diff:
+            state_diff['link_transforms'] = new_state['link_transforms']
+            state_diff['dof_branches'] = new_state['dof_branches']
+
+        if state_diff:
+            diff[key] = state_diff
+
+    return diff
+
 # Deserialization.
 def _deserialize_internal(env, data, data_type):
     from numpy import array, ndarray
@@ -291,7 +428,7 @@ def deserialize_environment(data, env=None, purge=False, reuse_bodies=None):
         reuse_bodies_set = set(reuse_bodies)
 
     # Release anything that's grabbed.
-    for body in reuse_bodies:
+    for body in reuse_bodies_set:
         body.ReleaseAllGrabbed()
 
     # Remove any extra bodies from the environment.
@@ -320,6 +457,64 @@ def deserialize_environment(data, env=None, purge=False, reuse_bodies=None):
 
     return env
 
+def deserialize_environment_file(path, env=None, reader=None, **kw_args):
+    data = read_environment_file(path, reader=reader)
+    return deserialize_environment(data, env=env, **kw_args)
+
+def deserialize_environment_delta(data, env):
+    # A full snapshot replaces everything in the environment. Bodies whose
+    # kinematics and geometry are unchanged are kept.
+    if data['full']:
+        for body in env.GetBodies():
+            if body.GetName() not in data['hashes']:
+                deserialization_logger.debug('Purging body "%s".', body.GetName())
+                env.Remove(body)
+
+    for name in data['removed']:
+        body = env.GetKinBody(name)
+        if body is not None:
+            deserialization_logger.debug('Removing body "%s".', name)
+            env.Remove(body)
+
+    updates = []
+    for body_data in data['added']:
+        body = env.GetKinBody(body_data['name'])
+        if (body is not None and body.GetKinematicsGeometryHash()
+                != data['hashes'][body_data['name']]):
+            env.Remove(body)
+            body = None
+
+        if body is None:
+            body = deserialize_kinbody(env, body_data, state=False)
+
+        updates.append((body, body_data, False))
+
+    for name, body_data in data['changed'].iteritems():
+        body = env.GetKinBody(name)
+        if body is None:
+            raise ValueError('There is no body with name "{:s}".'.format(name))
+
+        updates.append((body, body_data, True))
+
+    # Release the bodies that will be re-grabbed before moving anything.
+    for body, body_data, _ in updates:
+        if 'grabbed_bodies' in body_data.get('robot_state', {}):
+            body.ReleaseAllGrabbed()
+
+    # Restore state. We do this in a second pass to insure that any bodies that
+    # are grabbed already exist.
+    for body, body_data, partial in updates:
+        if 'kinbody_state' in body_data:
+            deserialize_kinbody_state(body, body_data['kinbody_state'],
+                                      partial=partial)
+
+    for body, body_data, partial in updates:
+        if 'robot_state' in body_data:
+            deserialize_robot_state(body, body_data['robot_state'],
+                                    partial=partial)
+
+    return env
+
 def deserialize_kinbody(env, data, name=None, anonymous=False, state=True):
     from openravepy import RaveCreateKinBody, RaveCreateRobot
 
@@ -365,13 +560,16 @@ def deserialize_kinbody(env, data, name=None, anonymous=False, state=True):
 
     return kinbody
 
-def deserialize_kinbody_state(body, data):
+def deserialize_kinbody_state(body, data, partial=False):
     from openravepy import KinBody
 
     deserialization_logger.debug('Deserializing "%s" KinBody state.',
         body.GetName())
 
     for key, (_, set_fn) in KINBODY_STATE_MAP.iteritems():
+        if partial and key not in data:
+            continue
+
         try:
             set_fn(body, data[key])
         except Exception as e:
@@ -381,17 +579,24 @@ def deserialize_kinbody_state(body, data):
             )
             raise
 
+    if partial and 'link_transforms' not in data:
+        return
+
     body.SetLinkTransformations(
         map(deserialize_transform, data['link_transforms']),
         data['dof_branches']
     )
 
-def deserialize_robot_state(body, data):
+def deserialize_robot_state(body, data, partial=False):
     deserialization_logger.debug('Deserializing "%s" Robot state.',
         body.GetName())
 
     for key, (_, set_fn) in ROBOT_STATE_MAP.iteritems():
-        set_fn(body, data[key])
+        if not partial or key in data:
+            set_fn(body, data[key])
+
+    if partial and 'grabbed_bodies' not in data:
+        return
 
     env = body.GetEnv()
 
@@ -435,10 +640,9 @@ def deserialize_geometry_info(data):
     geom_info = deserialize_with_map(
         KinBody.GeometryInfo(), data, GEOMETRY_INFO_MAP)
 
-    # OpenRAVE only has a ReadTrimeshURI method on Environment. We create a
-    # static, dummy environment (mesh_environment) just to load meshes.
+    # Geometries that use the same mesh file share the cached TriMesh.
     if geom_info._filenamecollision:
-        geom_info._meshcollision = mesh_environment.ReadTrimeshURI(
+        geom_info._meshcollision = mesh_cache.ReadTrimeshURI(
             geom_info._filenamecollision)
 
     return geom_info
@@ -455,19 +659,281 @@ def deserialize_transform(data):
     t[0:3, 3] = data['position']
     return t
 
+# Binary format. This stores the same data as the JSON format, except that
+# numpy arrays are written as raw, aligned buffers. The file contains:
+#
+#   BINARY_MAGIC | version | header size | buffer size | header | buffers
+#
+# where the header is the JSON-encoded data with each array replaced by a
+# reference to its dtype, offset, and shape. Arrays are loaded as views into
+# a single buffer that is read from the file in one call. Lists and arrays
+# with fewer than BINARY_MIN_ARRAY_SIZE elements are written as JSON lists, so
+# data should be serialized with binary=True to produce arrays.
+def dump_binary(data, output_file):
+    import json, struct
+
+    buffers = []
+    nbytes = [ 0 ]
+
+    # The JSON encoder calls pack for every value it can not encode, so the
+    # arrays are replaced while the header is encoded.
+    def pack(value):
+        if not isinstance(value, numpy.ndarray) or value.dtype == object:
+            raise TypeError('{!r} is not JSON serializable'.format(value))
+        elif value.size < BINARY_MIN_ARRAY_SIZE:
+            # A buffer reference is as long as a short list, e.g. a position.
+            return value.tolist()
+
+        array = numpy.ascontiguousarray(value)
+        offset = _align(nbytes[0], array.dtype.alignment)
+        buffers.append((offset, array))
+        nbytes[0] = offset + array.nbytes
+        return { BUFFER_KEY: [ array.dtype.str, offset ] + list(array.shape) }
+
+    header = json.dumps(data, separators=(',', ':'), default=pack)
+
+    # Pad the header so the buffers are aligned in the file.
+    prefix_size = len(BINARY_MAGIC) + struct.calcsize(BINARY_PREFIX_FORMAT)
+    header_size = _align(prefix_size + len(header), BINARY_ALIGNMENT) \
+                - prefix_size
+    header = header.ljust(header_size)
+
+    output_file.write(BINARY_MAGIC)
+    output_file.write(struct.pack(BINARY_PREFIX_FORMAT,
+                                  BINARY_VERSION, header_size, nbytes[0]))
+    output_file.write(header)
+
+    position = 0
+    for offset, array in buffers:
+        output_file.write('\x00' * (offset - position))
+        output_file.write(array.tostring())
+        position = offset + array.nbytes
+
+def load_binary(input_file):
+    import json, struct
+    from .exceptions import (SerializationException,
+                             UnsupportedVersionDeserializationException)
+
+    prefix_size = len(BINARY_MAGIC) + struct.calcsize(BINARY_PREFIX_FORMAT)
+    prefix = input_file.read(prefix_size)
+    if len(prefix) != prefix_size or not prefix.startswith(BINARY_MAGIC):
+        raise SerializationException('File is not a binary environment.')
+
+    version, header_size, nbytes = struct.unpack(
+        BINARY_PREFIX_FORMAT, prefix[len(BINARY_MAGIC):])
+    if version != BINARY_VERSION:
+        raise UnsupportedVersionDeserializationException(version)
+
+    header = input_file.read(header_size)
+    blob = numpy.empty(nbytes, dtype=numpy.uint8)
+    if len(header) != header_size or input_file.readinto(blob) != nbytes:
+        raise SerializationException('Binary environment is truncated.')
+
+    def unpack(value):
+        reference = value.get(BUFFER_KEY)
+        if reference is None:
+            return value
+
+        dtype, offset = reference[0:2]
+        return numpy.ndarray(reference[2:], str(dtype), blob, offset)
+
+    return json.loads(header, object_hook=unpack)
+
+def read_environment_file(path, reader=None):
+    with open(path, 'rb') as input_file:
+        if reader is None:
+            # Files without the binary header are in the original JSON format.
+            is_binary = input_file.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+            input_file.seek(0)
+
+            if is_binary:
+                reader = load_binary
+            else:
+                import json
+                reader = json.load
+
+        data = reader(input_file)
+        deserialization_logger.debug('Read environment from "%s".', path)
+
+    return data
+
+def _align(offset, alignment):
+    return (offset + alignment - 1) // alignment * alignment
+
+# Meshes. OpenRAVE only has a ReadTrimeshURI method on Environment, so meshes
+# are loaded in a dummy environment that is created the first time it is
+# needed. Use get_mesh_environment() to access it.
+_mesh_environment = None
+_mesh_environment_lock = threading.Lock()
+
+def get_mesh_environment():
+    global _mesh_environment
+
+    with _mesh_environment_lock:
+        if _mesh_environment is None:
+            _mesh_environment = openravepy.Environment()
+        return _mesh_environment
+
+class _LazyMeshEnvironment(object):
+    """
+    Forwards attribute access to the environment returned by
+    get_mesh_environment(), which is created on first use.
+    """
+    def __getattr__(self, name):
+        return getattr(get_mesh_environment(), name)
+
+# Deprecated: use get_mesh_environment() instead.
+mesh_environment = _LazyMeshEnvironment()
+
+class MeshCache(object):
+    """
+    LRU cache of meshes loaded with ReadTrimeshURI.
+
+    Entries are keyed by the URI and the modification time and size of the
+    file it refers to, so meshes are re-loaded when the file changes. The
+    same TriMesh is returned for every read of an entry and its arrays are
+    made read-only, since they are shared. Least recently used meshes are
+    evicted once the vertices and indices of the cached meshes exceed
+    max_bytes.
+
+    This class is thread-safe.
+    """
+    def __init__(self, max_bytes=256 * 2**20):
+        """
+        @param max_bytes maximum size of the cached meshes, in bytes
+        """
+        self.max_bytes = max_bytes
+
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_evicted = 0
+
+        self._entries = collections.OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def Clear(self):
+        """ Remove all cached meshes. """
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def GetStats(self):
+        """
+        Get statistics about the cache.
+        @return dictionary of statistics
+        """
+        with self._lock:
+            num_queries = self.num_hits + self.num_misses
+            return {
+                'hits': self.num_hits,
+                'misses': self.num_misses,
+                'hit_rate': (float(self.num_hits) / num_queries
+                             if num_queries > 0 else 0.),
+                'evicted': self.num_evicted,
+                'num_entries': len(self._entries),
+                'nbytes': self._nbytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def ReadTrimeshURI(self, uri):
+        """
+        Load a mesh, reusing the cached mesh if the file has not changed.
+        @param uri filename or URI of the mesh
+        @return TriMesh, or None if the mesh could not be loaded
+        """
+        key = self._GetKey(uri)
+        if key is None:
+            deserialization_logger.debug(
+                'Not caching mesh "%s" because it is not a local file.', uri)
+            with self._load_lock:
+                return get_mesh_environment().ReadTrimeshURI(uri)
+
+        trimesh = self._Lookup(key)
+        if trimesh is not None:
+            return trimesh
+
+        # Only one mesh is loaded at a time because the mesh environment is
+        # shared. Another thread may have loaded this mesh while we waited.
+        with self._load_lock:
+            trimesh = self._Lookup(key, count=False)
+            if trimesh is not None:
+                return trimesh
+
+            # Load the resolved path so the mesh matches the key.
+            trimesh = get_mesh_environment().ReadTrimeshURI(key[0])
+            if trimesh is None:
+                return None
+
+            nbytes = 0
+            for array in [ trimesh.vertices, trimesh.indices ]:
+                if isinstance(array, numpy.ndarray):
+                    array.flags.writeable = False
+                    nbytes += array.nbytes
+
+            with self._lock:
+                self.num_misses += 1
+
+                if nbytes <= self.max_bytes:
+                    self._entries[key] = (trimesh, nbytes)
+                    self._nbytes += nbytes
+
+                while self._nbytes > self.max_bytes:
+                    _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+                    self._nbytes -= evicted_nbytes
+                    self.num_evicted += 1
+
+        return trimesh
+
+    def _Lookup(self, key, count=True):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+
+            self._entries[key] = entry
+            if count:
+                self.num_hits += 1
+            return entry[0]
+
+    @staticmethod
+    def _GetKey(uri):
+        # Relative paths are resolved like OpenRAVE resolves them, so the same
+        # name may refer to different files depending on the working
+        # directory and OPENRAVE_DATA. The key uses the resolved path.
+        if os.path.exists(uri):
+            path = os.path.abspath(uri)
+        else:
+            path = openravepy.RaveFindLocalFile(uri)
+            if not path:
+                return None
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        return (path, stat.st_mtime, stat.st_size)
+
+mesh_cache = MeshCache()
+
 # Schema.
-mesh_environment = openravepy.Environment()
 identity = lambda x: x
 str_identity = (
-    lambda x: x,
+    lambda x, binary: x,
     lambda x: x.encode()
 )
 both_identity = (
-    lambda x: x,
+    lambda x, binary: x,
     lambda x: x
 )
 numpy_identity = (
-    lambda x: x.tolist(),
+    serialize_array,
     lambda x: numpy.array(x)
 )
 transform_identity = (
@@ -478,43 +944,45 @@ transform_identity = (
 
 KINBODY_STATE_MAP = {
     'description': (
-        lambda x: x.GetDescription(),
+        lambda x, binary: x.GetDescription(),
         lambda x, value: x.SetDescription(value),
     ),
     'link_enable_states': (
-        lambda x: x.GetLinkEnableStates().tolist(),
+        lambda x, binary: x.GetLinkEnableStates().tolist(),
         lambda x, value: x.SetLinkEnableStates(value)
     ),
     'link_velocities': (
-        lambda x: x.GetLinkVelocities().tolist(),
+        lambda x, binary: serialize_array(x.GetLinkVelocities(), binary),
         lambda x, value: x.SetLinkVelocities(value),
     ),
     'transform': (
-        lambda x: serialize_transform(x.GetTransform()),
+        lambda x, binary: serialize_transform(x.GetTransform(), binary),
         lambda x, value: x.SetTransform(deserialize_transform(value)),
     ),
     'dof_weights': (
-        lambda x: x.GetDOFWeights().tolist(),
+        lambda x, binary: serialize_array(x.GetDOFWeights(), binary),
         lambda x, value: x.SetDOFWeights(value),
     ),
     'dof_resolutions': (
-        lambda x: x.GetDOFResolutions().tolist(),
+        lambda x, binary: serialize_array(x.GetDOFResolutions(), binary),
         lambda x, value: x.SetDOFResolutions(value),
     ),
     'dof_position_limits': (
-        lambda x: [ limits.tolist() for limits in x.GetDOFLimits() ],
+        lambda x, binary: [ serialize_array(limits, binary)
+                            for limits in x.GetDOFLimits() ],
         lambda x, (lower, upper): x.SetDOFLimits(lower, upper),
     ),
     'dof_velocity_limits': (
-        lambda x: x.GetDOFVelocityLimits().tolist(),
+        lambda x, binary: serialize_array(x.GetDOFVelocityLimits(), binary),
         lambda x, value: x.SetDOFVelocityLimits(value),
     ),
     'dof_acceleration_limits': (
-        lambda x: x.GetDOFAccelerationLimits().tolist(),
+        lambda x, binary: serialize_array(x.GetDOFAccelerationLimits(),
+                                          binary),
         lambda x, value: x.SetDOFAccelerationLimits(value),
     ),
     'dof_torque_limits': (
-        lambda x: x.GetDOFTorqueLimits().tolist(),
+        lambda x, binary: serialize_array(x.GetDOFTorqueLimits(), binary),
         lambda x, value: x.SetDOFTorqueLimits(value),
     ),
     # TODO: What about link accelerations and geometry groups?
@@ -522,11 +990,11 @@ KINBODY_STATE_MAP = {
 ROBOT_STATE_MAP = {
     # TODO: Does this preserve affine DOFs?
     'active_dof_indices': (
-        lambda x: x.GetActiveDOFIndices().tolist(),
+        lambda x, binary: x.GetActiveDOFIndices().tolist(),
         lambda x, value: x.SetActiveDOFs(value)
     ),
     'active_manipulator': (
-        lambda x: x.GetActiveManipulator().GetName(),
+        lambda x, binary: x.GetActiveManipulator().GetName(),
         lambda x, value: x.SetActiveManipulator(value),
     ),
 }
@@ -542,7 +1010,8 @@ LINK_INFO_MAP = {
     '_tMassFrame': transform_identity,
     '_vForcedAdjacentLinks': both_identity,
     '_vgeometryinfos': (
-        lambda x: map(serialize_geometry_info, x),
+        lambda x, binary: [ serialize_geometry_info(geom_info, binary)
+                            for geom_info in x ],
         lambda x: map(deserialize_geometry_info, x),
     ),
     '_vinertiamoments': numpy_identity,
@@ -557,12 +1026,12 @@ JOINT_INFO_MAP = {
     '_mapStringParameters': both_identity, # TODO
     '_name': str_identity,
     '_type': (
-        lambda x: x.name,
+        lambda x, binary: x.name,
         lambda x: openravepy.KinBody.JointType.names[x].encode()
     ),
     '_vanchor': numpy_identity,
     '_vaxes': (
-        lambda x: [ xi.tolist() for xi in x ],
+        lambda x, binary: [ serialize_array(xi, binary) for xi in x ],
         lambda x: map(numpy.array, x)
     ),
     '_vcurrentvalues': numpy_identity,
@@ -586,7 +1055,7 @@ GEOMETRY_INFO_MAP = {
     '_filenamerender': str_identity,
     '_t': transform_identity,
     '_type': (
-        lambda x: x.name,
+        lambda x, binary: x.name,
         lambda x: openravepy.GeometryType.names[x]
     ),
     '_vAmbientColor': numpy_identity,
@@ -28,5 +28,6 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
-import rodrigues, tsr, tsrlibrary
+import rodrigues, sampling, tsr, tsrlibrary
 from tsr import *
+from sampling import HaltonSampler, UniformSampler
@@ -0,0 +1,124 @@
+# Copyright (c) 2015, Carnegie Mellon University
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# - Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# - Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# - Neither the name of Carnegie Mellon University nor the names of its
+#   contributors may be used to endorse or promote products derived from this
+#   software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import numpy
+import numpy.random
+
+
+class UniformSampler(object):
+    """ Sampler that draws independent uniform samples from [0, 1). """
+    def __init__(self, seed=None):
+        """
+        @param seed optional seed for reproducible samples
+        """
+        self.seed = seed
+        self.reset()
+
+    def reset(self):
+        """ Restart the sequence of samples. """
+        self.random_state = numpy.random.RandomState(self.seed)
+
+    def sample(self, num_samples, num_dims):
+        """
+        Draw samples from the unit hypercube.
+        @param num_samples number of samples
+        @param num_dims dimension of each sample
+        @return (num_samples, num_dims) array of values in [0, 1)
+        """
+        return self.random_state.random_sample((num_samples, num_dims))
+
+
+class HaltonSampler(object):
+    """
+    Sampler that draws a scrambled Halton sequence from [0, 1).
+
+    Successive calls to sample continue the same sequence, so any number of
+    consecutive batches cover the unit hypercube evenly. The digits of each
+    dimension are scrambled with a random permutation to break the
+    correlation between higher dimensions of the plain Halton sequence. The
+    permutations are drawn from seed, so seeded samplers are reproducible.
+    """
+    def __init__(self, seed=None, skip=1):
+        """
+        @param seed optional seed for the scrambling permutations
+        @param skip number of initial points of the sequence to skip
+        """
+        self.seed = seed
+        self.skip = skip
+        self.reset()
+
+    def reset(self):
+        """ Restart the sequence of samples. """
+        self.random_state = numpy.random.RandomState(self.seed)
+        self.index = self.skip
+        self.bases = []
+        self.permutations = []
+
+    def sample(self, num_samples, num_dims):
+        """
+        Draw the next points of the sequence.
+        @param num_samples number of samples
+        @param num_dims dimension of each sample
+        @return (num_samples, num_dims) array of values in [0, 1)
+        """
+        self._extend(num_dims)
+
+        indices = numpy.arange(self.index, self.index + num_samples)
+        self.index += num_samples
+
+        samples = numpy.empty((num_samples, num_dims))
+        for dim in xrange(num_dims):
+            samples[:, dim] = self._radical_inverse(
+                indices, self.bases[dim], self.permutations[dim])
+        return samples
+
+    def _extend(self, num_dims):
+        # Each dimension uses the next prime number as its base.
+        candidate = self.bases[-1] + 1 if self.bases else 2
+        while len(self.bases) < num_dims:
+            if all(candidate % base != 0 for base in self.bases):
+                # Zero must map to zero so that trailing digits vanish.
+                permutation = numpy.zeros(candidate, dtype=int)
+                permutation[1:] = 1 + self.random_state.permutation(
+                    candidate - 1)
+
+                self.bases.append(candidate)
+                self.permutations.append(permutation)
+            candidate += 1
+
+    @staticmethod
+    def _radical_inverse(indices, base, permutation):
+        result = numpy.zeros(indices.shape)
+        scale = 1. / base
+        remaining = indices.copy()
+
+        while numpy.any(remaining > 0):
+            remaining, digits = numpy.divmod(remaining, base)
+            result += permutation[digits] * scale
+            scale /= base
+
+        return result
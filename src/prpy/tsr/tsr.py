@@ -29,6 +29,75 @@ import openravepy
 import numpy
 import numpy.random
 import kin
+from ..kin import _matmul
+
+
+def _xyzrpy_to_H(xyzrpy):
+    """
+    Convert an (n, 6) array of [x, y, z, roll, pitch, yaw] vectors to an
+    (n, 4, 4) array of transforms. Rotations are applied in yaw, pitch, roll
+    order about the fixed z, y, and x axes, matching kin.pose_from_xyzypr.
+    """
+    xyzrpy = numpy.asarray(xyzrpy, dtype=float)
+    return kin.xyzypr_to_H(xyzrpy[:, [0, 1, 2, 5, 4, 3]])
+
+
+def _H_to_xyzrpy(H):
+    """
+    Convert an (n, 4, 4) array of transforms to [x, y, z, roll, pitch, yaw]
+    vectors. This is the inverse of _xyzrpy_to_H. Every rotation has two
+    such representations, (r, p, y) and (r + pi, pi - p, y + pi), so both
+    are returned as (n, 6) arrays.
+    """
+    R = H[:, 0:3, 0:3]
+    xyzrpy = numpy.empty((H.shape[0], 6))
+    xyzrpy[:, 0:3] = H[:, 0:3, 3]
+    xyzrpy[:, 3] = numpy.arctan2(R[:, 2, 1], R[:, 2, 2])
+    xyzrpy[:, 4] = -numpy.arcsin(numpy.clip(R[:, 2, 0], -1., 1.))
+    xyzrpy[:, 5] = numpy.arctan2(R[:, 1, 0], R[:, 0, 0])
+
+    # At pitch = +/-pi/2 only roll - yaw (or roll + yaw) is defined. Choose
+    # zero roll.
+    gimbal_lock = numpy.abs(R[:, 2, 0]) > 1. - 1e-9
+    xyzrpy[gimbal_lock, 3] = 0.
+    xyzrpy[gimbal_lock, 5] = numpy.arctan2(-R[gimbal_lock, 0, 1],
+                                           R[gimbal_lock, 1, 1])
+
+    xyzrpy_alt = xyzrpy.copy()
+    xyzrpy_alt[:, 3] = _wrap_to_pi(xyzrpy[:, 3] + numpy.pi)
+    xyzrpy_alt[:, 4] = _wrap_to_pi(numpy.pi - xyzrpy[:, 4])
+    xyzrpy_alt[:, 5] = _wrap_to_pi(xyzrpy[:, 5] + numpy.pi)
+    return xyzrpy, xyzrpy_alt
+
+
+def _wrap_to_pi(angles):
+    return (angles + numpy.pi) % (2. * numpy.pi) - numpy.pi
+
+
+def _bw_violation(xyzrpy, Bw):
+    """
+    Compute how far [x, y, z, roll, pitch, yaw] vectors are outside of Bw
+    and project them onto Bw. Angles wrap around.
+    @return (violation, projection) tuple of (n, 6) arrays
+    """
+    lower, upper = Bw[:, 0], Bw[:, 1]
+    projection = numpy.clip(xyzrpy, lower, upper)
+    violation = numpy.abs(xyzrpy - projection)
+
+    # Measure angles counterclockwise from the lower bound.
+    width = upper[3:6] - lower[3:6]
+    offset = (xyzrpy[:, 3:6] - lower[3:6]) % (2. * numpy.pi)
+    to_upper = offset - width
+    to_lower = 2. * numpy.pi - offset
+
+    is_inside = (offset <= width) | (width >= 2. * numpy.pi)
+    is_closer_to_upper = to_upper < to_lower
+    violation[:, 3:6] = numpy.where(
+        is_inside, 0., numpy.minimum(to_upper, to_lower))
+    projection[:, 3:6] = numpy.where(
+        is_inside, lower[3:6] + offset,
+        numpy.where(is_closer_to_upper, upper[3:6], lower[3:6]))
+    return violation, projection
 
 
 class TSR(object):
@@ -52,7 +121,10 @@ class TSR(object):
             self.manipindex = manip
         self.bodyandlink = bodyandlink
 
-    def sample(self, vals=None):
+    def sample(self, vals=None, sampler=None):
+        if vals is None and sampler is not None:
+            return self.sample_batch(1, sampler=sampler)[0]
+
         Bwdims = 0
         for i in range(6):
             if self.Bw[i, 0] != self.Bw[i, 1]:
@@ -82,6 +154,138 @@ class TSR(object):
         trans = numpy.dot(numpy.dot(self.T0_w, Tw), self.Tw_e)
         return trans
 
+    def sample_batch(self, num_samples=None, vals=None, T0_w=None,
+                     sampler=None):
+        """
+        Sample many end-effector transforms at once.
+
+        This is a vectorized version of sample that does not modify the TSR.
+        Either num_samples or vals must be specified. If a sampler is given,
+        e.g. a HaltonSampler, it is used to draw the values of the dimensions
+        of Bw that are not fixed instead of numpy.random.
+
+        @param num_samples number of random samples to draw
+        @param vals optional (n, 6) array of Bw values, or (n, d) array of
+                    values for the d dimensions of Bw that are not fixed
+        @param T0_w optional (4, 4) or (n, 4, 4) transform(s) to use instead
+                    of this TSR's T0_w
+        @param sampler optional sampler used to draw the values
+        @return (n, 4, 4) array of transforms
+        """
+        free = self.Bw[:, 0] != self.Bw[:, 1]
+        Bwdims = numpy.sum(free)
+
+        if vals is None and sampler is not None:
+            if num_samples is None:
+                raise ValueError('Either num_samples or vals must be specified.')
+
+            vals = self.Bw[free, 0] + (self.Bw[free, 1] - self.Bw[free, 0]) \
+                * sampler.sample(num_samples, Bwdims)
+
+        if vals is None:
+            if num_samples is None:
+                raise ValueError('Either num_samples or vals must be specified.')
+
+            Bwvals = self.Bw[:, 0] + (self.Bw[:, 1] - self.Bw[:, 0]) \
+                * numpy.random.random_sample((num_samples, 6))
+        else:
+            vals = numpy.asarray(vals, dtype=float)
+            if vals.ndim == 1:
+                vals = vals[numpy.newaxis, :]
+
+            if vals.shape[1] == Bwdims:
+                Bwvals = numpy.tile(self.Bw[:, 0], (vals.shape[0], 1))
+                Bwvals[:, free] = vals
+            elif vals.shape[1] == 6:
+                Bwvals = vals
+            else:
+                raise ValueError('vals must be of length %d or 6!' % Bwdims)
+
+        if T0_w is None:
+            T0_w = self.T0_w
+
+        Tw = _xyzrpy_to_H(Bwvals)
+        return _matmul(_matmul(T0_w, Tw), self.Tw_e)
+
+    def to_bw(self, poses, T0_w=None):
+        """
+        Express end-effector poses in the coordinates of Bw.
+
+        Each pose T0_e is converted to Tw = inv(T0_w) * T0_e * inv(Tw_e) and
+        represented as [x, y, z, roll, pitch, yaw]. Of the two equivalent
+        roll-pitch-yaw representations, the one closest to Bw is returned.
+
+        @param poses (n, 4, 4) array of end-effector poses
+        @param T0_w optional (4, 4) or (n, 4, 4) transform(s) to use instead
+                    of this TSR's T0_w
+        @return (n, 6) array of Bw coordinates
+        """
+        return self._to_bw(poses, T0_w)[0]
+
+    def distance(self, poses, T0_w=None):
+        """
+        Compute the distance from end-effector poses to this TSR.
+
+        The distance is the norm of the amount by which each Bw coordinate of
+        the pose is outside of its bounds, accounting for angle wrap-around.
+        It is zero if, and only if, the pose is in the TSR.
+
+        @param poses (n, 4, 4) array of end-effector poses
+        @param T0_w optional (4, 4) or (n, 4, 4) transform(s) to use instead
+                    of this TSR's T0_w
+        @return (n,) array of distances
+        """
+        violation = self._to_bw(poses, T0_w)[1]
+        return numpy.sqrt(numpy.sum(violation**2, axis=1))
+
+    def contains(self, poses, tolerance=1e-6, T0_w=None):
+        """
+        Check whether end-effector poses are in this TSR.
+        @param poses (n, 4, 4) array of end-effector poses
+        @param tolerance tolerance on each Bw coordinate
+        @param T0_w optional (4, 4) or (n, 4, 4) transform(s) to use instead
+                    of this TSR's T0_w
+        @return (n,) boolean array
+        """
+        violation = self._to_bw(poses, T0_w)[1]
+        return numpy.all(violation <= tolerance, axis=1)
+
+    def project(self, poses, T0_w=None):
+        """
+        Find the closest poses in this TSR by clamping each Bw coordinate to
+        its bounds, accounting for angle wrap-around.
+        @param poses (n, 4, 4) array of end-effector poses
+        @param T0_w optional (4, 4) or (n, 4, 4) transform(s) to use instead
+                    of this TSR's T0_w
+        @return (n, 4, 4) array of poses in the TSR
+        """
+        if T0_w is None:
+            T0_w = self.T0_w
+
+        projection = self._to_bw(poses, T0_w)[2]
+        return self.sample_batch(vals=projection, T0_w=T0_w)
+
+    def _to_bw(self, poses, T0_w):
+        if T0_w is None:
+            T0_w = self.T0_w
+
+        poses = numpy.asarray(poses, dtype=float)
+        if poses.ndim == 2:
+            poses = poses[numpy.newaxis, :, :]
+
+        Tw = _matmul(_matmul(kin.invert_H(T0_w), poses), kin.invert_H(self.Tw_e))
+        candidates = [ (xyzrpy,) + _bw_violation(xyzrpy, self.Bw)
+                       for xyzrpy in _H_to_xyzrpy(Tw) ]
+
+        # Use the roll-pitch-yaw representation that is closest to Bw.
+        (xyzrpy, violation, projection), (xyzrpy_alt, violation_alt,
+            projection_alt) = candidates
+        use_alt = (numpy.sum(violation_alt**2, axis=1)
+                   < numpy.sum(violation**2, axis=1))[:, numpy.newaxis]
+        return (numpy.where(use_alt, xyzrpy_alt, xyzrpy),
+                numpy.where(use_alt, violation_alt, violation),
+                numpy.where(use_alt, projection_alt, projection))
+
     def to_dict(self):
         """ Convert this TSR to a python dict. """
         return {
@@ -231,7 +435,11 @@ class TSRChain(object):
         x_dict = yaml.safe_load(x, *args, **kw_args)
         return TSR.from_dict(x_dict)
 
-    def sample(self):
+    def sample(self, sampler=None):
+        if sampler is not None:
+            samples = self.sample_batch(1, sampler=sampler)
+            return samples[0] if samples is not None else None
+
         if len(self.TSRs) == 0:
             return None
 
@@ -242,3 +450,137 @@ class TSRChain(object):
             T0_w = tsr_current.sample()
 
         return T0_w
+
+    def sample_batch(self, num_samples, sampler=None):
+        """
+        Sample many end-effector transforms from this TSR chain at once.
+
+        This is a vectorized version of sample that, unlike sample, does not
+        modify the T0_w of the TSRs in the chain. If a sampler is given, it
+        draws the free dimensions of all TSRs in the chain jointly.
+
+        @param num_samples number of samples to draw
+        @param sampler optional sampler used to draw the values
+        @return (num_samples, 4, 4) array of transforms, or None if the chain
+                is empty
+        """
+        if len(self.TSRs) == 0:
+            return None
+
+        if sampler is not None:
+            free_masks = [ tsr.Bw[:, 0] != tsr.Bw[:, 1] for tsr in self.TSRs ]
+            offsets = numpy.cumsum([ 0 ] + [ numpy.sum(free) for free in free_masks ])
+            unit_vals = sampler.sample(num_samples, offsets[-1])
+
+        T0_w = self.TSRs[0].T0_w
+        for i, tsr in enumerate(self.TSRs):
+            if sampler is not None:
+                free = free_masks[i]
+                vals = tsr.Bw[free, 0] + (tsr.Bw[free, 1] - tsr.Bw[free, 0]) \
+                    * unit_vals[:, offsets[i]:offsets[i + 1]]
+                T0_w = tsr.sample_batch(vals=vals, T0_w=T0_w)
+            else:
+                T0_w = tsr.sample_batch(num_samples, T0_w=T0_w)
+
+        return T0_w
+
+    def distance(self, poses, num_samples=8, num_iterations=10):
+        """
+        Compute the distance from end-effector poses to this TSR chain.
+
+        For a chain with a single TSR, this is TSR.distance. For longer
+        chains, the last TSR's T0_w depends on the other TSRs, so the distance
+        is approximated. Starting from num_samples random samples of the
+        chain, the Bw coordinates of each TSR are repeatedly projected onto
+        its bounds while holding the others fixed. The result is an upper
+        bound on the true distance.
+
+        @param poses (n, 4, 4) array of end-effector poses
+        @param num_samples number of initial samples for longer chains
+        @param num_iterations number of refinement iterations for longer
+                              chains
+        @return (n,) array of distances
+        """
+        distances, _ = self._distance(poses, num_samples, num_iterations)
+        return distances
+
+    def contains(self, poses, tolerance=1e-6, num_samples=8,
+                 num_iterations=10):
+        """
+        Check whether end-effector poses are in this TSR chain. For chains
+        with more than one TSR, this is approximate; see distance.
+        @param poses (n, 4, 4) array of end-effector poses
+        @param tolerance distance tolerance
+        @param num_samples number of initial samples for longer chains
+        @param num_iterations number of refinement iterations for longer
+                              chains
+        @return (n,) boolean array
+        """
+        return self.distance(poses, num_samples=num_samples,
+                             num_iterations=num_iterations) <= tolerance
+
+    def project(self, poses, num_samples=8, num_iterations=10):
+        """
+        Find close poses in this TSR chain. For chains with more than one
+        TSR, this is approximate; see distance.
+        @param poses (n, 4, 4) array of end-effector poses
+        @param num_samples number of initial samples for longer chains
+        @param num_iterations number of refinement iterations for longer
+                              chains
+        @return (n, 4, 4) array of poses in the TSR chain
+        """
+        _, T0_w = self._distance(poses, num_samples, num_iterations)
+        return self.TSRs[-1].project(poses, T0_w=T0_w)
+
+    def _distance(self, poses, num_samples, num_iterations):
+        """
+        @return (distances, T0_w) tuple, where T0_w is the (n, 4, 4) array of
+                transforms of the last TSR that minimize the distance
+        """
+        if len(self.TSRs) == 0:
+            raise ValueError('TSR chain is empty.')
+
+        poses = numpy.asarray(poses, dtype=float)
+        if poses.ndim == 2:
+            poses = poses[numpy.newaxis, :, :]
+
+        last_tsr = self.TSRs[-1]
+        if len(self.TSRs) == 1:
+            return last_tsr.distance(poses), last_tsr.T0_w
+
+        # Refine num_samples random starting points for every pose.
+        num_poses = poses.shape[0]
+        targets = numpy.repeat(poses, num_samples, axis=0)
+        num_targets = targets.shape[0]
+        identity = numpy.eye(4)
+
+        bw_vals = [ tsr.Bw[:, 0] + (tsr.Bw[:, 1] - tsr.Bw[:, 0])
+                    * numpy.random.random_sample((num_targets, 6))
+                    for tsr in self.TSRs ]
+
+        def get_T0_w(index):
+            T0_w = self.TSRs[0].T0_w
+            for tsr, vals in zip(self.TSRs[:index], bw_vals[:index]):
+                T0_w = tsr.sample_batch(vals=vals, T0_w=T0_w)
+            return T0_w
+
+        for _ in xrange(num_iterations):
+            for index in reversed(xrange(len(self.TSRs))):
+                # Solve for the pose this TSR must reach so that the rest of
+                # the chain ends at the target, then project it onto the TSR.
+                T_suffix = numpy.tile(identity, (num_targets, 1, 1))
+                for tsr, vals in zip(self.TSRs[index + 1:],
+                                     bw_vals[index + 1:]):
+                    T_suffix = _matmul(
+                        T_suffix, tsr.sample_batch(vals=vals, T0_w=identity))
+
+                tsr = self.TSRs[index]
+                tsr_targets = _matmul(targets, kin.invert_H(T_suffix))
+                bw_vals[index] = tsr._to_bw(tsr_targets, get_T0_w(index))[2]
+
+        T0_w = get_T0_w(len(self.TSRs) - 1)
+        distances = last_tsr.distance(targets, T0_w=T0_w)
+        distances = distances.reshape((num_poses, num_samples))
+        best = (numpy.arange(num_poses) * num_samples
+                + numpy.argmin(distances, axis=1))
+        return distances.ravel()[best], T0_w[best]
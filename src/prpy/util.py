@@ -31,6 +31,7 @@
 
 import logging, numpy, openravepy, scipy.misc, time, threading, math
 import scipy.optimize
+from kin import invert_H, _matmul
 
 
 logger = logging.getLogger(__name__)
@@ -628,49 +629,181 @@ def ComputeJointVelocityFromTwist(robot, twist,
     return dq_opt, twist_opt
 
 
+def AxisAngleFromRotationMatrix(R):
+    '''
+    Computes the axis-angle representation (the log map) of a rotation
+    matrix or a stack of rotation matrices. This is a vectorized equivalent
+    of openravepy.axisAngleFromRotationMatrix.
+
+    @param R (3, 3) rotation matrix or (..., 3, 3) stack of rotation matrices
+    @return rotation axis scaled by the rotation angle in [0, pi], with shape
+            (3,) or (..., 3)
+    '''
+    R = numpy.asarray(R, dtype=float)
+    if R.ndim == 2:
+        return _AxisAngleFromRotationMatrixSingle(R)
+
+    # The skew-symmetric part of R is sin(angle) [axis]_x and its trace is
+    # 1 + 2 cos(angle). arctan2 is accurate near both 0 and pi.
+    v = numpy.empty(R.shape[:-1])
+    v[..., 0] = R[..., 2, 1] - R[..., 1, 2]
+    v[..., 1] = R[..., 0, 2] - R[..., 2, 0]
+    v[..., 2] = R[..., 1, 0] - R[..., 0, 1]
+    sin_angle = 0.5 * numpy.sqrt(numpy.sum(v**2, axis=-1))
+    cos_angle = 0.5 * (R[..., 0, 0] + R[..., 1, 1] + R[..., 2, 2] - 1.)
+    angle = numpy.arctan2(sin_angle, cos_angle)
+
+    # Scale v by angle / (2 sin(angle)). Use the Taylor series near zero.
+    is_small = sin_angle < 1e-6
+    scale = numpy.where(is_small, 0.5 + angle**2 / 12.,
+                        0.5 * angle / numpy.where(is_small, 1., sin_angle))
+    omega = scale[..., numpy.newaxis] * v
+
+    # Past pi / 2, v loses precision as it vanishes, so the axis is recovered
+    # from the symmetric part of R: cos(angle) I + (1 - cos(angle)) a a^T.
+    is_large = cos_angle < 0.
+    if numpy.any(is_large):
+        R_large = R[is_large]
+        c = cos_angle[is_large][:, numpy.newaxis, numpy.newaxis]
+        axis_outer = (0.5 * (R_large + numpy.swapaxes(R_large, -1, -2))
+                      - c * numpy.eye(3)) / (1. - c)
+
+        # Use the column of a a^T with the largest diagonal element.
+        indices = numpy.argmax(numpy.diagonal(axis_outer, axis1=-2, axis2=-1),
+                               axis=-1)
+        rows = numpy.arange(indices.shape[0])
+        axis = axis_outer[rows, :, indices]
+        axis /= numpy.sqrt(numpy.sum(axis**2, axis=-1))[:, numpy.newaxis]
+
+        # Choose the sign that matches the skew-symmetric part.
+        sign = numpy.where(numpy.sum(axis * v[is_large], axis=-1) < 0., -1., 1.)
+        omega[is_large] = (sign * angle[is_large])[:, numpy.newaxis] * axis
+
+    return omega
+
+
+def _AxisAngleFromRotationMatrixSingle(R):
+    # Scalar version of AxisAngleFromRotationMatrix. This is several times
+    # faster for a single matrix than the vectorized version.
+    (r00, r01, r02), (r10, r11, r12), (r20, r21, r22) = R.tolist()
+    v = [ r21 - r12, r02 - r20, r10 - r01 ]
+    sin_angle = 0.5 * math.sqrt(v[0]**2 + v[1]**2 + v[2]**2)
+    cos_angle = 0.5 * (r00 + r11 + r22 - 1.)
+    angle = math.atan2(sin_angle, cos_angle)
+
+    if cos_angle < 0.:
+        c = cos_angle
+        axis_outer = [ [ (r00 - c) / (1. - c), 0.5 * (r01 + r10) / (1. - c),
+                         0.5 * (r02 + r20) / (1. - c) ],
+                       [ 0.5 * (r10 + r01) / (1. - c), (r11 - c) / (1. - c),
+                         0.5 * (r12 + r21) / (1. - c) ],
+                       [ 0.5 * (r20 + r02) / (1. - c),
+                         0.5 * (r21 + r12) / (1. - c), (r22 - c) / (1. - c) ] ]
+        index = max(range(3), key=lambda i: axis_outer[i][i])
+        axis = [ axis_outer[i][index] for i in range(3) ]
+        norm = math.sqrt(axis[0]**2 + axis[1]**2 + axis[2]**2)
+        if axis[0] * v[0] + axis[1] * v[1] + axis[2] * v[2] < 0.:
+            norm = -norm
+        return numpy.array([ angle * a / norm for a in axis ])
+    elif sin_angle < 1e-6:
+        scale = 0.5 + angle**2 / 12.
+    else:
+        scale = 0.5 * angle / sin_angle
+
+    return numpy.array([ scale * x for x in v ])
+
+
+def _GeodesicRelative(t1, t2):
+    '''
+    Computes inv(t1) * t2 for transforms or stacks of transforms, using the
+    analytic inverse of a rigid transform.
+    '''
+    t1 = numpy.asarray(t1, dtype=float)
+    t2 = numpy.asarray(t2, dtype=float)
+    if t1.ndim == 2 and t2.ndim == 2:
+        return t1, numpy.dot(invert_H(t1), t2)
+    else:
+        return t1, _matmul(invert_H(t1), t2)
+
+
+def _RotateVectors(R, v):
+    # Computes R * v for rotation matrices and vectors, or stacks of them.
+    if R.ndim == 2 and v.ndim == 1:
+        return numpy.dot(R, v)
+    else:
+        return numpy.sum(R * v[..., numpy.newaxis, :], axis=-1)
+
+
 def GeodesicTwist(t1, t2):
     '''
     Computes the twist in global coordinates that corresponds
     to the gradient of the geodesic distance between two transforms.
 
+    Either argument may also be a (..., 4, 4) stack of transforms, in which
+    case the arguments are broadcast against each other.
+
     @param t1 current transform
     @param t2 goal transform
     @return twist in se(3)
     '''
-    trel = numpy.dot(numpy.linalg.inv(t1), t2)
-    trans = numpy.dot(t1[0:3, 0:3], trel[0:3, 3])
-    omega = numpy.dot(t1[0:3, 0:3],
-                      openravepy.axisAngleFromRotationMatrix(
-                        trel[0:3, 0:3]))
-    return numpy.hstack((trans, omega))
+    t1, trel = _GeodesicRelative(t1, t2)
+    R1 = t1[..., 0:3, 0:3]
+    trans = _RotateVectors(R1, trel[..., 0:3, 3])
+    omega = _RotateVectors(R1, AxisAngleFromRotationMatrix(trel[..., 0:3, 0:3]))
+    return numpy.concatenate((trans, omega), axis=-1)
 
 
 def GeodesicError(t1, t2):
     '''
     Computes the error in global coordinates between two transforms
 
+    Either argument may also be a (..., 4, 4) stack of transforms, in which
+    case the arguments are broadcast against each other.
+
     @param t1 current transform
     @param t2 goal transform
     @return a 4-vector of [dx, dy, dz, solid angle]
     '''
-    trel = numpy.dot(numpy.linalg.inv(t1), t2)
-    trans = numpy.dot(t1[0:3, 0:3], trel[0:3, 3])
-    omega = openravepy.axisAngleFromRotationMatrix(trel[0:3, 0:3])
-    angle = numpy.linalg.norm(omega)
-    return numpy.hstack((trans, angle))
+    t1, trel = _GeodesicRelative(t1, t2)
+    trans = _RotateVectors(t1[..., 0:3, 0:3], trel[..., 0:3, 3])
+    omega = AxisAngleFromRotationMatrix(trel[..., 0:3, 0:3])
+    angle = numpy.sqrt(numpy.sum(omega**2, axis=-1))
+    return numpy.concatenate((trans, angle[..., numpy.newaxis]), axis=-1)
 
 
 def GeodesicDistance(t1, t2, r=1.0):
     '''
     Computes the geodesic distance between two transforms
 
+    Either argument may also be a (..., 4, 4) stack of transforms, in which
+    case the arguments are broadcast against each other.
+
     @param t1 current transform
     @param t2 goal transform
     @param r in units of meters/radians converts radians to meters
     '''
     error = GeodesicError(t1, t2)
-    error[3] = r*error[3]
-    return numpy.linalg.norm(error)
+    error[..., 3] *= r
+    return numpy.sqrt(numpy.sum(error**2, axis=-1))
+
+
+def FindNearestPose(t, candidates, r=1.0):
+    '''
+    Finds the candidate transform with the smallest geodesic distance to a
+    transform, e.g. the closest of a set of goal poses.
+
+    @param t transform
+    @param candidates (N, 4, 4) array of candidate transforms
+    @param r in units of meters/radians converts radians to meters
+    @return index of the nearest candidate and its distance
+    '''
+    candidates = numpy.asarray(candidates, dtype=float).reshape((-1, 4, 4))
+    if candidates.shape[0] == 0:
+        raise ValueError('There are no candidate transforms.')
+
+    distances = GeodesicDistance(t, candidates, r=r)
+    index = numpy.argmin(distances)
+    return index, distances[index]
 
 def FindCatkinResource(package, relative_path):
     '''
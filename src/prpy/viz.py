@@ -100,12 +100,14 @@ class RenderTSRList(RenderPoses):
     @param render If false, this class does nothing
     """
     def __init__(self, tsr_list, env, num_samples=25, length=0.2, render=True):
-        import random
+        # Choose a random TSR chain for each sample, then sample each chain
+        # in one batch.
+        tsr_chain_idxs = numpy.random.randint(0, len(tsr_list), num_samples)
         poses = []
-        for idx in range(num_samples):
-            tsr_chain_idx = random.randint(0, len(tsr_list) - 1)
-            tsr_chain = tsr_list[tsr_chain_idx]
-            poses.append(tsr_chain.sample())
+        for tsr_chain_idx, tsr_chain in enumerate(tsr_list):
+            num_chain_samples = numpy.sum(tsr_chain_idxs == tsr_chain_idx)
+            if num_chain_samples > 0:
+                poses.extend(tsr_chain.sample_batch(num_chain_samples))
         RenderPoses.__init__(self, poses, env, length=length, render=render)
 
 class RenderVector(object):
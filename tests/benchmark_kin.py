@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""
+Benchmark the throughput of the prpy.kin conversions.
+
+Each conversion is run once on a stack of transforms, quaternions, or poses
+and once in a Python loop over the same values.
+"""
+import argparse, numpy, time
+from prpy import kin
+
+def benchmark(function, args, num_loop):
+    start_time = time.time()
+    function(*args)
+    batch_rate = args[0].shape[0] / (time.time() - start_time)
+
+    start_time = time.time()
+    for values in zip(*[ arg[0:num_loop] for arg in args ]):
+        function(*values)
+    loop_rate = num_loop / (time.time() - start_time)
+
+    return batch_rate, loop_rate
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--num-conversions', type=int, default=100000)
+    parser.add_argument('--num-loop', type=int, default=10000,
+                        help='number of conversions to run in a Python loop')
+    args = parser.parse_args()
+
+    random_state = numpy.random.RandomState(0)
+    xyzypr = random_state.uniform(-numpy.pi, numpy.pi, (args.num_conversions, 6))
+    poses = kin.pose_from_xyzypr(xyzypr)
+    quats = poses[:, 3:7]
+    Hs = kin.pose_to_H(poses)
+    Rs = Hs[:, 0:3, 0:3]
+
+    conversions = [
+        ('R_to_quat', kin.R_to_quat, (Rs,)),
+        ('R_from_quat', kin.R_from_quat, (quats,)),
+        ('quat_to_ypr', kin.quat_to_ypr, (quats,)),
+        ('quat_from_ypr', kin.quat_from_ypr, (xyzypr[:, 3:6],)),
+        ('pose_from_xyzypr', kin.pose_from_xyzypr, (xyzypr,)),
+        ('pose_to_xyzypr', kin.pose_to_xyzypr, (poses,)),
+        ('pose_to_H', kin.pose_to_H, (poses,)),
+        ('pose_from_H', kin.pose_from_H, (Hs,)),
+        ('xyzypr_to_H', kin.xyzypr_to_H, (xyzypr,)),
+        ('invert_H', kin.invert_H, (Hs,)),
+        ('H_from_op_diff', kin.H_from_op_diff, (Hs[:, 0:3, 3], Hs[:, 0:3, 2])),
+        ('transform_comparison', kin.transform_comparison, (Hs, Hs[::-1])),
+    ]
+
+    print '{:d} conversions (conversions per second)'.format(args.num_conversions)
+    print '{:<22s}{:>14s}{:>14s}{:>10s}'.format('', 'stack', 'loop', 'speedup')
+    for name, function, function_args in conversions:
+        batch_rate, loop_rate = benchmark(function, function_args, args.num_loop)
+        print '{:<22s}{:>14.0f}{:>14.0f}{:>9.1f}x'.format(
+            name, batch_rate, loop_rate, batch_rate / loop_rate)
+
+if __name__ == '__main__':
+    main()
@@ -67,3 +67,177 @@ class FailPlanner(MockPlanner):
             raise prpy.planning.PlanningError('FailPlanner')
 
         return self._PlanGeneric(Failure_impl, robot)
+
+def rotz(angle):
+    H = numpy.eye(4)
+    H[0:2, 0:2] = [ [ numpy.cos(angle), -numpy.sin(angle) ],
+                    [ numpy.sin(angle),  numpy.cos(angle) ] ]
+    return H
+
+def roty(angle):
+    H = numpy.eye(4)
+    H[0, 0] = H[2, 2] = numpy.cos(angle)
+    H[0, 2] = numpy.sin(angle)
+    H[2, 0] = -numpy.sin(angle)
+    return H
+
+def translation(x):
+    H = numpy.eye(4)
+    H[0, 3] = x
+    return H
+
+class ContextMock(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+class EnvMock(ContextMock):
+    def __init__(self, robot):
+        self.robot = robot
+        self.colliding = set()
+
+    def CheckCollision(self, body):
+        return tuple(self.robot.dof_values) in self.colliding
+
+class JointMock(object):
+    def __init__(self, dof_index, circular):
+        self.dof_index = dof_index
+        self.circular = circular
+
+    def GetDOFIndex(self):
+        return self.dof_index
+
+    def IsCircular(self, axis):
+        return self.circular
+
+class LinkMock(object):
+    def __init__(self):
+        self.transform = numpy.eye(4)
+
+    def GetTransform(self):
+        return self.transform
+
+class RobotMock(object):
+    """ Robot whose DOFs all belong to one manipulator. """
+    def __init__(self, num_dofs=2, circular=None, dof_limit=1.):
+        if circular is None:
+            circular = [ False ] * num_dofs
+
+        self.env = EnvMock(self)
+        self.joints = [ JointMock(i, c) for i, c in enumerate(circular) ]
+        self.dof_values = numpy.zeros(num_dofs)
+        self.dof_limit = dof_limit
+        self.self_colliding = set()
+        self.manipulator = None
+
+    def GetName(self):
+        return 'robot'
+
+    def GetEnv(self):
+        return self.env
+
+    def GetKinematicsGeometryHash(self):
+        return 'robot'
+
+    def CreateRobotStateSaver(self):
+        return ContextMock()
+
+    def GetActiveManipulator(self):
+        return self.manipulator
+
+    def GetJointFromDOFIndex(self, dof_index):
+        return self.joints[dof_index]
+
+    def GetDOFValues(self, indices=None):
+        if indices is None:
+            return self.dof_values.copy()
+        return self.dof_values[indices]
+
+    def SetDOFValues(self, values, indices=None):
+        self.dof_values = numpy.array(values, dtype=float)
+
+    def GetDOFLimits(self, indices=None):
+        limits = self.dof_limit * numpy.ones(self.dof_values.shape[0])
+        return -limits, limits
+
+    def CheckSelfCollision(self):
+        return tuple(self.dof_values) in self.self_colliding
+
+class IkSolverMock(object):
+    def __init__(self, xml_id):
+        self.xml_id = xml_id
+
+    def GetXMLId(self):
+        return self.xml_id
+
+class ManipulatorMock(object):
+    def __init__(self, robot=None):
+        self.robot = RobotMock() if robot is None else robot
+        self.robot.manipulator = self
+        self.base = LinkMock()
+        self.ik_solver = IkSolverMock('ikfast')
+        self.tool_transform = numpy.eye(4)
+        self.solutions = numpy.array([ [ 0., 0. ], [ 1., 1. ] ])
+        self.filter_options = []
+
+    def GetName(self):
+        return 'arm'
+
+    def GetRobot(self):
+        return self.robot
+
+    def GetBase(self):
+        return self.base
+
+    def GetArmIndices(self):
+        return range(self.robot.dof_values.shape[0])
+
+    def GetKinematicsStructureHash(self):
+        return 'arm'
+
+    def GetIkSolver(self):
+        return self.ik_solver
+
+    def GetLocalToolTransform(self):
+        return self.tool_transform
+
+    def FindIKSolutions(self, ik_param, filter_options, **kw_args):
+        self.filter_options.append(filter_options)
+
+        # Emulate OpenRAVE's default self-collision filtering.
+        if filter_options & openravepy.IkFilterOptions.IgnoreSelfCollisions:
+            return self.solutions.copy()
+        return numpy.array([ solution for solution in self.solutions
+                             if tuple(solution) not in self.robot.self_colliding ])
+
+class TwoLinkArmMock(ManipulatorMock):
+    """ Four-DOF arm with two 0.5 m links. """
+    def __init__(self, robot=None):
+        if robot is None:
+            robot = RobotMock(num_dofs=4, dof_limit=numpy.pi)
+        super(TwoLinkArmMock, self).__init__(robot)
+
+    def GetEndEffectorTransform(self, q=None):
+        q = self.robot.dof_values if q is None else q
+        return reduce(numpy.dot, [ rotz(q[0]), roty(q[1]), translation(0.5),
+                                   roty(q[2]), translation(0.5), rotz(q[3]) ])
+
+    def _Differentiate(self, fn, epsilon=1e-7):
+        q = self.robot.dof_values
+        columns = []
+        for i in xrange(4):
+            dq = numpy.zeros(4)
+            dq[i] = epsilon
+            columns.append((fn(q + dq) - fn(q - dq)) / (2 * epsilon))
+        return numpy.column_stack(columns)
+
+    def CalculateJacobian(self):
+        return self._Differentiate(
+            lambda q: self.GetEndEffectorTransform(q)[0:3, 3])
+
+    def CalculateRotationJacobian(self):
+        return self._Differentiate(
+            lambda q: openravepy.quatFromRotationMatrix(
+                self.GetEndEffectorTransform(q)))
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+import numpy, openravepy, unittest
+from prpy.planning.collision import DistanceCollisionChecker
+
+Distance = openravepy.CollisionOptions.Distance
+
+class ReportMock(object):
+    def __init__(self):
+        self.minDistance = DistanceCollisionChecker.MAX_DISTANCE
+
+class CollisionCheckerMock(object):
+    def __init__(self, supports_distance):
+        self.supports_distance = supports_distance
+        self.options = 0
+
+    def GetXMLId(self):
+        return 'mock'
+
+    def GetCollisionOptions(self):
+        return self.options
+
+    def SetCollisionOptions(self, options):
+        if options & Distance and not self.supports_distance:
+            return False
+        self.options = options
+        return True
+
+class EnvMock(object):
+    def __init__(self, supports_distance=True):
+        self.checker = CollisionCheckerMock(supports_distance)
+        self.distance = 0.5
+        self.num_checks = 0
+
+    def GetCollisionChecker(self):
+        return self.checker
+
+    def CheckCollision(self, robot, report):
+        self.num_checks += 1
+        if self.checker.options & Distance:
+            report.minDistance = self.distance
+        return False
+
+class AABBMock(object):
+    def __init__(self, pos):
+        self._pos = numpy.array(pos, dtype=float)
+
+    def pos(self):
+        return self._pos
+
+    def extents(self):
+        return numpy.zeros(3)
+
+class JointMock(object):
+    def IsRevolute(self, axis):
+        return True
+
+    def GetDOFIndex(self):
+        return 0
+
+    def GetJointIndex(self):
+        return 0
+
+    def GetAnchor(self):
+        return numpy.zeros(3)
+
+class LinkMock(object):
+    def GetIndex(self):
+        return 0
+
+    def GetName(self):
+        return 'link'
+
+    def ComputeAABB(self):
+        # A point 1 m from the joint axis.
+        return AABBMock([ 1., 0., 0. ])
+
+class RobotMock(object):
+    """ Robot with one revolute joint that moves a point at radius 1 m. """
+    def __init__(self, env):
+        self.env = env
+        self.q = numpy.zeros(1)
+        self.self_distance = 0.5
+        self.num_self_checks = 0
+
+    def GetEnv(self):
+        return self.env
+
+    def GetActiveDOFIndices(self):
+        return [ 0 ]
+
+    def GetActiveDOFValues(self):
+        return self.q.copy()
+
+    def GetGrabbedInfo(self):
+        return []
+
+    def GetJointFromDOFIndex(self, dof_index):
+        return JointMock()
+
+    def GetLinks(self):
+        return [ LinkMock() ]
+
+    def DoesAffect(self, joint_index, link_index):
+        return True
+
+    def CheckSelfCollision(self, report):
+        self.num_self_checks += 1
+        if self.env.checker.options & Distance:
+            report.minDistance = self.self_distance
+        return False
+
+class DistanceCollisionCheckerTest(unittest.TestCase):
+    def setUp(self):
+        self.env = EnvMock()
+        self.robot = RobotMock(self.env)
+
+    def check(self, checker, q):
+        self.robot.q[:] = q
+        checker.CheckCollision(ReportMock())
+
+    def test_CheckCollision_WithinBudget_SkipsChecks(self):
+        # With a lever arm of 1 + 2 * 0.5, both anchors allow the point to
+        # move up to 0.5 m, i.e. the joint to move less than 0.25 rad.
+        self.robot.self_distance = 1.0
+
+        with DistanceCollisionChecker(self.robot) as checker:
+            self.check(checker, 0.)
+            self.check(checker, 0.1)
+            self.check(checker, -0.2)
+
+            self.assertEqual(self.env.num_checks, 1)
+            self.assertEqual(self.robot.num_self_checks, 1)
+            self.assertEqual(checker.num_checks, 1)
+            self.assertEqual(checker.num_skipped, 2)
+
+            # Leaving the budget of the first anchor checks again.
+            self.check(checker, 0.3)
+
+            self.assertEqual(self.env.num_checks, 2)
+            self.assertEqual(self.robot.num_self_checks, 2)
+            self.assertEqual(checker.num_checks, 2)
+            self.assertEqual(checker.num_skipped, 2)
+
+    def test_CheckCollision_SelfCollisionMarginIsHalved(self):
+        # Both links may move towards each other, so a self distance of 0.5 m
+        # only allows each to move 0.25 m: less than 0.25 / 1.5 rad.
+        with DistanceCollisionChecker(self.robot) as checker:
+            self.check(checker, 0.)
+            self.check(checker, 0.15)
+
+            self.assertEqual(self.env.num_checks, 1)
+            self.assertEqual(self.robot.num_self_checks, 1)
+
+            self.check(checker, 0.2)
+
+            self.assertEqual(self.env.num_checks, 1)
+            self.assertEqual(self.robot.num_self_checks, 2)
+
+    def test_CheckCollision_DistanceUnsupported_ChecksEveryStep(self):
+        env = EnvMock(supports_distance=False)
+        robot = RobotMock(env)
+
+        with DistanceCollisionChecker(robot) as checker:
+            self.assertFalse(checker.use_distance)
+            self.assertEqual(env.checker.options, 0)
+
+            for q in [ 0., 0.01, 0.02 ]:
+                robot.q[:] = q
+                checker.CheckCollision(ReportMock())
+
+        self.assertEqual(env.num_checks, 3)
+        self.assertEqual(robot.num_self_checks, 3)
+        self.assertEqual(checker.num_checks, 3)
+        self.assertEqual(checker.num_skipped, 0)
+
+    def test_Exit_RestoresCollisionOptions(self):
+        with DistanceCollisionChecker(self.robot):
+            self.assertTrue(self.env.checker.options & Distance)
+
+        self.assertEqual(self.env.checker.options, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,8 +3,9 @@ import os
 if os.environ.get('ROS_DISTRO', 'hydro')[0] in 'abcdef':
     import roslib; roslib.load_manifest('prpy')
 
-import openravepy, unittest, numpy
-from prpy.planning.chomp import DistanceFieldManager
+import openravepy, unittest, numpy, shutil, tempfile
+from prpy.planning.chomp import (DistanceFieldManager, DistanceFieldPrefetcher,
+                                 DistanceFieldStore)
 
 class CHOMPModuleMock(object):
     def __init__(self, env):
@@ -33,6 +34,16 @@ class CHOMPModuleMock(object):
         })
         self.sequence += 1
 
+class CHOMPModuleFileMock(CHOMPModuleMock):
+    def computedistancefield(self, kinbody=None, cache_filename=None,
+                             **kw_args):
+        super(CHOMPModuleFileMock, self).computedistancefield(
+            kinbody=kinbody, cache_filename=cache_filename, **kw_args)
+
+        if not os.path.exists(cache_filename):
+            with open(cache_filename, 'w') as sdf_file:
+                sdf_file.write(kinbody.GetName())
+
 class DistanceFieldManagerTest(unittest.TestCase):
     def setUp(self):
         self.env = openravepy.Environment()
@@ -41,8 +52,13 @@ class DistanceFieldManagerTest(unittest.TestCase):
         self.body = self.env.GetKinBody('mug-table')
         self.bodies = set(self.env.GetBodies())
 
+        self.directory = tempfile.mkdtemp()
+        self.store = DistanceFieldStore(directory=self.directory)
         self.module = CHOMPModuleMock(self.env)
-        self.manager = DistanceFieldManager(self.module)
+        self.manager = DistanceFieldManager(self.module, store=self.store)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
 
     def test_GetGeometricState_ChangeEnabledStatusChangesState(self):
         with self.env:
@@ -161,5 +177,172 @@ class DistanceFieldManagerTest(unittest.TestCase):
         self.assertLess(self.module.removefield_args[0]['__sequence__'],
                         self.module.computedistancefield_args[0]['__sequence__'])
 
+    def test_Sync_MovingBodyReusesDistanceField(self):
+        self.manager.sync(self.robot)
+        state_before = self.manager.cache[self.body.GetName()]
+        del self.module.computedistancefield_args[:]
+        del self.module.removefield_args[:]
+
+        pose = self.body.GetTransform()
+        pose[0, 3] += 0.5
+        self.body.SetTransform(pose)
+
+        num_recomputed = self.manager.sync(self.robot)
+
+        self.assertEqual(num_recomputed, 0)
+        self.assertEqual(len(self.module.removefield_args), 1)
+        self.assertEqual(self.module.removefield_args[0]['kinbody'], self.body)
+        self.assertEqual(len(self.module.computedistancefield_args), 1)
+        self.assertEqual(self.module.computedistancefield_args[0]['kinbody'], self.body)
+        self.assertEqual(self.manager.cache[self.body.GetName()], state_before)
+
+    def test_Sync_ComputesMissingDistanceFieldsInParallel(self):
+        worker_modules = []
+
+        def module_factory(env):
+            module = CHOMPModuleFileMock(env)
+            worker_modules.append(module)
+            return module
+
+        manager = DistanceFieldManager(self.module, store=self.store,
+                                       module_factory=module_factory,
+                                       max_parallel=2)
+        num_recomputed = manager.sync(self.robot)
+
+        self.assertEqual(num_recomputed, len(self.bodies))
+        self.assertEqual(len(worker_modules), 2)
+        self.assertEqual(manager.last_sync['num_workers'], 2)
+        self.assertItemsEqual(manager.last_sync['compute_times'].keys(),
+                              [ body.GetName() for body in self.bodies ])
+
+        worker_bodies = [ args['kinbody'].GetName()
+                          for module in worker_modules
+                          for args in module.computedistancefield_args ]
+        self.assertItemsEqual(worker_bodies,
+                              [ body.GetName() for body in self.bodies ])
+
+        # Every field is loaded from disk by the planner's module.
+        computed_bodies = [ args['kinbody'] for args in self.module.computedistancefield_args ]
+        self.assertItemsEqual(self.bodies, computed_bodies)
+        for args in self.module.computedistancefield_args:
+            self.assertTrue(os.path.exists(args['cache_filename']))
+
+class DistanceFieldStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = DistanceFieldStore(directory=self.directory, max_bytes=250)
+        self.computed_paths = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def compute_fn(self, path):
+        self.computed_paths.append(path)
+        if not os.path.exists(path):
+            with open(path, 'w') as sdf_file:
+                sdf_file.write('x' * 100)
+
+    def test_Load_MissComputesIntoTemporaryFile(self):
+        is_hit = self.store.load('a', self.compute_fn)
+
+        self.assertFalse(is_hit)
+        self.assertEqual(len(self.computed_paths), 1)
+        self.assertNotEqual(self.computed_paths[0], self.store.get_path(self.store.get_key('a')))
+        self.assertTrue(os.path.exists(self.store.get_path(self.store.get_key('a'))))
+        self.assertFalse(os.path.exists(self.computed_paths[0]))
+
+    def test_Load_SecondLoadIsHit(self):
+        self.store.load('a', self.compute_fn)
+        is_hit = self.store.load('a', self.compute_fn)
+
+        self.assertTrue(is_hit)
+        self.assertEqual(self.computed_paths[1], self.store.get_path(self.store.get_key('a')))
+
+        stats = self.store.get_stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hit_rate'], 0.5)
+        self.assertEqual(stats['bytes_saved'], 100)
+
+    def test_Load_EvictsLeastRecentlyUsed(self):
+        self.store.load('a', self.compute_fn)
+        self.store.load('b', self.compute_fn)
+        self.store.load('a', self.compute_fn)
+        self.store.load('c', self.compute_fn)
+
+        self.assertTrue(os.path.exists(self.store.get_path(self.store.get_key('a'))))
+        self.assertFalse(os.path.exists(self.store.get_path(self.store.get_key('b'))))
+        self.assertTrue(os.path.exists(self.store.get_path(self.store.get_key('c'))))
+
+        stats = self.store.get_stats()
+        self.assertEqual(stats['num_entries'], 2)
+        self.assertEqual(stats['total_bytes'], 200)
+        self.assertEqual(stats['evicted'], 1)
+
+    def test_Load_IndexIsSharedBetweenInstances(self):
+        self.store.load('a', self.compute_fn)
+
+        other_store = DistanceFieldStore(directory=self.directory)
+        self.assertTrue(other_store.load('a', self.compute_fn))
+
+    def test_Load_AdoptsFilesWithoutIndex(self):
+        self.store.load('a', self.compute_fn)
+        os.remove(os.path.join(self.directory, DistanceFieldStore.INDEX_FILENAME))
+
+        self.assertTrue(self.store.load('a', self.compute_fn))
+
+class DistanceFieldPrefetcherTest(unittest.TestCase):
+    def setUp(self):
+        self.env = openravepy.Environment()
+        self.env.Load('data/wamtest2.env.xml')
+        self.robot = self.env.GetRobot('BarrettWAM')
+        self.bodies = set(self.env.GetBodies())
+
+        self.directory = tempfile.mkdtemp()
+        self.store = DistanceFieldStore(directory=self.directory)
+        self.prefetcher = DistanceFieldPrefetcher(
+            self.robot, store=self.store, module_factory=CHOMPModuleFileMock,
+            max_parallel=2)
+
+    def tearDown(self):
+        self.prefetcher.stop()
+        shutil.rmtree(self.directory)
+
+    def test_Prefetch_ComputesMissingDistanceFields(self):
+        num_computed = self.prefetcher.prefetch()
+        self.assertEqual(num_computed, len(self.bodies))
+
+        for body in self.bodies:
+            with body:
+                DistanceFieldManager.disable_active_links(body, self.robot)
+                state = DistanceFieldManager.get_geometric_state(body)
+            self.assertTrue(self.store.contains(state))
+
+    def test_Prefetch_PrefetchTwiceDoesNothing(self):
+        self.prefetcher.prefetch()
+        self.assertEqual(self.prefetcher.prefetch(), 0)
+
+    def test_Prefetch_MovingBodyDoesNothing(self):
+        self.prefetcher.prefetch()
+
+        body = self.env.GetKinBody('mug-table')
+        pose = body.GetTransform()
+        pose[0, 3] += 0.5
+        body.SetTransform(pose)
+
+        self.assertEqual(self.prefetcher.prefetch(), 0)
+
+    def test_Sync_AfterPrefetchOnlyLoadsDistanceFields(self):
+        self.prefetcher.prefetch()
+        stats_before = self.store.get_stats()
+
+        module = CHOMPModuleMock(self.env)
+        manager = DistanceFieldManager(module, store=self.store)
+        manager.sync(self.robot)
+
+        stats_after = self.store.get_stats()
+        self.assertEqual(stats_after['misses'], stats_before['misses'])
+        self.assertEqual(stats_after['hits'] - stats_before['hits'], len(self.bodies))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+import numpy, unittest
+from numpy.testing import assert_allclose
+from prpy import kin
+from prpy.util import (AxisAngleFromRotationMatrix, FindNearestPose,
+                       GeodesicDistance, GeodesicError, GeodesicTwist)
+
+def rotation_from_axis_angle(axis, angle):
+    axis = numpy.asarray(axis, dtype=float) / numpy.linalg.norm(axis)
+    K = numpy.array([ [ 0., -axis[2], axis[1] ],
+                      [ axis[2], 0., -axis[0] ],
+                      [ -axis[1], axis[0], 0. ] ])
+    return numpy.eye(3) + numpy.sin(angle) * K \
+        + (1. - numpy.cos(angle)) * numpy.dot(K, K)
+
+class GeodesicTest(unittest.TestCase):
+    def setUp(self):
+        random_state = numpy.random.RandomState(0)
+        self.t1 = kin.xyzypr_to_H(random_state.uniform(-3., 3., (20, 6)))
+        self.t2 = kin.xyzypr_to_H(random_state.uniform(-3., 3., (20, 6)))
+
+    def test_AxisAngleFromRotationMatrix_SmallMediumAndLargeAngles(self):
+        axis = numpy.array([ 1., -2., 0.5 ]) / numpy.linalg.norm([ 1., -2., 0.5 ])
+        angles = numpy.array([ 0., 1e-9, 0.3, 2., numpy.pi - 1e-7 ])
+        Rs = numpy.array([ rotation_from_axis_angle(axis, angle)
+                           for angle in angles ])
+        expected = angles[:, numpy.newaxis] * axis
+
+        assert_allclose(AxisAngleFromRotationMatrix(Rs), expected, atol=1e-12)
+        for R, omega in zip(Rs, expected):
+            assert_allclose(AxisAngleFromRotationMatrix(R), omega, atol=1e-12)
+
+    def test_AxisAngleFromRotationMatrix_HalfTurn(self):
+        R = rotation_from_axis_angle([ 0., 1., 1. ], numpy.pi)
+        omega = AxisAngleFromRotationMatrix(R)
+
+        self.assertAlmostEqual(numpy.linalg.norm(omega), numpy.pi)
+        assert_allclose(rotation_from_axis_angle(omega, numpy.pi), R, atol=1e-12)
+
+    def test_GeodesicTwist_StackMatchesSingle(self):
+        expected = numpy.array([ GeodesicTwist(t1, t2)
+                                 for t1, t2 in zip(self.t1, self.t2) ])
+        assert_allclose(GeodesicTwist(self.t1, self.t2), expected, atol=1e-12)
+
+    def test_GeodesicTwist_MovesTowardsGoal(self):
+        twist = GeodesicTwist(self.t1[0], self.t2[0])
+        assert_allclose(twist[0:3], self.t2[0, 0:3, 3] - self.t1[0, 0:3, 3],
+                        atol=1e-12)
+
+    def test_GeodesicError_AngleMatchesTwist(self):
+        errors = GeodesicError(self.t1, self.t2)
+        twists = GeodesicTwist(self.t1, self.t2)
+
+        self.assertEqual(errors.shape, (20, 4))
+        assert_allclose(errors[:, 0:3], twists[:, 0:3])
+        assert_allclose(errors[:, 3], numpy.sqrt(numpy.sum(twists[:, 3:6]**2, axis=1)))
+
+    def test_GeodesicDistance_BroadcastsSingleTransform(self):
+        distances = GeodesicDistance(self.t1[0], self.t2, r=0.5)
+        expected = [ GeodesicDistance(self.t1[0], t2, r=0.5) for t2 in self.t2 ]
+
+        self.assertEqual(distances.shape, (20,))
+        assert_allclose(distances, expected)
+        self.assertAlmostEqual(GeodesicDistance(self.t1[0], self.t1[0]), 0.)
+
+    def test_FindNearestPose_ReturnsClosestCandidate(self):
+        candidates = self.t2.copy()
+        candidates[7] = numpy.dot(self.t1[0], kin.xyzypr_to_H([ 0.01, 0., 0., 0.02, 0., 0. ]))
+
+        index, distance = FindNearestPose(self.t1[0], candidates)
+        self.assertEqual(index, 7)
+        self.assertAlmostEqual(distance, numpy.sqrt(0.01**2 + 0.02**2))
+
+    def test_FindNearestPose_NoCandidatesRaises(self):
+        with self.assertRaises(ValueError):
+            FindNearestPose(self.t1[0], numpy.zeros((0, 4, 4)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+import os
+if os.environ.get('ROS_DISTRO', 'hydro')[0] in 'abcdef':
+    import roslib; roslib.load_manifest('prpy')
+
+import numpy, openravepy, unittest
+from numpy.testing import assert_allclose
+from prpy.ik_cache import IKCache
+from planner_mocks import IkSolverMock, ManipulatorMock
+
+CheckEnvCollisions = openravepy.IkFilterOptions.CheckEnvCollisions
+IgnoreSelfCollisions = openravepy.IkFilterOptions.IgnoreSelfCollisions
+
+class IKCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = IKCache(max_size=2)
+        self.manip = ManipulatorMock()
+
+    def make_pose(self, x):
+        pose = numpy.eye(4)
+        pose[0, 3] = x
+        return pose
+
+    def test_FindIKSolutions_CachesSolutions(self):
+        first = self.cache.FindIKSolutions(self.manip, self.make_pose(0.5), CheckEnvCollisions)
+        second = self.cache.FindIKSolutions(self.manip, self.make_pose(0.5), CheckEnvCollisions)
+
+        assert_allclose(first, second)
+        self.assertEqual(len(self.manip.filter_options), 1)
+        self.assertEqual(self.cache.GetStats()['hits'], 1)
+
+    def test_FindIKSolutions_SolvesWithoutCollisionFilter(self):
+        self.cache.FindIKSolutions(self.manip, self.make_pose(0.5), CheckEnvCollisions)
+        self.assertFalse(self.manip.filter_options[0] & CheckEnvCollisions)
+
+    def test_FindIKSolutions_RechecksSelfCollisionsOnHit(self):
+        # Grabbing a body puts the second solution in self-collision.
+        self.manip.robot.self_colliding.add((1., 1.))
+        solutions = self.cache.FindIKSolutions(self.manip, self.make_pose(0.5), 0)
+        assert_allclose(solutions, [ [ 0., 0. ] ])
+
+        # Releasing it makes the second solution valid again.
+        self.manip.robot.self_colliding.clear()
+        solutions = self.cache.FindIKSolutions(self.manip, self.make_pose(0.5), 0)
+        assert_allclose(solutions, [ [ 0., 0. ], [ 1., 1. ] ])
+
+        self.assertEqual(len(self.manip.filter_options), 1)
+        self.assertTrue(self.manip.filter_options[0] & IgnoreSelfCollisions)
+
+    def test_FindIKSolutions_NearbyPosesShareEntry(self):
+        self.cache.FindIKSolutions(self.manip, self.make_pose(0.5), CheckEnvCollisions)
+        self.cache.FindIKSolutions(self.manip, self.make_pose(0.5 + 1e-6), CheckEnvCollisions)
+        self.assertEqual(len(self.manip.filter_options), 1)
+
+        self.cache.FindIKSolutions(self.manip, self.make_pose(0.6), CheckEnvCollisions)
+        self.assertEqual(len(self.manip.filter_options), 2)
+
+    def test_FindIKSolutions_RechecksCollisionsOnHit(self):
+        self.cache.FindIKSolutions(self.manip, self.make_pose(0.5), CheckEnvCollisions)
+        self.manip.robot.env.colliding.add((1., 1.))
+
+        solutions = self.cache.FindIKSolutions(self.manip, self.make_pose(0.5), CheckEnvCollisions)
+
+        assert_allclose(solutions, [ [ 0., 0. ] ])
+        self.assertEqual(len(self.manip.filter_options), 1)
+
+    def test_FindIKSolutions_EvictsLeastRecentlyUsed(self):
+        self.cache.FindIKSolutions(self.manip, self.make_pose(0.1), CheckEnvCollisions)
+        self.cache.FindIKSolutions(self.manip, self.make_pose(0.2), CheckEnvCollisions)
+        self.cache.FindIKSolutions(self.manip, self.make_pose(0.1), CheckEnvCollisions)
+        self.cache.FindIKSolutions(self.manip, self.make_pose(0.3), CheckEnvCollisions)
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.GetStats()['evicted'], 1)
+
+        self.cache.FindIKSolutions(self.manip, self.make_pose(0.1), CheckEnvCollisions)
+        self.assertEqual(len(self.manip.filter_options), 3)
+
+    def test_FindIKSolutions_ToolTransformChangeInvalidates(self):
+        self.cache.FindIKSolutions(self.manip, self.make_pose(0.5), CheckEnvCollisions)
+        self.manip.tool_transform = self.make_pose(0.1)
+
+        self.cache.FindIKSolutions(self.manip, self.make_pose(0.5), CheckEnvCollisions)
+        self.assertEqual(len(self.manip.filter_options), 2)
+
+    def test_FindIKSolutions_IkSolverChangeInvalidates(self):
+        self.cache.FindIKSolutions(self.manip, self.make_pose(0.5), CheckEnvCollisions)
+        self.manip.ik_solver = IkSolverMock('NloptIK')
+
+        self.cache.FindIKSolutions(self.manip, self.make_pose(0.5), CheckEnvCollisions)
+        self.assertEqual(len(self.manip.filter_options), 2)
+
+    def test_FindIKSolutions_KeysRelativeToBase(self):
+        self.cache.FindIKSolutions(self.manip, self.make_pose(0.5), CheckEnvCollisions)
+        self.manip.base.transform = self.make_pose(0.5)
+
+        self.cache.FindIKSolutions(self.manip, self.make_pose(0.5), CheckEnvCollisions)
+        self.assertEqual(len(self.manip.filter_options), 2)
+
+    def test_FindIKSolution_ReturnsClosestSolution(self):
+        self.manip.robot.dof_values = numpy.array([ 0.9, 0.8 ])
+        solution = self.cache.FindIKSolution(self.manip, self.make_pose(0.5), CheckEnvCollisions)
+        assert_allclose(solution, [ 1., 1. ])
+
+    def test_FindIKSolution_NoSolutionReturnsNone(self):
+        self.manip.solutions = numpy.zeros((0, 2))
+        self.assertIsNone(self.cache.FindIKSolution(self.manip, self.make_pose(0.5), CheckEnvCollisions))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+import os
+if os.environ.get('ROS_DISTRO', 'hydro')[0] in 'abcdef':
+    import roslib; roslib.load_manifest('prpy')
+
+import numpy, unittest
+from numpy.testing import assert_allclose
+from prpy.distance_field import DistanceField
+from prpy.ik_ranking import (ConfigurationDistance, JointLimitFilter,
+                             RankingPipeline)
+from planner_mocks import ManipulatorMock, RobotMock
+
+def make_robot(circular=(False, False)):
+    return ManipulatorMock(RobotMock(circular=circular)).GetRobot()
+
+class RankerMock(object):
+    def __init__(self, function):
+        self.function = function
+        self.num_evaluated = 0
+
+    def __call__(self, robot, ik_solutions):
+        self.num_evaluated += ik_solutions.shape[0]
+        return self.function(ik_solutions)
+
+class RankingPipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.robot = make_robot()
+        self.ik_solutions = numpy.array([ [ 0.0, 0.0 ],
+                                          [ 0.5, 0.0 ],
+                                          [ 0.5, 0.2 ],
+                                          [ 2.0, 0.0 ] ])
+
+    def test_Call_WeightedSumOfCriteria(self):
+        pipeline = RankingPipeline(criteria=[
+            (1., RankerMock(lambda q: q[:, 0])),
+            (10., RankerMock(lambda q: q[:, 1])) ])
+
+        assert_allclose(pipeline(self.robot, self.ik_solutions),
+                        [ 0., 0.5, 2.5, 2. ])
+
+    def test_Call_FiltersShortCircuitCriteria(self):
+        cheap_filter = RankerMock(lambda q: numpy.where(q[:, 0] > 1., numpy.inf, 0.))
+        expensive = RankerMock(lambda q: q[:, 1])
+        pipeline = RankingPipeline(filters=[ cheap_filter ],
+                                   criteria=[ (1., expensive) ])
+
+        scores = pipeline(self.robot, self.ik_solutions)
+
+        self.assertTrue(numpy.isposinf(scores[3]))
+        self.assertEqual(cheap_filter.num_evaluated, 4)
+        self.assertEqual(expensive.num_evaluated, 3)
+
+    def test_Call_InfiniteCriterionRejects(self):
+        pipeline = RankingPipeline(criteria=[
+            (1., RankerMock(lambda q: numpy.where(q[:, 1] > 0., numpy.inf, q[:, 0]))) ])
+
+        scores = pipeline(self.robot, self.ik_solutions)
+        self.assertTrue(numpy.isposinf(scores[2]))
+        assert_allclose(scores[[ 0, 1, 3 ]], [ 0., 0.5, 2. ])
+
+    def test_Call_TieBreakersOrderEqualCosts(self):
+        pipeline = RankingPipeline(
+            criteria=[ (1., RankerMock(lambda q: q[:, 0])) ],
+            tie_breakers=[ RankerMock(lambda q: -q[:, 1]) ])
+
+        scores = pipeline(self.robot, self.ik_solutions)
+        self.assertEqual(list(numpy.argsort(scores)), [ 0, 2, 1, 3 ])
+
+    def test_Call_TieBreakersOrderCostsWithinTolerance(self):
+        # Rounding to multiples of the tolerance would split 0.0049 and
+        # 0.0051 into different buckets.
+        pipeline = RankingPipeline(
+            criteria=[ (1., RankerMock(lambda q: q[:, 0])) ],
+            tie_breakers=[ RankerMock(lambda q: -q[:, 1]) ],
+            tie_tolerance=0.01)
+        ik_solutions = numpy.array([ [ 0.0049, 0.0 ],
+                                     [ 0.0051, 0.2 ],
+                                     [ 0.0200, 0.5 ] ])
+
+        scores = pipeline(self.robot, ik_solutions)
+        self.assertEqual(list(numpy.argsort(scores)), [ 1, 0, 2 ])
+
+    def test_Call_AllRejected(self):
+        pipeline = RankingPipeline(
+            filters=[ RankerMock(lambda q: numpy.inf * numpy.ones(q.shape[0])) ],
+            criteria=[ (1., RankerMock(lambda q: q[:, 0])) ])
+
+        self.assertTrue(numpy.all(numpy.isposinf(pipeline(self.robot, self.ik_solutions))))
+
+    def test_JointLimitFilter_RejectsSolutionsNearLimits(self):
+        scores = JointLimitFilter(margin=0.4)(self.robot, self.ik_solutions)
+        assert_allclose(scores[0:3], numpy.zeros(3))
+        self.assertTrue(numpy.isposinf(scores[3]))
+
+class ConfigurationDistanceTest(unittest.TestCase):
+    def test_Call_WrapsContinuousJoints(self):
+        robot = make_robot(circular=(True, False))
+        ik_solutions = numpy.array([ [ 2. * numpy.pi, 0. ],
+                                     [ 0., 2. * numpy.pi ] ])
+
+        distances = ConfigurationDistance()(robot, ik_solutions)
+        assert_allclose(distances, [ 0., 2. * numpy.pi ], atol=1e-9)
+
+    def test_Call_MaxDeviationRejects(self):
+        robot = make_robot()
+        ranker = ConfigurationDistance(q_reference=numpy.zeros(2), max_deviation=1.)
+        distances = ranker(robot, numpy.array([ [ 0.5, 0.5 ], [ 1.5, 0. ] ]))
+
+        assert_allclose(distances[0], numpy.sqrt(0.5))
+        self.assertTrue(numpy.isposinf(distances[1]))
+
+class DistanceFieldTest(unittest.TestCase):
+    def test_GetDistances_LooksUpVoxels(self):
+        distances = numpy.arange(8, dtype=float).reshape((2, 2, 2))
+        field = DistanceField(distances, [ 0., 0., 0. ], 0.5)
+
+        assert_allclose(field.GetDistances([ [ 0.1, 0.1, 0.1 ],
+                                             [ 0.9, 0.1, 0.6 ] ]), [ 0., 5. ])
+        self.assertTrue(numpy.isposinf(field.GetDistances([ [ 2., 0., 0. ] ])[0]))
+
+if __name__ == '__main__':
+    unittest.main()
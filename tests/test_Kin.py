@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+import numpy, unittest
+from numpy.testing import assert_allclose
+from prpy import kin
+
+class KinTest(unittest.TestCase):
+    def setUp(self):
+        random_state = numpy.random.RandomState(0)
+        self.xyzypr = random_state.uniform(-numpy.pi, numpy.pi, (10, 6))
+        self.poses = kin.pose_from_xyzypr(self.xyzypr)
+        self.Hs = kin.pose_to_H(self.poses)
+
+    def test_PoseFromXyzypr_StackMatchesSingle(self):
+        expected = numpy.array([ kin.pose_from_xyzypr(v) for v in self.xyzypr ])
+        assert_allclose(self.poses, expected)
+
+    def test_PoseToH_KeepsLeadingDimensions(self):
+        poses = self.poses.reshape((2, 5, 7))
+        Hs = kin.pose_to_H(poses)
+
+        self.assertEqual(Hs.shape, (2, 5, 4, 4))
+        assert_allclose(Hs.reshape((10, 4, 4)), self.Hs)
+        self.assertEqual(kin.pose_to_H(self.poses[0]).shape, (4, 4))
+
+    def test_PoseNormalize_StackReturnsNormalizedPoses(self):
+        poses = self.poses.copy()
+        poses[:, 3:7] *= numpy.arange(1., 11.)[:, numpy.newaxis]
+
+        # Lists are copied; float arrays are normalized in place.
+        normalized = kin.pose_normalize(poses.tolist())
+        assert_allclose(normalized, self.poses)
+        self.assertIs(kin.pose_normalize(poses), poses)
+        assert_allclose(poses, self.poses)
+
+        pose = kin.pose_normalize(list(2. * self.poses[0]))
+        assert_allclose(pose[3:7], self.poses[0, 3:7])
+
+    def test_XyzyprToH_MatchesPoseToH(self):
+        assert_allclose(kin.xyzypr_to_H(self.xyzypr), self.Hs, atol=1e-12)
+
+    def test_PoseToXyzypr_RoundTrips(self):
+        # Angles are not unique, so compare the transforms.
+        poses = kin.pose_from_xyzypr(kin.pose_to_xyzypr(self.poses))
+        assert_allclose(kin.pose_to_H(poses), self.Hs, atol=1e-12)
+
+    def test_RToQuat_RoundTripsAllBranches(self):
+        # The identity and rotations by pi about each axis exercise the
+        # four branches of R_to_quat.
+        Rs = numpy.array([ numpy.eye(3),
+                           numpy.diag([ 1., -1., -1. ]),
+                           numpy.diag([ -1., 1., -1. ]),
+                           numpy.diag([ -1., -1., 1. ]) ])
+        Rs = numpy.concatenate((Rs, self.Hs[:, 0:3, 0:3]))
+
+        assert_allclose(kin.R_from_quat(kin.R_to_quat(Rs)), Rs, atol=1e-12)
+
+    def test_QuatToYpr_GimbalLock(self):
+        quats = kin.quat_from_ypr([ [ 0.3, 0.5 * numpy.pi, 0. ],
+                                    [ 0.3, -0.5 * numpy.pi, 0. ] ])
+        assert_allclose(kin.quat_to_ypr(quats), [ [ 0.3, 0.5 * numpy.pi, 0. ],
+                                                  [ 0.3, -0.5 * numpy.pi, 0. ] ],
+                        atol=1e-6)
+
+    def test_InvertH_ComposesToIdentity(self):
+        products = numpy.array([ numpy.dot(H, H_inv) for H, H_inv
+                                 in zip(self.Hs, kin.invert_H(self.Hs)) ])
+        assert_allclose(products, numpy.tile(numpy.eye(4), (10, 1, 1)), atol=1e-12)
+
+    def test_HFromOpDiff_PointsZAxisAlongDirection(self):
+        directions = numpy.array([ [ 1., 0.1, 0. ], [ 0., 2., 1. ] ])
+        Hs = kin.H_from_op_diff([ 1., 2., 3. ], directions)
+
+        assert_allclose(Hs[:, 0:3, 2], directions
+                        / numpy.sqrt(numpy.sum(directions**2, axis=1))[:, None])
+        assert_allclose(Hs[:, 0:3, 3], [ [ 1., 2., 3. ] ] * 2)
+        for H in Hs:
+            assert_allclose(numpy.dot(H[0:3, 0:3].T, H[0:3, 0:3]), numpy.eye(3),
+                            atol=1e-12)
+
+    def test_TransformComparison_Stack(self):
+        offset = kin.xyzypr_to_H([ 0., 0.3, 0.4, 0.5, 0., 0. ])
+        Hs = numpy.array([ numpy.dot(H, offset) for H in self.Hs ])
+        position, rotation = kin.transform_comparison(self.Hs, Hs)
+
+        assert_allclose(position, 0.5 * numpy.ones(10))
+        assert_allclose(rotation, 0.5 * numpy.ones(10))
+
+    def test_TsrKin_IsAlias(self):
+        from prpy.tsr import kin as tsr_kin
+        self.assertIs(tsr_kin.pose_to_H, kin.pose_to_H)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+import numpy, openravepy, unittest
+from numpy.testing import assert_allclose
+from prpy.planning.base import PlanningError
+from prpy.planning.mk import JacobianFactorization, MKPlanner
+from planner_mocks import TwoLinkArmMock
+
+class JacobianFactorizationTest(unittest.TestCase):
+    def setUp(self):
+        self.manip = TwoLinkArmMock()
+        self.manip.robot.dof_values[:] = [ 0.1, 0.4, -0.7, 0.3 ]
+        self.damping = 1e-3
+
+    def exact_jacobian(self, quat_sign=1.):
+        return numpy.vstack((self.manip.CalculateJacobian(),
+                             quat_sign * self.manip.CalculateRotationJacobian()))
+
+    def assertFactorizationMatches(self, jacobian, expected):
+        U, s, Vt = numpy.linalg.svd(expected, full_matrices=False)
+        expected_pinv = numpy.dot(Vt.T * (s / (s**2 + self.damping**2)), U.T)
+
+        assert_allclose(jacobian.s, s, atol=1e-9)
+        assert_allclose(numpy.dot(jacobian.U * jacobian.s, jacobian.Vt),
+                        expected, atol=1e-9)
+        assert_allclose(jacobian.pinv, expected_pinv, atol=1e-6)
+
+    def test_Refresh_MatchesExactJacobian(self):
+        jacobian = JacobianFactorization(self.manip, damping=self.damping)
+
+        assert_allclose(jacobian.jacobian, self.exact_jacobian(), atol=1e-6)
+        self.assertFactorizationMatches(jacobian, jacobian.jacobian)
+
+    def test_Update_FactorizationMatchesFreshSVD(self):
+        jacobian = JacobianFactorization(self.manip, damping=self.damping,
+                                         refresh_interval=100)
+
+        for _ in xrange(5):
+            self.manip.robot.dof_values += numpy.dot(jacobian.pinv, [ 0., 0., 0.002,
+                                                             0., 0., 0., 0. ])
+            jacobian.Update()
+            self.assertFactorizationMatches(jacobian, jacobian.jacobian)
+
+        self.assertEqual(jacobian.num_evaluations, 1)
+        self.assertEqual(jacobian.num_updates, 5)
+
+        # The updated Jacobian stays close to the exact one for small steps.
+        assert_allclose(jacobian.jacobian, self.exact_jacobian(), atol=1e-2)
+
+    def test_Update_RefreshesAfterInterval(self):
+        jacobian = JacobianFactorization(self.manip, damping=self.damping,
+                                         refresh_interval=2)
+
+        for _ in xrange(2):
+            self.manip.robot.dof_values += 0.01
+            jacobian.Update()
+
+        self.assertEqual(jacobian.num_evaluations, 2)
+        assert_allclose(jacobian.jacobian, self.exact_jacobian(), atol=1e-6)
+        self.assertFactorizationMatches(jacobian, jacobian.jacobian)
+
+    def test_Refresh_FlippedQuaternionNegatesRotationRows(self):
+        jacobian = JacobianFactorization(self.manip, damping=self.damping)
+        quat = jacobian.x[3:7].copy()
+
+        # Track the opposite hemisphere, as if the quaternion had crossed it
+        # during earlier steps.
+        jacobian.x[3:7] = -quat
+        jacobian.Refresh()
+
+        self.assertEqual(jacobian.quat_sign, -1.)
+        assert_allclose(jacobian.x[3:7], -quat)
+        assert_allclose(jacobian.jacobian, self.exact_jacobian(-1.),
+                        atol=1e-6)
+        self.assertFactorizationMatches(jacobian, jacobian.jacobian)
+
+        # The Jacobian predicts the motion of the tracked pose vector.
+        x_prev = jacobian.x.copy()
+        dq = numpy.array([ 1e-4, -2e-4, 1e-4, 3e-4 ])
+        self.manip.robot.dof_values += dq
+        x, quat_sign = jacobian._GetPoseVector()
+
+        self.assertEqual(quat_sign, -1.)
+        assert_allclose(x - x_prev, numpy.dot(jacobian.jacobian, dq),
+                        atol=1e-6)
+
+class MKPlannerStepRetryTest(unittest.TestCase):
+    config_start = numpy.array([
+        +2.35061574,  0.61043555,  0.85000000,  1.80684444, -0.08639935,
+        -0.69750474,  1.31656172
+    ])
+
+    def setUp(self):
+        self.env = openravepy.Environment()
+        self.env.Load('data/wamtest2.env.xml')
+        self.robot = self.env.GetRobot('BarrettWAM')
+        self.manipulator = self.robot.GetManipulator('arm')
+        self.env.Remove(self.env.GetKinBody('floor'))
+
+        with self.env:
+            self.robot.SetActiveManipulator(self.manipulator)
+            self.robot.SetActiveDOFs(self.manipulator.GetArmIndices())
+            self.robot.SetActiveDOFValues(self.config_start)
+
+            # Retreat along the approach direction of the hand.
+            self.direction = -self.manipulator.GetEndEffectorTransform()[0:3, 2]
+
+        self.planner = MKPlanner()
+        self.step_sizes = []
+        self.failed_step_sizes = []
+
+        # Record the step size of every velocity that is computed.
+        def GetStraightVelocity(manip, velocity, initial_hand_pose,
+                                nullspace_fn, step_size, **kw_args):
+            self.step_sizes.append(step_size)
+            return MKPlanner.GetStraightVelocity(
+                self.planner, manip, velocity, initial_hand_pose,
+                nullspace_fn, step_size, **kw_args)
+
+        self.planner.GetStraightVelocity = GetStraightVelocity
+
+    def tearDown(self):
+        self.env.Destroy()
+
+    def fail_steps(self, should_fail):
+        # Reject the steps for which should_fail(step_size) is True.
+        def CheckStep(*args):
+            step_size = self.step_sizes[-1]
+            if should_fail(step_size):
+                self.failed_step_sizes.append(step_size)
+                raise PlanningError('Injected constraint violation.')
+            return MKPlanner._CheckStep(*args)
+
+        self.planner._CheckStep = CheckStep
+
+    def test_PlanToEndEffectorOffset_LargeStepFails_RetriesWithHalfStep(self):
+        step_size = 0.001
+        self.fail_steps(lambda step: (step > step_size
+                                      and not self.failed_step_sizes))
+
+        traj = self.planner.PlanToEndEffectorOffset(
+            self.robot, self.direction, 0.03, step_size=step_size,
+            max_step_size=0.008)
+
+        self.assertIsInstance(traj, openravepy.Trajectory)
+        self.assertEqual(len(self.failed_step_sizes), 1)
+
+        # The failed step is retried from the same waypoint at half the size.
+        failed_index = self.step_sizes.index(self.failed_step_sizes[0])
+        self.assertAlmostEqual(self.step_sizes[failed_index + 1],
+                               max(0.5 * self.failed_step_sizes[0], step_size))
+
+    def test_PlanToEndEffectorOffset_MinimumStepFails_Throws(self):
+        self.fail_steps(lambda step: True)
+
+        with self.assertRaises(PlanningError):
+            self.planner.PlanToEndEffectorOffset(
+                self.robot, self.direction, 0.03, step_size=0.001,
+                max_step_size=0.008)
+
+        # A step at the minimum size is not retried.
+        self.assertEqual(self.failed_step_sizes, [ 0.001 ])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+import numpy, unittest
+from numpy.testing import assert_allclose
+from prpy.ik_parallel import ParallelIKSolver
+
+class BodyMock(object):
+    def __init__(self, name, dof_values=()):
+        self.name = name
+        self.kinematics_hash = 'kinematics'
+        self.transform = numpy.eye(4)
+        self.dof_values = numpy.array(dof_values, dtype=float)
+        self.enable_states = [ True ]
+        self.grabbed = []
+
+    def Clone(self):
+        body = self.__class__.__new__(self.__class__)
+        body.__dict__.update(self.__dict__)
+        body.transform = self.transform.copy()
+        body.dof_values = self.dof_values.copy()
+        body.enable_states = list(self.enable_states)
+        body.grabbed = list(self.grabbed)
+        return body
+
+    def GetName(self):
+        return self.name
+
+    def GetKinematicsGeometryHash(self):
+        return self.kinematics_hash
+
+    def IsRobot(self):
+        return False
+
+    def GetTransform(self):
+        return self.transform.copy()
+
+    def SetTransform(self, transform):
+        self.transform = numpy.array(transform)
+
+    def GetDOF(self):
+        return self.dof_values.shape[0]
+
+    def GetDOFValues(self):
+        return self.dof_values.copy()
+
+    def SetDOFValues(self, dof_values):
+        self.dof_values = numpy.array(dof_values, dtype=float)
+
+    def GetLinkEnableStates(self):
+        return list(self.enable_states)
+
+    def SetLinkEnableStates(self, enable_states):
+        self.enable_states = list(enable_states)
+
+class RobotMock(BodyMock):
+    def IsRobot(self):
+        return True
+
+    def GetGrabbed(self):
+        return self.grabbed
+
+    def GetEnv(self):
+        return self.env
+
+    def GetManipulator(self, name):
+        return ManipulatorMock(self)
+
+class ManipulatorMock(object):
+    """ Its only IK solution is the robot's current configuration. """
+    def __init__(self, robot):
+        self.robot = robot
+
+    def GetRobot(self):
+        return self.robot
+
+    def GetName(self):
+        return 'arm'
+
+    def GetArmIndices(self):
+        return [ 0 ]
+
+    def FindIKSolutions(self, ik_param, filter_options, **kw_args):
+        return self.robot.GetDOFValues()[numpy.newaxis, :]
+
+class EnvMock(object):
+    def __init__(self, bodies):
+        self.bodies = bodies
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+    def Clone(self):
+        return EnvMock([ body.Clone() for body in self.bodies ])
+
+    def GetBodies(self):
+        return list(self.bodies)
+
+    def GetKinBody(self, name):
+        for body in self.bodies:
+            if body.GetName() == name:
+                return body
+        return None
+
+    GetRobot = GetKinBody
+
+class ClonePoolMock(object):
+    def __init__(self, parent_env, size):
+        self.parent_env = parent_env
+        self.envs = [ None ] * size
+
+    def __getitem__(self, index):
+        return self.envs[index]
+
+    def Clone(self, index):
+        self.envs[index] = self.parent_env.Clone()
+        return self.envs[index]
+
+    def Close(self):
+        self.envs = [ None ] * len(self.envs)
+
+class FutureMock(object):
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value
+
+class ExecutorMock(object):
+    def submit(self, fn, *args):
+        return FutureMock(fn(*args))
+
+class ParallelIKSolverMock(ParallelIKSolver):
+    """ Records the workers that are cloned, without using OpenRAVE. """
+    def __init__(self, manipulator, num_workers, **kw_args):
+        super(ParallelIKSolverMock, self).__init__(
+            manipulator, num_workers=num_workers, executor=ExecutorMock(),
+            **kw_args)
+        self._clones = ClonePoolMock(self.env, num_workers)
+        self.cloned = []
+
+    def _CloneWorker(self, index):
+        self.cloned.append(index)
+        return self._clones.Clone(index)
+
+class ParallelIKSolverTest(unittest.TestCase):
+    def setUp(self):
+        self.robot = RobotMock('robot', dof_values=[ 0.1 ])
+        self.box = BodyMock('box')
+        self.env = EnvMock([ self.robot, self.box ])
+        self.robot.env = self.env
+
+        self.solver = ParallelIKSolverMock(ManipulatorMock(self.robot),
+                                           num_workers=2)
+        self.poses = [ numpy.eye(4) ] * 4
+
+    def test_Deduplicate_KeepsFirstOccurrenceInOrder(self):
+        solutions = numpy.array([ [ 0.5, 0. ],
+                                  [ 0., 0. ],
+                                  [ 0.5 + 1e-7, 0. ],
+                                  [ 0., 2e-7 ],
+                                  [ 0.2, 0. ] ])
+
+        assert_allclose(self.solver._Deduplicate(solutions),
+                        [ [ 0.5, 0. ], [ 0., 0. ], [ 0.2, 0. ] ])
+
+    def test_Deduplicate_KeepsSolutionsBeyondTolerance(self):
+        solutions = numpy.array([ [ 0., 0. ],
+                                  [ 1e-4, 0. ],
+                                  [ 0., -1e-4 ] ])
+
+        assert_allclose(self.solver._Deduplicate(solutions), solutions)
+        self.assertEqual(self.solver._Deduplicate(numpy.zeros((0, 2))).shape,
+                         (0, 2))
+
+    def test_Synchronize_StateChange_UpdatesWorkers(self):
+        self.solver.Synchronize()
+        self.assertEqual(self.solver.cloned, [ 0, 1 ])
+
+        self.robot.SetDOFValues([ 0.3 ])
+        self.box.SetTransform(2. * numpy.eye(4))
+        self.box.SetLinkEnableStates([ False ])
+        self.solver.Synchronize()
+
+        self.assertEqual(self.solver.cloned, [ 0, 1 ])
+        for index in xrange(2):
+            worker_env = self.solver._clones[index]
+            assert_allclose(worker_env.GetRobot('robot').GetDOFValues(),
+                            [ 0.3 ])
+            worker_box = worker_env.GetKinBody('box')
+            assert_allclose(worker_box.GetTransform(), 2. * numpy.eye(4))
+            self.assertEqual(worker_box.GetLinkEnableStates(), [ False ])
+
+    def test_Synchronize_SignatureChange_ReclonesWorkers(self):
+        self.solver.Synchronize()
+
+        # A new body.
+        self.env.bodies.append(BodyMock('cup'))
+        self.solver.Synchronize()
+        self.assertEqual(self.solver.cloned, [ 0, 1, 0, 1 ])
+        self.assertIsNotNone(self.solver._clones[0].GetKinBody('cup'))
+
+        # A grabbed body.
+        self.robot.grabbed.append(self.env.GetKinBody('cup'))
+        self.solver.Synchronize()
+        self.assertEqual(self.solver.cloned, [ 0, 1 ] * 3)
+
+        # Different kinematics.
+        self.box.kinematics_hash = 'resized'
+        self.solver.Synchronize()
+        self.assertEqual(self.solver.cloned, [ 0, 1 ] * 4)
+
+    def test_FindIKSolutions_NoSynchronize_RequiresSynchronizedWorkers(self):
+        with self.assertRaises(ValueError):
+            self.solver.FindIKSolutions(self.poses, synchronize=False)
+
+        self.solver.Synchronize()
+        self.robot.SetDOFValues([ 0.3 ])
+
+        # The workers keep their state until they are synchronized.
+        assert_allclose(
+            self.solver.FindIKSolutions(self.poses, synchronize=False),
+            [ [ 0.1 ] ])
+        assert_allclose(self.solver.FindIKSolutions(self.poses), [ [ 0.3 ] ])
+        self.assertEqual(self.solver.cloned, [ 0, 1 ])
+
+if __name__ == '__main__':
+    unittest.main()
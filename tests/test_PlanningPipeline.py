@@ -10,6 +10,8 @@ if os.environ.get('ROS_DISTRO', 'hydro')[0] in 'abcdef':
 
 import openravepy, unittest, numpy, threading
 import prpy.planning
+from prpy.planning.base import MetaPlanningError
+from prpy.planning.parallel import ParallelGoalPlanner
 
 from planner_mocks import SuccessPlanner, FailPlanner
 
@@ -140,5 +142,64 @@ class RankedTests(MetaPlannerTests):
         with self.assertRaises(prpy.planning.PlanningError):
             planner.PlanTest(self.robot)
 
+class ParallelGoalPlannerTests(MetaPlannerTests):
+    # Each goal is a mock planner that plan_fn calls.
+    @staticmethod
+    def plan_fn(planner, robot, goal):
+        return goal.PlanTest(robot)
+
+    def plan(self, goal_planner, goals):
+        with self.env:
+            return goal_planner.Plan(self.robot, goals, self.plan_fn,
+                                     delegate_planner=goals[0])
+
+    def test_FirstGoalFails_ReturnsResultOfSecondGoal(self):
+        goals = [ FailPlanner(), SuccessPlanner(self.traj) ]
+
+        with ParallelGoalPlanner(num_workers=2) as goal_planner:
+            traj = self.plan(goal_planner, goals)
+
+        self.assertIsInstance(traj, openravepy.Trajectory)
+        self.assertEqual(traj.GetEnv(), self.env)
+        self.assertEqual(goals[0].num_calls, 1)
+        self.assertEqual(goals[1].num_calls, 1)
+
+    def test_SecondGoalSucceeds_WaitsForFirstGoal(self):
+        first_goal = FailPlanner(delay=True)
+        second_goal = SuccessPlanner(self.traj, delay=True)
+        goal_planner = ParallelGoalPlanner(num_workers=2)
+
+        def test_planner():
+            self.plan(goal_planner, [ first_goal, second_goal ])
+
+        test_thread = threading.Thread(target=test_planner)
+        test_thread.start()
+        first_goal.wait_for_start()
+        second_goal.wait_for_start()
+
+        # The second goal succeeds, but the first goal is still running.
+        second_goal.finish()
+        test_thread.join(timeout=self.join_timeout)
+        self.assertTrue(test_thread.isAlive())
+
+        first_goal.finish()
+        test_thread.join(timeout=self.join_timeout)
+        self.assertFalse(test_thread.isAlive())
+        goal_planner.Close()
+
+    def test_FirstGoalSucceeds_CancelsRemainingGoals(self):
+        goals = [ SuccessPlanner(self.traj), FailPlanner(), FailPlanner() ]
+
+        with ParallelGoalPlanner(num_workers=1) as goal_planner:
+            self.plan(goal_planner, goals)
+
+        self.assertEqual(goals[1].num_calls, 0)
+        self.assertEqual(goals[2].num_calls, 0)
+
+    def test_AllGoalsFail_ThrowsMetaPlanningError(self):
+        with ParallelGoalPlanner(num_workers=2) as goal_planner:
+            with self.assertRaises(MetaPlanningError):
+                self.plan(goal_planner, [ FailPlanner(), FailPlanner() ])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+import os
+if os.environ.get('ROS_DISTRO', 'hydro')[0] in 'abcdef':
+    import roslib; roslib.load_manifest('prpy')
+
+import numpy, shutil, tempfile, unittest
+from numpy.testing import assert_allclose
+from prpy.reachability import ReachabilityMap
+from planner_mocks import TwoLinkArmMock, rotz, translation
+
+class ReachabilityMapTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.manip = TwoLinkArmMock()
+        cls.map = ReachabilityMap.Generate(cls.manip, num_samples=20000,
+                                           position_resolution=0.1,
+                                           orientation_shape=(4, 2, 2), seed=0)
+
+        random_state = numpy.random.RandomState(1)
+        cls.poses = numpy.array([
+            cls.manip.GetEndEffectorTransform(
+                random_state.uniform(-numpy.pi, numpy.pi, 4))
+            for _ in xrange(100) ])
+
+    def test_Generate_SampledPosesAreReachable(self):
+        self.assertGreater(numpy.mean(self.map.IsReachable(self.poses)), 0.95)
+
+    def test_GetScores_PosesOutsideGridAreUnreachable(self):
+        poses = self.poses.copy()
+        poses[:, 0, 3] += 5.
+
+        assert_allclose(self.map.GetScores(poses), numpy.zeros(poses.shape[0]))
+
+    def test_GetScores_PosesAreRelativeToBase(self):
+        base_pose = numpy.dot(translation(2.), rotz(0.3))
+        moved_poses = numpy.dot(base_pose, self.poses).transpose(1, 0, 2)
+
+        assert_allclose(self.map.GetScores(moved_poses, base_pose),
+                        self.map.GetScores(self.poses))
+
+    def test_SaveLoad_RoundTrips(self):
+        directory = tempfile.mkdtemp()
+        try:
+            self.map.Save(directory)
+            loaded_map = ReachabilityMap.Load(directory)
+
+            self.assertIsInstance(loaded_map.scores, numpy.memmap)
+            assert_allclose(loaded_map.GetScores(self.poses),
+                            self.map.GetScores(self.poses))
+            self.assertEqual(loaded_map.metadata['num_samples'], 20000)
+        finally:
+            shutil.rmtree(directory)
+
+class OrderByReachabilityTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.manip = TwoLinkArmMock()
+        cls.map = ReachabilityMap.Generate(cls.manip, num_samples=20000,
+                                           position_resolution=0.1,
+                                           orientation_shape=(4, 2, 2), seed=0)
+
+    def order(self, poses, batch_size=64):
+        from prpy.planning.tsr import TSRPlanner
+        return numpy.array(list(TSRPlanner._OrderByReachability(
+            self.manip, self.map, poses, batch_size=batch_size)))
+
+    def test_OrderByReachability_KeepsUnreachablePosesLast(self):
+        random_state = numpy.random.RandomState(2)
+        poses = numpy.array([
+            self.manip.GetEndEffectorTransform(
+                random_state.uniform(-numpy.pi, numpy.pi, 4))
+            for _ in xrange(10) ])
+        poses[::3, 0, 3] += 5.
+
+        unreachable_poses = poses[self.map.GetScores(poses) == 0.]
+        self.assertGreaterEqual(unreachable_poses.shape[0], 4)
+
+        ordered_poses = self.order(poses)
+
+        self.assertEqual(ordered_poses.shape, poses.shape)
+        scores = self.map.GetScores(ordered_poses)
+        self.assertTrue(numpy.all(numpy.diff(scores) <= 0.))
+
+        # Unreachable poses are not dropped and stay in sample order.
+        assert_allclose(ordered_poses[-unreachable_poses.shape[0]:],
+                        unreachable_poses)
+
+    def test_OrderByReachability_OrdersWithinBatches(self):
+        poses = numpy.array([ translation(x) for x in [ 5., 0.5, 5., 0.5 ] ])
+
+        ordered_poses = self.order(poses, batch_size=2)
+
+        assert_allclose(ordered_poses[:, 0, 3], [ 0.5, 5., 0.5, 5. ])
+
+class EnvMock(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+    def CheckCollision(self, body):
+        # Everything with x > 0 is in collision.
+        return body.transform[0, 3] > 0.
+
+class MobileRobotMock(object):
+    def __init__(self):
+        self.env = EnvMock()
+        self.transform = numpy.eye(4)
+
+    def GetEnv(self):
+        return self.env
+
+    def GetTransform(self):
+        return self.transform.copy()
+
+    def SetTransform(self, transform):
+        self.transform = numpy.array(transform)
+
+    def CreateRobotStateSaver(self):
+        robot = self
+        transform = self.transform.copy()
+
+        class StateSaver(object):
+            def __enter__(self):
+                pass
+
+            def __exit__(self, *args):
+                robot.transform = transform
+
+        return StateSaver()
+
+    def CheckSelfCollision(self):
+        return False
+
+class MobileBaseLinkMock(object):
+    def __init__(self, robot):
+        self.robot = robot
+
+    def GetTransform(self):
+        return numpy.dot(self.robot.transform, translation(0.2))
+
+class MobileManipulatorMock(TwoLinkArmMock):
+    def __init__(self, robot):
+        super(MobileManipulatorMock, self).__init__()
+        self.mobile_robot = robot
+
+    def GetBase(self):
+        return MobileBaseLinkMock(self.mobile_robot)
+
+class InverseReachabilityTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.map = ReachabilityMap.Generate(TwoLinkArmMock(), num_samples=20000,
+                                           position_resolution=0.1,
+                                           orientation_shape=(4, 2, 2), seed=0)
+
+    def setUp(self):
+        self.robot = MobileRobotMock()
+        self.manip = MobileManipulatorMock(self.robot)
+        self.target = numpy.dot(translation(-3.), rotz(0.5))
+        self.robot_to_base = translation(0.2)
+
+    def test_SampleBasePoses_ReachTarget(self):
+        base_poses = self.map.GetInverse().SampleBasePoses(
+            [ self.target ], 200, numpy.random.RandomState(0))
+
+        self.assertEqual(base_poses.shape, (200, 4, 4))
+        relative_poses = numpy.array([ numpy.dot(numpy.linalg.inv(base_pose), self.target)
+                                       for base_pose in base_poses ])
+        self.assertGreater(numpy.mean(self.map.IsReachable(relative_poses)), 0.9)
+
+    def test_FindBasePoses_ReturnsRankedReachablePoses(self):
+        inverse = self.map.GetInverse()
+        robot_poses, scores = inverse.FindBasePoses(
+            self.robot, self.manip, [ self.target ], num_samples=500,
+            num_results=5, check_collision=False, seed=0)
+
+        self.assertEqual(robot_poses.shape, (5, 4, 4))
+        self.assertTrue(numpy.all(scores > 0.))
+        self.assertTrue(numpy.all(numpy.diff(scores) <= 0.))
+        assert_allclose(inverse.ScoreBasePoses(robot_poses, self.robot_to_base,
+                                               [ self.target ]), scores)
+
+        # The poses stay in the plane of the robot.
+        assert_allclose(robot_poses[:, 2, 3], numpy.zeros(5), atol=1e-9)
+        assert_allclose(robot_poses[:, 2, 2], numpy.ones(5), atol=1e-9)
+
+    def test_FindBasePoses_RejectsCollidingPoses(self):
+        target = numpy.dot(translation(0.5), rotz(0.5))
+        robot_poses, _ = self.map.GetInverse().FindBasePoses(
+            self.robot, self.manip, [ target ], num_samples=500,
+            num_results=5, seed=0)
+
+        self.assertGreater(robot_poses.shape[0], 0)
+        self.assertTrue(numpy.all(robot_poses[:, 0, 3] <= 0.))
+        assert_allclose(self.robot.transform, numpy.eye(4))
+
+if __name__ == '__main__':
+    unittest.main()
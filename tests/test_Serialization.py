@@ -0,0 +1,442 @@
+#!/usr/bin/env python
+import json, numpy, openravepy, os, shutil, tempfile, unittest
+from numpy.testing import assert_allclose, assert_array_equal
+from prpy import serialization
+from prpy.exceptions import (SerializationException,
+                             UnsupportedVersionDeserializationException)
+
+class BinaryFormatTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'environment')
+        self.data = {
+            'bodies': [ {
+                'name': 'table',
+                'is_robot': False,
+                'kinbody_state': {
+                    'dof_branches': [ 0, 1 ],
+                    'dof_values': [ 0.5, -1.5 ],
+                    'link_velocities': [ [ 0.1 ] * 6, [ 0.2 ] * 6 ],
+                    'link_transforms': [ {
+                        'position': [ 1., 2., 3. ],
+                        'orientation': [ 1., 0., 0., 0. ],
+                    } ],
+                },
+                'links': [ { 'info': { '_mass': 2.5, '_vForcedAdjacentLinks': [] } } ],
+            } ],
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_binary(self, data):
+        with open(self.path, 'wb') as output_file:
+            serialization.dump_binary(data, output_file)
+
+    def test_DumpBinary_RoundTripsSchema(self):
+        self.write_binary(self.data)
+        data = serialization.read_environment_file(self.path)
+
+        state = data['bodies'][0]['kinbody_state']
+        self.assertEqual(data['bodies'][0]['name'], 'table')
+        self.assertEqual(state['dof_branches'], [ 0, 1 ])
+        self.assertEqual(data['bodies'][0]['links'][0]['info'],
+                         { '_mass': 2.5, '_vForcedAdjacentLinks': [] })
+        assert_array_equal(state['dof_values'], [ 0.5, -1.5 ])
+        assert_array_equal(state['link_velocities'], [ [ 0.1 ] * 6, [ 0.2 ] * 6 ])
+        assert_array_equal(state['link_transforms'][0]['position'], [ 1., 2., 3. ])
+
+    def test_DumpBinary_KeepsListsAsLists(self):
+        data = {
+            'float': [ 0.5, 1.5 ],
+            'none': [ 1., None, 2 ],
+            'bool': [ 0.5, True ],
+            'int': [ 0.5, 1 ],
+            'string': [ 1., 'a' ],
+            'ragged': [ [ 1. ], [ 2., 3. ] ],
+        }
+        self.write_binary(data)
+        loaded_data = serialization.read_environment_file(self.path)
+
+        self.assertEqual(loaded_data, data)
+
+    def test_DumpBinary_WritesShortArraysAsLists(self):
+        self.write_binary({ 'short': numpy.array([ 1., 2., 3. ]),
+                            'long': numpy.arange(8.) })
+        data = serialization.read_environment_file(self.path)
+
+        self.assertEqual(data['short'], [ 1., 2., 3. ])
+        self.assertIsInstance(data['long'], numpy.ndarray)
+        assert_array_equal(data['long'], numpy.arange(8.))
+
+    def test_DumpBinary_RejectsUnknownTypes(self):
+        with self.assertRaises(TypeError):
+            self.write_binary({ 'object': object() })
+
+    def test_LoadBinary_ArraysAreAlignedViews(self):
+        state = self.data['bodies'][0]['kinbody_state']
+        state['dof_values'] = numpy.arange(10, dtype=numpy.int32)
+        state['link_velocities'] = numpy.array(state['link_velocities'])
+        self.write_binary(self.data)
+        data = serialization.read_environment_file(self.path)
+
+        state = data['bodies'][0]['kinbody_state']
+        self.assertEqual(state['dof_values'].dtype, numpy.int32)
+        assert_array_equal(state['dof_values'], numpy.arange(10))
+        for key in [ 'dof_values', 'link_velocities' ]:
+            self.assertIsNotNone(state[key].base)
+            self.assertTrue(state[key].flags.aligned)
+
+    def test_ReadEnvironmentFile_LoadsJson(self):
+        with open(self.path, 'wb') as output_file:
+            json.dump(self.data, output_file)
+
+        self.assertEqual(serialization.read_environment_file(self.path),
+                         self.data)
+
+    def test_LoadBinary_RejectsUnknownVersion(self):
+        self.write_binary(self.data)
+        with open(self.path, 'r+b') as output_file:
+            output_file.seek(len(serialization.BINARY_MAGIC))
+            output_file.write('\xff')
+
+        with self.assertRaises(UnsupportedVersionDeserializationException):
+            serialization.read_environment_file(self.path)
+
+    def test_LoadBinary_RejectsTruncatedFile(self):
+        self.write_binary(self.data)
+        with open(self.path, 'r+b') as output_file:
+            output_file.truncate(os.path.getsize(self.path) - 8)
+
+        with open(self.path, 'rb') as input_file:
+            with self.assertRaises(SerializationException):
+                serialization.load_binary(input_file)
+
+class EnvironmentFileTest(unittest.TestCase):
+    def setUp(self):
+        self.env = openravepy.Environment()
+        self.env.Load('data/wamtest2.env.xml')
+        self.robot = self.env.GetRobots()[0]
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'environment')
+
+        lower, upper = self.robot.GetDOFLimits()
+        self.robot.SetDOFValues(
+            numpy.random.RandomState(0).uniform(lower, upper))
+        self.robot.GetLinks()[0].SetFloatParameters('test', [ 0.5, 1.5 ])
+
+    def tearDown(self):
+        self.env.Destroy()
+        shutil.rmtree(self.directory)
+
+    def test_EnvironmentFile_RoundTrips(self):
+        for writer in [ None, serialization.dump_binary ]:
+            serialization.serialize_environment_file(
+                self.env, self.path, writer=writer)
+            env = serialization.deserialize_environment_file(self.path)
+
+            try:
+                self.assertEqual(
+                    sorted(body.GetName() for body in env.GetBodies()),
+                    sorted(body.GetName() for body in self.env.GetBodies()))
+
+                for body in self.env.GetBodies():
+                    other_body = env.GetKinBody(body.GetName())
+                    assert_allclose(other_body.GetLinkTransformations(),
+                                    body.GetLinkTransformations(), atol=1e-9)
+                    assert_allclose(other_body.GetDOFValues(),
+                                    body.GetDOFValues(), atol=1e-9)
+
+                robot = env.GetKinBody(self.robot.GetName())
+                assert_allclose(
+                    robot.GetLinks()[0].GetFloatParameters('test'),
+                    [ 0.5, 1.5 ])
+            finally:
+                env.Destroy()
+
+class MockBody(object):
+    def __init__(self, name, kinematics_hash='hash'):
+        self.name = name
+        self.kinematics_hash = kinematics_hash
+        self.description = ''
+        self.transform = numpy.eye(4)
+        self.dof_values = numpy.zeros(2)
+        self.dof_limits = (-numpy.ones(2), numpy.ones(2))
+
+    def __getattr__(self, name):
+        # Per-DOF and per-link getters and setters that are not used by the
+        # tests.
+        if name.startswith('Get'):
+            return lambda: numpy.ones(2)
+        elif name.startswith('Set'):
+            return lambda *args: None
+        raise AttributeError(name)
+
+    def GetName(self): return self.name
+    def GetKinematicsGeometryHash(self): return self.kinematics_hash
+    def IsRobot(self): return False
+    def GetXMLFilename(self): return ''
+    def GetLinks(self): return []
+    def GetJoints(self): return []
+    def GetPassiveJoints(self): return []
+    def GetDescription(self): return self.description
+    def SetDescription(self, value): self.description = value
+    def GetTransform(self): return self.transform
+    def SetTransform(self, value): self.transform = numpy.array(value)
+    def GetDOFValues(self): return self.dof_values
+    def GetDOFLimits(self): return self.dof_limits
+    def SetDOFLimits(self, lower, upper): self.dof_limits = (lower, upper)
+
+    def GetLinkTransformations(self, return_dof_branches):
+        H = self.transform.copy()
+        H[0:2, 3] += self.dof_values
+        return [ self.transform, H ], numpy.zeros(2, dtype=int)
+
+    def SetLinkTransformations(self, transforms, dof_branches):
+        self.transform = numpy.array(transforms[0])
+        self.dof_values = numpy.array(transforms[1])[0:2, 3] \
+                        - self.transform[0:2, 3]
+
+class MockManipulator(object):
+    def GetName(self): return 'arm'
+
+class MockRobot(MockBody):
+    def __init__(self, name):
+        super(MockRobot, self).__init__(name)
+        self.grabbed = []
+
+    def IsRobot(self): return True
+    def GetManipulators(self): return []
+    def GetActiveDOFIndices(self): return numpy.arange(2)
+    def GetActiveManipulator(self): return MockManipulator()
+
+    def GetGrabbedInfo(self):
+        grabbed_infos = []
+        for body in self.grabbed:
+            grabbed_info = openravepy.Robot.GrabbedInfo()
+            grabbed_info._grabbedname = body.GetName()
+            grabbed_info._robotlinkname = 'hand'
+            grabbed_info._setRobotLinksToIgnore = []
+            grabbed_info._trelative = numpy.eye(4)
+            grabbed_infos.append(grabbed_info)
+        return grabbed_infos
+
+class MockEnvironment(object):
+    def __init__(self, bodies):
+        self.bodies = list(bodies)
+
+    def GetBodies(self):
+        return list(self.bodies)
+
+    def GetKinBody(self, name):
+        for body in self.bodies:
+            if body.GetName() == name:
+                return body
+        return None
+
+    def Remove(self, body):
+        self.bodies.remove(body)
+
+class EnvironmentDeltaTest(unittest.TestCase):
+    def setUp(self):
+        self.table = MockBody('table')
+        self.box = MockBody('box')
+        self.env = MockEnvironment([ self.table, self.box ])
+        self.serializer = serialization.EnvironmentDeltaSerializer()
+
+    def test_Serialize_FullSnapshotThenEmptyDelta(self):
+        data = self.serializer.Serialize(self.env)
+        self.assertTrue(data['full'])
+        self.assertEqual(sorted(body['name'] for body in data['added']),
+                         [ 'box', 'table' ])
+        self.assertEqual(data['hashes'], { 'box': 'hash', 'table': 'hash' })
+
+        data = self.serializer.Serialize(self.env)
+        self.assertFalse(data['full'])
+        self.assertEqual(data['added'], [])
+        self.assertEqual(data['removed'], [])
+        self.assertEqual(data['changed'], {})
+
+    def test_Serialize_OnlyChangedFields(self):
+        self.serializer.Serialize(self.env)
+        self.box.description = 'moved'
+        self.box.dof_values = numpy.array([ 0.1, 0.2 ])
+
+        data = self.serializer.Serialize(self.env)
+        self.assertEqual(data['changed'].keys(), [ 'box' ])
+        self.assertEqual(sorted(data['changed']['box']['kinbody_state']),
+                         [ 'description', 'dof_branches', 'dof_values',
+                           'link_transforms' ])
+
+    def test_Serialize_AddsAndRemovesBodies(self):
+        self.serializer.Serialize(self.env)
+        self.env.bodies = [ MockBody('table', kinematics_hash='other') ]
+
+        data = self.serializer.Serialize(self.env)
+        self.assertEqual(data['removed'], [ 'box' ])
+        self.assertEqual([ body['name'] for body in data['added'] ], [ 'table' ])
+        self.assertEqual(data['hashes'], { 'table': 'other' })
+
+    def test_Serialize_RegrabsReaddedBodies(self):
+        robot = MockRobot('robot')
+        robot.grabbed = [ self.box ]
+        self.env.bodies.append(robot)
+        self.serializer.Serialize(self.env)
+
+        self.box.kinematics_hash = 'other'
+        data = self.serializer.Serialize(self.env)
+
+        self.assertEqual([ body['name'] for body in data['added'] ], [ 'box' ])
+        grabbed_bodies = data['changed']['robot']['robot_state']['grabbed_bodies']
+        self.assertEqual([ grabbed_info['_grabbedname']
+                           for grabbed_info in grabbed_bodies ], [ 'box' ])
+
+    def test_DeserializeEnvironmentDelta_UpdatesTargetInPlace(self):
+        target_box = MockBody('box')
+        target_env = MockEnvironment([ MockBody('table'), target_box,
+                                       MockBody('extra') ])
+
+        data = self.serializer.Serialize(self.env)
+        serialization.deserialize_environment_delta(data, target_env)
+        self.assertEqual([ body.GetName() for body in target_env.GetBodies() ],
+                         [ 'table', 'box' ])
+        self.assertIs(target_env.GetKinBody('box'), target_box)
+
+        self.box.description = 'moved'
+        self.box.dof_values = numpy.array([ 0.1, 0.2 ])
+        data = self.serializer.Serialize(self.env)
+        serialization.deserialize_environment_delta(data, target_env)
+        self.assertEqual(target_box.description, 'moved')
+        numpy.testing.assert_allclose(target_box.dof_values, [ 0.1, 0.2 ])
+
+class BinarySerializationTest(unittest.TestCase):
+    def setUp(self):
+        self.body = MockBody('box')
+        self.body.transform[0:3, 3] = [ 1., 2., 3. ]
+        self.body.dof_values = numpy.array([ 0.1, 0.2 ])
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'environment')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_SerializeKinbodyState_BinaryKeepsFloatArrays(self):
+        data = serialization.serialize_kinbody_state(self.body, binary=True)
+
+        self.assertIsInstance(data['dof_values'], numpy.ndarray)
+        self.assertIsInstance(data['link_velocities'], numpy.ndarray)
+        self.assertIsInstance(data['transform']['position'], numpy.ndarray)
+        self.assertIsInstance(data['link_transforms'][1]['orientation'],
+                              numpy.ndarray)
+        self.assertEqual(data['dof_branches'], [ 0, 0 ])
+
+        # The default format only contains JSON types.
+        data = serialization.serialize_kinbody_state(self.body)
+        self.assertIsInstance(data['dof_values'], list)
+        self.assertIsInstance(data['transform']['position'], list)
+        json.dumps(data)
+
+    def test_DumpBinary_KinbodyStateRoundTrips(self):
+        data = serialization.serialize_kinbody_state(self.body, binary=True)
+        with open(self.path, 'wb') as output_file:
+            serialization.dump_binary(data, output_file)
+
+        body = MockBody('box')
+        serialization.deserialize_kinbody_state(
+            body, serialization.read_environment_file(self.path))
+
+        assert_allclose(body.transform, self.body.transform, atol=1e-9)
+        assert_allclose(body.dof_values, self.body.dof_values, atol=1e-9)
+
+class MockTriMesh(object):
+    def __init__(self, num_vertices):
+        self.vertices = numpy.zeros((num_vertices, 3))
+        self.indices = numpy.zeros((num_vertices, 3), dtype=numpy.int64)
+
+class MockMeshEnvironment(object):
+    def __init__(self):
+        self.uris = []
+
+    def ReadTrimeshURI(self, uri):
+        self.uris.append(uri)
+        with open(uri) as mesh_file:
+            return MockTriMesh(int(mesh_file.read()))
+
+class MeshCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.mesh_environment = MockMeshEnvironment()
+        self.original_mesh_environment = serialization._mesh_environment
+        serialization._mesh_environment = self.mesh_environment
+
+        # Each mesh has 48 bytes of vertices and indices per vertex.
+        self.cache = serialization.MeshCache(max_bytes=48 * 25)
+
+    def tearDown(self):
+        serialization._mesh_environment = self.original_mesh_environment
+        shutil.rmtree(self.directory)
+
+    def write_mesh(self, name, num_vertices):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as mesh_file:
+            mesh_file.write(str(num_vertices))
+        return path
+
+    def test_ReadTrimeshURI_SharesCachedMesh(self):
+        path = self.write_mesh('a.stl', 10)
+        trimesh = self.cache.ReadTrimeshURI(path)
+
+        self.assertIs(self.cache.ReadTrimeshURI(path), trimesh)
+        self.assertEqual(self.mesh_environment.uris, [ path ])
+        self.assertFalse(trimesh.vertices.flags.writeable)
+        self.assertEqual(self.cache.GetStats()['hits'], 1)
+
+    def test_ReadTrimeshURI_ReloadsChangedFile(self):
+        path = self.write_mesh('a.stl', 10)
+        self.cache.ReadTrimeshURI(path)
+        self.write_mesh('a.stl', 100)
+
+        self.assertEqual(self.cache.ReadTrimeshURI(path).vertices.shape, (100, 3))
+
+    def test_ReadTrimeshURI_KeysRelativeUriByResolvedPath(self):
+        directories = [ os.path.join(self.directory, name) for name in 'ab' ]
+        for directory in directories:
+            os.mkdir(directory)
+            with open(os.path.join(directory, 'mesh.stl'), 'w') as mesh_file:
+                mesh_file.write('10')
+
+        cwd = os.getcwd()
+        try:
+            for directory in directories:
+                os.chdir(directory)
+                self.cache.ReadTrimeshURI('mesh.stl')
+        finally:
+            os.chdir(cwd)
+
+        self.assertEqual(self.mesh_environment.uris,
+            [ os.path.join(os.path.realpath(directory), 'mesh.stl')
+              for directory in directories ])
+
+    def test_MeshEnvironment_ForwardsToMeshEnvironment(self):
+        path = self.write_mesh('a.stl', 10)
+        serialization.mesh_environment.ReadTrimeshURI(path)
+        self.assertEqual(self.mesh_environment.uris, [ path ])
+
+    def test_ReadTrimeshURI_EvictsLeastRecentlyUsed(self):
+        paths = [ self.write_mesh(name, 10) for name in [ 'a', 'b', 'c' ] ]
+        self.cache.ReadTrimeshURI(paths[0])
+        self.cache.ReadTrimeshURI(paths[1])
+        self.cache.ReadTrimeshURI(paths[0])
+        self.cache.ReadTrimeshURI(paths[2])
+
+        stats = self.cache.GetStats()
+        self.assertEqual(stats['evicted'], 1)
+        self.assertEqual(stats['nbytes'], 2 * 48 * 10)
+
+        self.cache.ReadTrimeshURI(paths[0])
+        self.assertEqual(self.mesh_environment.uris, paths)
+        self.cache.ReadTrimeshURI(paths[1])
+        self.assertEqual(self.mesh_environment.uris[-1], paths[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+import numpy, unittest
+from numpy.testing import assert_allclose
+from prpy.tsr import HaltonSampler, TSR, TSRChain, UniformSampler
+from prpy.tsr import kin
+
+class TSRTest(unittest.TestCase):
+    def setUp(self):
+        self.T0_w = kin.pose_to_H(kin.pose_from_xyzypr([ 1., 2., 3., 0.3, 0.2, 0.1 ]))
+        self.Tw_e = kin.pose_to_H(kin.pose_from_xyzypr([ 0., 0., 0.1, 1., 0., 0.5 ]))
+        self.Bw = numpy.array([
+            [ -0.1, 0.1 ], [ 0., 0. ], [ -1., 1. ],
+            [ -numpy.pi, numpy.pi ], [ -0.5, 0.5 ], [ -numpy.pi, numpy.pi ] ])
+        self.tsr = TSR(T0_w=self.T0_w, Tw_e=self.Tw_e, Bw=self.Bw)
+
+    def test_SampleBatch_MatchesSample(self):
+        vals = numpy.random.uniform(-1., 1., (20, 6))
+        expected = numpy.array([ self.tsr.sample(v) for v in vals ])
+
+        assert_allclose(self.tsr.sample_batch(vals=vals), expected, atol=1e-12)
+
+    def test_SampleBatch_FreeDimensionsMatchSample(self):
+        vals = numpy.random.uniform(-1., 1., (20, 5))
+        expected = numpy.array([ self.tsr.sample(v) for v in vals ])
+
+        assert_allclose(self.tsr.sample_batch(vals=vals), expected, atol=1e-12)
+
+    def test_SampleBatch_ReturnsRequestedShape(self):
+        self.assertEqual(self.tsr.sample_batch(100).shape, (100, 4, 4))
+
+    def test_SampleBatch_RespectsBounds(self):
+        tsr = TSR(T0_w=numpy.eye(4), Tw_e=numpy.eye(4), Bw=numpy.array([
+            [ -0.1, 0.1 ], [ 0., 0. ], [ 0.5, 0.5 ],
+            [ 0., 0. ], [ 0., 0. ], [ 0., 0. ] ]))
+        samples = tsr.sample_batch(1000)
+
+        self.assertTrue(numpy.all(numpy.abs(samples[:, 0, 3]) <= 0.1))
+        assert_allclose(samples[:, 1, 3], 0.)
+        assert_allclose(samples[:, 2, 3], 0.5)
+        assert_allclose(samples[:, 0:3, 0:3], numpy.tile(numpy.eye(3), (1000, 1, 1)))
+
+    def test_Distance_ZeroInsideTSR(self):
+        poses = self.tsr.sample_batch(100)
+
+        assert_allclose(self.tsr.distance(poses), numpy.zeros(100), atol=1e-9)
+        self.assertTrue(numpy.all(self.tsr.contains(poses)))
+
+    def test_Distance_MeasuresBoundViolation(self):
+        poses = self.tsr.sample_batch(100)
+        poses[:, 0:3, 3] += numpy.dot(self.T0_w[0:3, 0:3], [ 0., 0.25, 0. ])
+
+        assert_allclose(self.tsr.distance(poses), 0.25 * numpy.ones(100), atol=1e-9)
+        self.assertFalse(numpy.any(self.tsr.contains(poses)))
+
+    def test_Distance_HandlesAngleWrapAround(self):
+        Bw = numpy.zeros((6, 2))
+        Bw[5, :] = [ 3., 3.5 ]
+        tsr = TSR(Bw=Bw)
+
+        inside = tsr.sample_batch(vals=[ [ 0., 0., 0., 0., 0., 3.4 ] ])
+        outside = tsr.sample_batch(vals=[ [ 0., 0., 0., 0., 0., 2.9 ] ])
+
+        assert_allclose(tsr.distance(inside), [ 0. ], atol=1e-9)
+        assert_allclose(tsr.distance(outside), [ 0.1 ], atol=1e-9)
+        assert_allclose(tsr.to_bw(inside)[0, 5], 3.4 - 2. * numpy.pi, atol=1e-9)
+
+    def test_Project_ProjectsOntoTSR(self):
+        poses = self.tsr.sample_batch(100)
+        assert_allclose(self.tsr.project(poses), poses, atol=1e-9)
+
+        poses[:, 0:3, 3] += numpy.random.normal(0., 0.5, (100, 3))
+        assert_allclose(self.tsr.distance(self.tsr.project(poses)),
+                        numpy.zeros(100), atol=1e-9)
+
+    def test_SampleBatch_InvalidValsRaises(self):
+        with self.assertRaises(ValueError):
+            self.tsr.sample_batch(vals=numpy.zeros((2, 3)))
+
+class TSRChainTest(unittest.TestCase):
+    def setUp(self):
+        self.tsr1 = TSR(T0_w=kin.pose_to_H(kin.pose_from_xyzypr([ 1., 0., 0., 0.5, 0., 0. ])),
+                        Bw=numpy.array([ [ 0., 0. ] ] * 5 + [ [ -1., 1. ] ]))
+        self.tsr2 = TSR(Tw_e=kin.pose_to_H(kin.pose_from_xyzypr([ 0., 0., 0.2, 0., 0., 0. ])),
+                        Bw=numpy.array([ [ -0.1, 0.1 ] ] + [ [ 0., 0. ] ] * 5))
+        self.chain = TSRChain(sample_goal=True, TSRs=[ self.tsr1, self.tsr2 ])
+
+    def test_SampleBatch_DoesNotModifyTSRs(self):
+        T0_w = self.tsr2.T0_w.copy()
+        self.chain.sample_batch(10)
+
+        assert_allclose(self.tsr2.T0_w, T0_w)
+
+    def test_SampleBatch_MatchesSample(self):
+        numpy.random.seed(0)
+        samples = self.chain.sample_batch(1)
+
+        numpy.random.seed(0)
+        vals1 = self.tsr1.Bw[:, 0] + (self.tsr1.Bw[:, 1] - self.tsr1.Bw[:, 0]) \
+            * numpy.random.random_sample((1, 6))
+        vals2 = self.tsr2.Bw[:, 0] + (self.tsr2.Bw[:, 1] - self.tsr2.Bw[:, 0]) \
+            * numpy.random.random_sample((1, 6))
+        tsr2 = TSR(T0_w=self.tsr1.sample(vals1[0]), Tw_e=self.tsr2.Tw_e, Bw=self.tsr2.Bw)
+
+        assert_allclose(samples[0], tsr2.sample(vals2[0]), atol=1e-12)
+
+    def test_Distance_SmallInsideChain(self):
+        poses = self.chain.sample_batch(20)
+        self.assertLess(numpy.median(self.chain.distance(poses)), 0.01)
+
+    def test_Distance_LargeOutsideChain(self):
+        poses = self.chain.sample_batch(20)
+        poses[:, 2, 3] += 1.
+        self.assertTrue(numpy.all(self.chain.distance(poses) > 0.5))
+
+    def test_Distance_SingleTSRChainIsExact(self):
+        chain = TSRChain(sample_goal=True, TSR=self.tsr1)
+        poses = chain.sample_batch(20)
+        assert_allclose(chain.distance(poses), numpy.zeros(20), atol=1e-9)
+
+    def test_SampleBatch_EmptyChainReturnsNone(self):
+        self.assertIsNone(TSRChain().sample_batch(10))
+
+class HaltonSamplerTest(unittest.TestCase):
+    def test_Sample_InUnitHypercube(self):
+        samples = HaltonSampler(seed=0).sample(1000, 12)
+
+        self.assertEqual(samples.shape, (1000, 12))
+        self.assertTrue(numpy.all(samples >= 0.))
+        self.assertTrue(numpy.all(samples < 1.))
+
+    def test_Sample_IsStratified(self):
+        samples = HaltonSampler(seed=0).sample(16, 2)
+        counts = numpy.bincount((samples[:, 0] * 16).astype(int), minlength=16)
+        assert_allclose(counts, numpy.ones(16))
+
+        samples = HaltonSampler(seed=0).sample(9, 2)
+        counts = numpy.bincount((samples[:, 1] * 9 + 1e-9).astype(int), minlength=9)
+        assert_allclose(counts, numpy.ones(9))
+
+    def test_Sample_ContinuesSequenceAcrossCalls(self):
+        sampler = HaltonSampler(seed=0)
+        batches = numpy.vstack((sampler.sample(30, 6), sampler.sample(70, 6)))
+
+        assert_allclose(batches, HaltonSampler(seed=0).sample(100, 6))
+
+    def test_Sample_SeedIsReproducible(self):
+        assert_allclose(HaltonSampler(seed=3).sample(50, 6),
+                        HaltonSampler(seed=3).sample(50, 6))
+        self.assertFalse(numpy.allclose(HaltonSampler(seed=3).sample(50, 6),
+                                        HaltonSampler(seed=4).sample(50, 6)))
+
+    def test_Reset_RestartsSequence(self):
+        sampler = HaltonSampler(seed=0)
+        first = sampler.sample(10, 6)
+        sampler.reset()
+
+        assert_allclose(sampler.sample(10, 6), first)
+
+    def test_TSRChainSampleBatch_UsesSampler(self):
+        tsr = TSR(Bw=numpy.array([ [ -1., 1. ] ] + [ [ 0., 0. ] ] * 5))
+        chain = TSRChain(sample_goal=True, TSR=tsr)
+
+        samples = chain.sample_batch(16, sampler=HaltonSampler(seed=0))
+        counts = numpy.bincount(((samples[:, 0, 3] + 1.) * 8).astype(int), minlength=16)
+        assert_allclose(counts, numpy.ones(16))
+
+    def test_UniformSampler_SeedIsReproducible(self):
+        assert_allclose(UniformSampler(seed=3).sample(50, 6),
+                        UniformSampler(seed=3).sample(50, 6))
+
+if __name__ == '__main__':
+    unittest.main()
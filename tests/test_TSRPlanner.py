@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+import numpy, threading, unittest
+from numpy.testing import assert_allclose
+from prpy.planning.base import PlanningError
+from prpy.planning.tsr import TSRPlanner
+
+# Upper bound on waits, so that a regression fails instead of hanging.
+TIMEOUT = 5.0
+
+class ContextMock(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+class RobotMock(object):
+    def CreateRobotStateSaver(self, options):
+        return ContextMock()
+
+    def SetActiveDOFs(self, dof_indices):
+        pass
+
+class ManipulatorMock(object):
+    def GetArmIndices(self):
+        return [ 0 ]
+
+class IKSolverMock(object):
+    def __init__(self):
+        self.num_synchronized = 0
+
+    def Synchronize(self):
+        self.num_synchronized += 1
+
+class DelegatePlannerMock(object):
+    def __init__(self, plan_fn):
+        self.plan_fn = plan_fn
+        self.goals = []
+
+    def PlanToConfiguration(self, robot, goal, **kw_args):
+        self.goals.append(goal[0])
+        return self.plan_fn(goal)
+
+def first_joint_cost(robot, ik_solutions):
+    return ik_solutions[:, 0]
+
+class PlanToTSRStreamingTest(unittest.TestCase):
+    def setUp(self):
+        # Use the parallel IK solver code path, which does not clone the
+        # environment; IK solutions come from self.generate.
+        self.planner = TSRPlanner(num_ik_workers=1)
+        self.ik_solver = IKSolverMock()
+        self.planner._GetIKSolver = lambda manipulator: self.ik_solver
+        self.planner._GenerateIKSolutions = self.GenerateIKSolutions
+
+        self.robot = RobotMock()
+        self.manipulator = ManipulatorMock()
+        self.planned = threading.Event()
+        self.num_produced = 0
+        self.production_done = False
+
+    def GenerateIKSolutions(self, manipulator, tsr_poses, synchronize=True):
+        self.synchronized = synchronize
+        return self.generate()
+
+    def plan(self, delegate_planner, num_attempts=3):
+        return self.planner._PlanToTSRStreaming(
+            self.robot, self.manipulator, [], first_joint_cost,
+            delegate_planner, num_attempts, 1)
+
+    def produce(self, ik_solutions):
+        self.num_produced += 1
+        return numpy.array(ik_solutions, dtype=float)
+
+    def succeed(self, goal):
+        self.planned.set()
+        return 'traj'
+
+    def test_PlanToTSRStreaming_PlansBeforeProductionEnds(self):
+        def generate():
+            yield self.produce([ [ 1. ] ])
+            # Only continue once the first solution has been planned to.
+            self.planned.wait(TIMEOUT)
+            yield self.produce([ [ 0. ] ])
+            self.production_done = True
+
+        self.generate = generate
+
+        def plan_fn(goal):
+            self.assertFalse(self.production_done)
+            return self.succeed(goal)
+
+        delegate_planner = DelegatePlannerMock(plan_fn)
+
+        self.assertEqual(self.plan(delegate_planner), 'traj')
+        self.assertEqual(delegate_planner.goals, [ 1. ])
+
+        # The caller synchronized the parallel IK solver, so the producer
+        # must not.
+        self.assertEqual(self.ik_solver.num_synchronized, 1)
+        self.assertFalse(self.synchronized)
+
+    def test_PlanToTSRStreaming_Success_StopsProducer(self):
+        def generate():
+            yield self.produce([ [ 1. ] ])
+            self.planned.wait(TIMEOUT)
+
+            # Production would go on for much longer than the test.
+            for _ in xrange(100000):
+                yield self.produce([ [ 2. ] ])
+
+        self.generate = generate
+        delegate_planner = DelegatePlannerMock(self.succeed)
+
+        self.assertEqual(self.plan(delegate_planner), 'traj')
+        self.assertLess(self.num_produced, 100)
+
+    def test_PlanToTSRStreaming_BetterSolutionArrives_IsTriedFirst(self):
+        better_produced = threading.Event()
+
+        def generate():
+            yield self.produce([ [ 2. ], [ 3. ] ])
+            self.planned.wait(TIMEOUT)
+            yield self.produce([ [ 1. ] ])
+            better_produced.set()
+
+        self.generate = generate
+
+        def plan_fn(goal):
+            if goal[0] == 2.:
+                # Fail once the better solution is queued.
+                self.planned.set()
+                better_produced.wait(TIMEOUT)
+                raise PlanningError('Injected planning failure.')
+            return 'traj'
+
+        delegate_planner = DelegatePlannerMock(plan_fn)
+
+        self.assertEqual(self.plan(delegate_planner), 'traj')
+        assert_allclose(delegate_planner.goals, [ 2., 1. ])
+
+    def test_PlanToTSRStreaming_ProducerError_RaisesPlanningError(self):
+        def generate():
+            raise RuntimeError('Injected IK failure.')
+            yield
+
+        self.generate = generate
+        delegate_planner = DelegatePlannerMock(self.succeed)
+
+        with self.assertRaises(PlanningError) as context:
+            self.plan(delegate_planner)
+
+        self.assertIn('Injected IK failure.', str(context.exception))
+        self.assertEqual(delegate_planner.goals, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+import os
+if os.environ.get('ROS_DISTRO', 'hydro')[0] in 'abcdef':
+    import roslib; roslib.load_manifest('prpy')
+
+import numpy, shutil, tempfile, unittest
+from numpy.testing import assert_allclose
+from prpy.planning.library import TrajectoryLibrary
+
+class TrajectoryLibraryTest(unittest.TestCase):
+    def setUp(self):
+        self.library = TrajectoryLibrary()
+        self.dof_indices = [ 0, 1 ]
+
+    def make_path(self, start, goal, num_waypoints=5):
+        alphas = numpy.linspace(0., 1., num_waypoints)[:, numpy.newaxis]
+        return (1. - alphas) * numpy.array(start) + alphas * numpy.array(goal)
+
+    def test_Query_EmptyLibraryReturnsNothing(self):
+        self.assertEqual(self.library.query(self.dof_indices, [ 0., 0. ], [ 1., 1. ]), [])
+
+    def test_Query_ReturnsClosestPathsFirst(self):
+        far_path = self.make_path([ 5., 5. ], [ 6., 6. ])
+        near_path = self.make_path([ 0., 0. ], [ 1., 1. ])
+        self.library.add(self.dof_indices, far_path)
+        self.library.add(self.dof_indices, near_path)
+
+        results = self.library.query(self.dof_indices, [ 0.1, 0. ], [ 1., 1. ], k=2)
+
+        self.assertEqual(len(results), 2)
+        assert_allclose(results[0][1], near_path)
+        assert_allclose(results[1][1], far_path)
+        self.assertLess(results[0][0], results[1][0])
+
+    def test_Query_IgnoresOtherDOFIndices(self):
+        self.library.add([ 2, 3 ], self.make_path([ 0., 0. ], [ 1., 1. ]))
+        self.assertEqual(self.library.query(self.dof_indices, [ 0., 0. ], [ 1., 1. ]), [])
+
+    def test_Add_DiscardsOldestPaths(self):
+        library = TrajectoryLibrary(max_size=1)
+        library.add(self.dof_indices, self.make_path([ 0., 0. ], [ 1., 1. ]))
+        library.add(self.dof_indices, self.make_path([ 5., 5. ], [ 6., 6. ]))
+
+        self.assertEqual(len(library), 1)
+        results = library.query(self.dof_indices, [ 0., 0. ], [ 1., 1. ])
+        assert_allclose(results[0][1][0], [ 5., 5. ])
+
+    def test_Add_InvalidShapeRaises(self):
+        with self.assertRaises(ValueError):
+            self.library.add(self.dof_indices, numpy.zeros((5, 3)))
+        with self.assertRaises(ValueError):
+            self.library.add(self.dof_indices, numpy.zeros((1, 2)))
+
+    def test_SaveLoad_RoundTrips(self):
+        path = self.make_path([ 0., 0. ], [ 1., 1. ])
+        self.library.add(self.dof_indices, path)
+
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'library.npz')
+            self.library.save(filename)
+            library = TrajectoryLibrary.load(filename)
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEqual(len(library), 1)
+        results = library.query(self.dof_indices, [ 0., 0. ], [ 1., 1. ])
+        assert_allclose(results[0][1], path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+import numpy, openravepy, unittest
+from prpy.planning.vectorfield import Status, VectorFieldPlanner
+
+class FollowVectorFieldAdaptiveTest(unittest.TestCase):
+    config_start = numpy.array([
+        +2.35061574,  0.61043555,  0.85000000,  1.80684444, -0.08639935,
+        -0.69750474,  1.31656172
+    ])
+
+    def setUp(self):
+        self.env = openravepy.Environment()
+        self.env.Load('data/wamtest2.env.xml')
+        self.robot = self.env.GetRobot('BarrettWAM')
+        self.manipulator = self.robot.GetManipulator('arm')
+        self.env.Remove(self.env.GetKinBody('floor'))
+
+        with self.env:
+            self.robot.SetActiveManipulator(self.manipulator)
+            self.robot.SetActiveDOFs(self.manipulator.GetArmIndices())
+            self.robot.SetActiveDOFValues(self.config_start)
+
+            # Same fixed step as FollowVectorField with the default
+            # dt_multiplier.
+            resolutions = self.robot.GetActiveDOFResolutions()
+            vlimits = self.robot.GetDOFVelocityLimits(
+                self.robot.GetActiveDOFIndices())
+            self.dt_step = 1.01 * min(resolutions / vlimits)
+
+            # Move the first joint four resolutions per fixed step, so that
+            # even a third of this speed makes progress.
+            self.speed = 4. * resolutions[0] / self.dt_step
+
+        self.planner = VectorFieldPlanner()
+        self.evaluations = []
+
+    def tearDown(self):
+        self.env.Destroy()
+
+    def follow(self, speed_fn, q_goal):
+        # Move the first joint at speed_fn(q0) until it reaches q_goal. The
+        # planner runs on a clone of the robot in its own environment.
+        def GetConfiguration():
+            robot = self.planner.env.GetRobot(self.robot.GetName())
+            return robot.GetActiveDOFValues()
+
+        def fn_vectorfield():
+            q = GetConfiguration()
+            dq = numpy.zeros(q.shape[0])
+            dq[0] = speed_fn(q[0])
+            self.evaluations.append((q, dq))
+            return dq
+
+        def fn_terminate():
+            if GetConfiguration()[0] >= q_goal:
+                return Status.TERMINATE
+            return Status.CONTINUE
+
+        return self.planner.FollowVectorField(
+            self.robot, fn_vectorfield, fn_terminate, adaptive=True)
+
+    def trial_steps(self):
+        # Every trial step evaluates the field at its start and at the Euler
+        # prediction of its end. Returns (start q0, end q0, duration) per
+        # trial step.
+        steps = []
+        for (q1, k1), (q2, k2) in zip(self.evaluations[0::2],
+                                      self.evaluations[1::2]):
+            steps.append((q1[0], q2[0], (q2[0] - q1[0]) / k1[0]))
+        return steps
+
+    def test_FollowVectorField_Adaptive_GrowsAndRejectsSteps(self):
+        q_switch = self.config_start[0] + 0.2
+        q_goal = self.config_start[0] + 0.4
+        slow_speed = self.speed / 3.
+
+        traj = self.follow(
+            lambda q0: self.speed if q0 < q_switch else slow_speed, q_goal)
+        self.assertIsInstance(traj, openravepy.Trajectory)
+
+        steps = self.trial_steps()
+
+        # Without integration error, every accepted step doubles.
+        self.assertAlmostEqual(steps[0][2], self.dt_step)
+        self.assertAlmostEqual(steps[1][2], 2. * self.dt_step)
+
+        # The step across the change in speed is retried from the same
+        # configuration with a shorter duration.
+        rejected = [ (q_start, q_end, dt, next_dt)
+                     for (q_start, q_end, dt), (next_q_start, _, next_dt)
+                     in zip(steps[:-1], steps[1:])
+                     if next_q_start == q_start ]
+        self.assertTrue(rejected)
+
+        q_start, q_end, dt, next_dt = rejected[0]
+        self.assertLess(q_start, q_switch)
+        self.assertGreater(q_end, q_switch)
+        self.assertLess(next_dt, dt)
+
+    def test_FollowVectorField_Adaptive_ShrinksStepsThatTerminate(self):
+        q_goal = self.config_start[0] + 0.4
+
+        traj = self.follow(lambda q0: self.speed, q_goal)
+        self.assertIsInstance(traj, openravepy.Trajectory)
+
+        steps = self.trial_steps()
+
+        # The constant field has no integration error, so only steps that
+        # reach the goal are rejected. Those are retried until they are no
+        # longer than the fixed step.
+        num_rejected = 0
+        for (q_start, q_end, dt), (next_q_start, _, next_dt) in zip(
+                steps[:-1], steps[1:]):
+            if q_end >= q_goal:
+                self.assertEqual(next_q_start, q_start)
+                self.assertLess(next_dt, dt)
+                num_rejected += 1
+        self.assertGreater(num_rejected, 0)
+
+        q_start, q_end, dt = steps[-1]
+        self.assertGreaterEqual(q_end, q_goal)
+        self.assertAlmostEqual(dt, self.dt_step)
+
+if __name__ == '__main__':
+    unittest.main()
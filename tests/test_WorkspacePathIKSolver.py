@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+import numpy, unittest
+from numpy.testing import assert_allclose
+from prpy.planning.workspace import WorkspacePathIKSolver
+
+class TrajectoryMock(object):
+    """ Straight workspace path along the x-axis at unit speed. """
+    def Sample(self, t):
+        # OpenRAVE poses are [ qw, qx, qy, qz, x, y, z ].
+        return numpy.array([ 1., 0., 0., 0., t, 0., 0. ])
+
+class EnvMock(object):
+    def __init__(self, robot):
+        self.robot = robot
+        self.colliding = False
+
+    def CheckCollision(self, body):
+        return self.colliding
+
+class RobotMock(object):
+    """ Robot with three prismatic DOFs along the x, y and z axes. """
+    def __init__(self):
+        self.env = EnvMock(self)
+        self.manip = ManipulatorMock(self)
+        self.q = numpy.zeros(3)
+        self.saved_q = []
+
+    def __enter__(self):
+        self.saved_q.append(self.q.copy())
+
+    def __exit__(self, *args):
+        self.q = self.saved_q.pop()
+
+    def GetEnv(self):
+        return self.env
+
+    def GetActiveManipulator(self):
+        return self.manip
+
+    def GetActiveDOFResolutions(self):
+        return 0.01 * numpy.ones(3)
+
+    def GetActiveDOFLimits(self):
+        return -numpy.ones(3), numpy.ones(3)
+
+    def SetActiveDOFValues(self, q):
+        self.q = numpy.array(q, dtype=float)
+
+    def CheckSelfCollision(self):
+        return False
+
+class ManipulatorMock(object):
+    def __init__(self, robot):
+        self.robot = robot
+        self.analytic_solution = None
+        self.num_analytic_calls = 0
+
+    def GetEndEffectorTransform(self):
+        pose = numpy.eye(4)
+        pose[0:3, 3] = self.robot.q
+        return pose
+
+    def CalculateJacobian(self):
+        return numpy.eye(3)
+
+    def CalculateAngularVelocityJacobian(self):
+        return numpy.zeros((3, 3))
+
+    def FindIKSolution(self, ik_param, filter_options, **kw_args):
+        self.num_analytic_calls += 1
+        return self.analytic_solution
+
+class WorkspacePathIKSolverTest(unittest.TestCase):
+    def setUp(self):
+        self.robot = RobotMock()
+        self.manip = self.robot.manip
+
+    def test_Solve_WithinResolution_ReusesCachedSolution(self):
+        solver = WorkspacePathIKSolver(self.robot, TrajectoryMock())
+
+        q = solver.Solve(0.5, numpy.zeros(3))
+        assert_allclose(q, [ 0.5, 0., 0. ], atol=1e-5)
+        self.assertEqual(solver.num_local, 1)
+        self.assertEqual(self.manip.num_analytic_calls, 0)
+
+        # A seed within resolution of the solution reuses it.
+        q_cached = solver.Solve(0.5, q + [ 0.005, -0.005, 0. ])
+        self.assertIs(q_cached, q)
+        self.assertEqual(solver.num_local, 1)
+        self.assertEqual(solver.num_cache_hits, 1)
+
+        # A seed further away solves again.
+        solver.Solve(0.5, q + [ 0., 0.02, 0. ])
+        self.assertEqual(solver.num_local, 2)
+        self.assertEqual(solver.num_cache_hits, 1)
+
+        # The cache is keyed by path time.
+        solver.Solve(0.6, q)
+        self.assertEqual(solver.num_local, 3)
+
+    def test_Solve_AnalyticFailure_IsCached(self):
+        solver = WorkspacePathIKSolver(self.robot, TrajectoryMock(),
+                                       warm_start=False)
+
+        self.assertIsNone(solver.Solve(0.5, numpy.zeros(3)))
+        self.assertIsNone(solver.Solve(0.5, numpy.ones(3)))
+
+        self.assertEqual(self.manip.num_analytic_calls, 1)
+        self.assertEqual(solver.num_analytic, 1)
+        self.assertEqual(solver.num_cache_hits, 1)
+
+    def test_Solve_LocalFailure_FallsBackToAnalytic(self):
+        solver = WorkspacePathIKSolver(self.robot, TrajectoryMock())
+
+        # The local solver rejects colliding solutions. The analytic solver
+        # is trusted to have filtered them.
+        self.robot.env.colliding = True
+        self.manip.analytic_solution = numpy.array([ 0.5, 0.1, 0. ])
+
+        q = solver.Solve(0.5, numpy.zeros(3))
+        assert_allclose(q, self.manip.analytic_solution)
+        self.assertEqual(solver.num_local, 1)
+        self.assertEqual(solver.num_analytic, 1)
+
+        # The analytic solution is cached like a local one.
+        self.assertIs(solver.Solve(0.5, q), q)
+        self.assertEqual(self.manip.num_analytic_calls, 1)
+
+        # The robot's configuration is restored after every query.
+        assert_allclose(self.robot.q, numpy.zeros(3))
+
+if __name__ == '__main__':
+    unittest.main()